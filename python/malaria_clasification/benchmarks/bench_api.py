@@ -0,0 +1,127 @@
+#In-process load generator for POST /predict (no server, no network).
+#
+#Run from python/malaria_clasification:
+#   python benchmarks/bench_api.py --requests 200 --concurrency 1,8,32 --output api.json
+#   python benchmarks/bench_api.py --output new.json --baseline api.json
+#
+#The FastAPI app is driven through httpx's ASGI transport, so the numbers include
+#the whole request path (multipart parsing, worker pool, micro-batching,
+#Grad-CAM, images) but no socket overhead. The model gets random weights from
+#create_model() unless --weights is given. The result cache is disabled by
+#default because every request sends the same images (--cache to keep it).
+#Background PDFs are written to a temporary directory.
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import TEST_IMAGES, environment, latency_stats, peak_rss_mb, random_weights, write_report
+
+import httpx
+
+from processing.preprocess import IMAGE_EXTENSIONS
+
+
+async def _run_level(client, images, total, concurrency, query):
+    latencies, statuses = [], Counter()
+    stage_sums, stage_counts = defaultdict(float), Counter()
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            name, data = images[i % len(images)]
+            start = time.perf_counter()
+            response = await client.post(f"/predict{query}", files={"file": (name, data, "image/png")})
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                for stage, ms in response.json()["result"].get("timings_ms", {}).items():
+                    stage_sums[stage] += ms
+                    stage_counts[stage] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(statuses[200] / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": latency_stats(latencies),
+        "server_stage_mean_ms": {s: round(stage_sums[s] / stage_counts[s], 3) for s in sorted(stage_sums)},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def _bench(app, images, args, query):
+    report = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        # Warm-up: first forward, thread pools, lazily created schedulers
+        await _run_level(client, images, args.warmup, 1, query)
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            report[f"concurrency_{concurrency}"] = await _run_level(client, images, args.requests, concurrency, query)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /predict in process")
+    parser.add_argument("--images", default=TEST_IMAGES)
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--image-mode", default="inline", choices=("inline", "url", "none"))
+    parser.add_argument("--report", action="store_true", help="queue the background PDF of every request")
+    parser.add_argument("--detail", choices=("label", "probs", "cam", "images", "pdf"),
+                        help="response tier (default: the one implied by --image-mode / --report)")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache enabled")
+    parser.add_argument("--weights", help="trained weights (default: random init)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.images, f) for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app reads its configuration at import time
+        os.environ["MALARIA_MODEL_PATH"] = args.weights or random_weights(os.path.join(tmp, "random.pth"))
+        if not args.cache:
+            os.environ["MALARIA_CACHE"] = "0"
+        os.chdir(tmp)# reports/ of the background PDFs
+        try:
+            start = time.perf_counter()
+            from inference.main import app
+            import_s = time.perf_counter() - start
+
+            query = f"?images={args.image_mode}&report={'true' if args.report else 'false'}"
+            if args.detail:
+                query += f"&detail={args.detail}"
+            levels = asyncio.run(_bench(app, images, args, query))
+        finally:
+            os.chdir(cwd)
+
+    write_report({
+        "environment": environment(),
+        "images": len(images),
+        "query": query,
+        "cache": args.cache,
+        "app_import_s": round(import_s, 2),
+        "levels": levels,
+        "peak_rss_mb": peak_rss_mb(),
+    }, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#Micro-benchmarks of every stage of the prediction pipeline, offline.
+#
+#Run from python/malaria_clasification:
+#   python benchmarks/bench_pipeline.py --repeat 50 --output pipeline.json
+#   python benchmarks/bench_pipeline.py --output new.json --baseline pipeline.json
+#
+#Uses a randomly initialized create_model() (the latencies do not depend on the
+#weights) and the images in test_images/. PDFs are written to a temporary
+#directory. Reports p50/p95/p99 per function and the peak RSS of the process.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import TEST_IMAGES, environment, latency_stats, peak_rss_mb, write_report
+
+import numpy as np
+import torch
+
+from architecture.model_architecture import create_model
+from gradcam.gradcam_utils import generate_gradcam, predict_with_gradcam_batch
+from inference.pipeline import build_prediction_result, decode_stage
+from pdf.pdf_generator import build_report, create_simple_report
+from processing.image import heatmap_to_image, image_to_base64, overlay_heatmap
+from processing.preprocess import IMAGE_EXTENSIONS, preprocess_batch
+from processing.render import overlay_batch
+
+
+def _measure(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return latency_stats(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the prediction pipeline")
+    parser.add_argument("--images", default=TEST_IMAGES)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=8, help="batch size of the batched Grad-CAM case")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = create_model().eval()
+
+    paths = sorted(os.path.join(args.images, f) for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    with open(paths[0], "rb") as f:
+        image_bytes = f.read()
+
+    original, tensor, _ = decode_stage(image_bytes)
+    output, heatmap = predict_with_gradcam_batch(model, tensor)
+    heatmap = heatmap[0]
+    overlay = overlay_heatmap(original, heatmap)
+    result = dict(build_prediction_result(output), overlay=overlay)
+    batch = preprocess_batch([original] * args.batch)
+    _, batch_heatmaps = predict_with_gradcam_batch(model, batch)
+    batch_originals = np.stack([np.asarray(original)] * args.batch)
+
+    cases = {
+        "decode_preprocess": lambda: decode_stage(image_bytes),
+        "generate_gradcam": lambda: generate_gradcam(model, tensor),
+        f"gradcam_batch_{args.batch}": lambda: predict_with_gradcam_batch(model, batch),
+        "overlay_heatmap": lambda: overlay_heatmap(original, heatmap),
+        "heatmap_to_image": lambda: heatmap_to_image(heatmap),
+        f"overlay_batch_{args.batch}": lambda: overlay_batch(batch_originals, batch_heatmaps),
+        "image_to_base64": lambda: image_to_base64(overlay),
+        "build_report_in_memory": lambda: build_report(result, "image.png"),
+        "create_simple_report": lambda: create_simple_report(result, "image.png"),
+    }
+
+    report = {"environment": environment(), "image": os.path.basename(paths[0]), "repeat": args.repeat, "stages": {}}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # create_simple_report writes into ./reports
+        os.chdir(tmp)
+        try:
+            for name, fn in cases.items():
+                repeat = max(1, args.repeat // 5) if "gradcam" in name else args.repeat
+                report["stages"][name] = _measure(fn, repeat)
+        finally:
+            os.chdir(cwd)
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    write_report(report, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#Benchmark: torchvision Compose (PIL Resize -> ToTensor -> Normalize) vs processing/preprocess.py
+#
+#Run from python/malaria_clasification:
+#   python benchmarks/bench_preprocess.py --repeat 200 --batch 32
+#
+#Reports per-image latency (decode + preprocess, and preprocess only) and the
+#peak memory allocated per call as seen by tracemalloc (NumPy and PIL buffers
+#are tracked; torch tensors use their own allocator and are not counted).
+
+import argparse
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import TEST_IMAGES
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from processing.preprocess import MEAN, STD, decode_image, preprocess_batch, preprocess_image
+
+compose = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(MEAN, STD),
+])
+
+
+def _time_per_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p50_ms": round(samples[len(samples) // 2], 4),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 4),
+    }
+
+
+def _peak_alloc_kb(fn):
+    fn()# warm caches / thread-local buffers first
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", default=os.path.join(TEST_IMAGES, "*.png"))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        sys.exit(f"No images match {args.images}")
+    blobs = [open(p, "rb").read() for p in paths]
+    pil_images = [Image.open(io.BytesIO(b)).convert("RGB") for b in blobs]
+    batch_images = [pil_images[i % len(pil_images)] for i in range(args.batch)]
+    out = torch.empty((args.batch, 3, 224, 224))
+
+    cases = {
+        "compose_decode_preprocess": lambda: [compose(Image.open(io.BytesIO(b)).convert("RGB")) for b in blobs],
+        "fast_decode_preprocess": lambda: [preprocess_image(decode_image(b)) for b in blobs],
+        "compose_preprocess_only": lambda: [compose(im) for im in pil_images],
+        "fast_preprocess_only": lambda: [preprocess_image(im) for im in pil_images],
+    }
+    report = {"images": len(blobs), "batch": args.batch, "per_image": {}, "batch_of_n": {}}
+    for name, fn in cases.items():
+        timing = _time_per_call(fn, args.repeat)
+        report["per_image"][name] = {
+            **{k: round(v / len(blobs), 4) for k, v in timing.items()},
+            "peak_alloc_kb": round(_peak_alloc_kb(fn) / len(blobs), 1),
+        }
+
+    batch_cases = {
+        "compose_stack": lambda: torch.stack([compose(im) for im in batch_images]),
+        "fast_batch_preallocated": lambda: preprocess_batch(batch_images, out=out),
+    }
+    for name, fn in batch_cases.items():
+        timing = _time_per_call(fn, max(1, args.repeat // 10))
+        report["batch_of_n"][name] = {**timing, "peak_alloc_kb": _peak_alloc_kb(fn)}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
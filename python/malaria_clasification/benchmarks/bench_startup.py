@@ -0,0 +1,107 @@
+#Cold-start benchmark: how long until the server answers, and until it is ready.
+#
+#Run from python/malaria_clasification:
+#   python benchmarks/bench_startup.py --runs 3 --output startup.json
+#
+#For each mode (full = API + Gradio UI, api = MALARIA_UI=0) it starts a fresh
+#uvicorn process and measures, from the moment the process is spawned:
+#   import_s  time to import inference.main (in a separate interpreter)
+#   up_s      first 200 from /health (the process accepts requests)
+#   ready_s   first 200 from /ready (model loaded and warmed up)
+#The model gets random weights from create_model() unless --weights is given.
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import SRC, environment, random_weights, write_report
+
+MODES = {"full": {"MALARIA_UI": "1"}, "api": {"MALARIA_UI": "0"}}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def _import_time(env):
+    code = "import time; t = time.perf_counter(); import inference.main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], cwd=SRC, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _server_times(env, timeout):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "uvicorn", "inference.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    up = ready = None
+    try:
+        while time.perf_counter() - start < timeout and ready is None:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            if up is None and _status(f"{base}/health") == 200:
+                up = time.perf_counter() - start
+            if up is not None and _status(f"{base}/ready") == 200:
+                ready = time.perf_counter() - start
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return up, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the API")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--weights", help="trained weights (default: random init)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "runs": args.runs, "modes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = args.weights or random_weights(os.path.join(tmp, "random.pth"))
+        for mode in args.modes.split(","):
+            env = dict(os.environ, MALARIA_MODEL_PATH=weights, **MODES[mode])
+            samples = {"import_s": [], "up_s": [], "ready_s": []}
+            for _ in range(args.runs):
+                samples["import_s"].append(_import_time(env))
+                up, ready = _server_times(env, args.timeout)
+                samples["up_s"].append(up)
+                samples["ready_s"].append(ready)
+            report["modes"][mode] = {
+                name: round(statistics.median(values), 3) if None not in values else None
+                for name, values in samples.items()
+            }
+
+    write_report(report, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
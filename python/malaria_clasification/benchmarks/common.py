@@ -0,0 +1,100 @@
+#Shared helpers of the benchmark scripts (bench_pipeline.py, bench_api.py).
+#
+#Every report carries the git revision and machine details, so two JSON files
+#written on different commits can be compared with --baseline.
+
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+TEST_IMAGES = os.path.join(ROOT, "..", "..", "test_images")
+if SRC not in sys.path:
+    sys.path.append(SRC)
+
+
+def latency_stats(samples_ms):
+    """p50/p95/p99/mean/max de una lista de latencias en ms."""
+    samples = sorted(samples_ms)
+    if not samples:
+        return {}
+
+    def percentile(q):
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(percentile(0.50), 3),
+        "p95_ms": round(percentile(0.95), 3),
+        "p99_ms": round(percentile(0.99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def random_weights(path, seed=0):
+    """Guarda los pesos de un create_model() aleatorio (sin modelo entrenado) y devuelve la ruta."""
+    import torch
+    from architecture.model_architecture import create_model
+
+    torch.manual_seed(seed)
+    torch.save(create_model().state_dict(), path)
+    return path
+
+
+def environment():
+    import torch
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+METRIC_SUFFIXES = ("_ms", "_s", "_rps", "_mb")
+
+
+def _compare(current, baseline, key=""):
+    # Ratio current/baseline of every latency / throughput / memory value present in both reports
+    if isinstance(current, dict) and isinstance(baseline, dict):
+        diff = {k: _compare(v, baseline[k], k) for k, v in current.items() if k in baseline}
+        return {k: v for k, v in diff.items() if v is not None} or None
+    if key.endswith(METRIC_SUFFIXES) and isinstance(current, (int, float)) and isinstance(baseline, (int, float)):
+        return round(current / baseline, 3) if baseline else None
+    return None
+
+
+def write_report(report, output=None, baseline=None):
+    """Imprime el reporte JSON, lo guarda en output y, con baseline, añade los ratios actual/base."""
+    if baseline:
+        with open(baseline) as f:
+            base = json.load(f)
+        report["vs_baseline"] = {
+            "baseline_revision": base.get("environment", {}).get("git_revision"),
+            "ratio": _compare({k: v for k, v in report.items() if k != "environment"}, base),
+        }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
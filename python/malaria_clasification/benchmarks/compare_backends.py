@@ -0,0 +1,97 @@
+#Accuracy/latency comparison of the CPU backends against eager fp32.
+#
+#Run from python/malaria_clasification:
+#   python benchmarks/compare_backends.py --images /data/cells --weights models/malaria_detection_model.pth
+#
+#For every backend it reports how many predictions agree with eager fp32, the
+#largest probability difference, and the latency per batch size. Without
+#--weights a randomly initialized create_model() is used (latency only).
+#Exits with status 1 if a backend agrees with fp32 on less than --min-agreement.
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import TEST_IMAGES
+
+import torch
+
+from architecture.backends import BACKENDS, build_backend, load_calibration_batches
+from architecture.model_architecture import create_model, load_model
+
+
+def _latency_ms(forward, batch, repeat):
+    with torch.no_grad():
+        forward(batch)# warm-up
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            forward(batch)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(samples[len(samples) // 2], 3), "mean_ms": round(statistics.fmean(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends against eager fp32")
+    parser.add_argument("--images", default=TEST_IMAGES)
+    parser.add_argument("--weights", help="trained weights (default: random init)")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--max-images", type=int, default=512)
+    parser.add_argument("--calibration-images", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model(args.weights) if args.weights else create_model().eval()
+
+    batches = load_calibration_batches(args.images, args.max_images)
+    if not batches:
+        sys.exit(f"No images found in {args.images}")
+    images = torch.cat(batches)
+    calibration = load_calibration_batches(args.images, args.calibration_images)
+    with torch.no_grad():
+        reference = torch.softmax(model(images), dim=1)
+
+    report = {"images": images.shape[0], "threads": torch.get_num_threads(), "backends": {}}
+    failed = False
+    for name in args.backends.split(","):
+        try:
+            start = time.perf_counter()
+            forward = build_backend(name, model, calibration)
+            build_s = time.perf_counter() - start
+        except Exception as e:
+            report["backends"][name] = {"error": str(e)}
+            continue
+
+        with torch.no_grad():
+            probabilities = torch.softmax(forward(images), dim=1)
+        agreement = (probabilities.argmax(1) == reference.argmax(1)).float().mean().item()
+        failed |= agreement < args.min_agreement
+
+        latency = {}
+        for size in (int(s) for s in args.batch_sizes.split(",")):
+            batch = images[:size] if images.shape[0] >= size else images.repeat((size // images.shape[0]) + 1, 1, 1, 1)[:size]
+            latency[f"batch_{size}"] = _latency_ms(forward, batch, args.repeat)
+
+        report["backends"][name] = {
+            "agreement_with_fp32": round(agreement, 4),
+            "max_prob_diff": round((probabilities - reference).abs().max().item(), 5),
+            "build_s": round(build_s, 2),
+            "latency": latency,
+        }
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
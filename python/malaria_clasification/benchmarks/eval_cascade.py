@@ -0,0 +1,138 @@
+#Throughput gain vs agreement of the confidence-gated cascade (inference/cascade.py).
+#
+#Run from python/malaria_clasification, on a labeled folder (class from the
+#folder or file name: parasitized / infected / infectado vs uninfected /
+#no_infectado; other images only count for the agreement):
+#   python benchmarks/eval_cascade.py /data/cells --weights models/malaria_detection_model.pth
+#   python benchmarks/eval_cascade.py /data/cells --screen-sizes 96,112,160 --thresholds 0.8,0.9,0.95,0.99
+#   python benchmarks/eval_cascade.py /data/cells --screen-model models/screen.pt --screen-sizes 64
+#
+#For every screen size and threshold it runs the real cascade over the folder
+#and reports images/s against the full model alone, the share of images that
+#were escalated, how many predictions agree with the full model and, where the
+#label is known, the accuracy of both. Without --weights a random
+#create_model() is used: the throughput is meaningful, the agreement is not.
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import TEST_IMAGES, environment, random_weights, write_report
+
+import torch
+
+from architecture.model_architecture import load_model
+from inference.bulk_predict import find_images
+from inference.cascade import Cascade
+from processing.preprocess import decode_image, preprocess_batch
+
+#Checked in this order: "uninfected" contains "infected"
+_LABELS = ((re.compile(r"uninfected|no[_ -]?infectad"), 1), (re.compile(r"parasiti[sz]ed|infected|infectad"), 0))
+
+
+def label_of(path, root):
+    """0 = infectado, 1 = no infectado, None si ni la carpeta ni el nombre lo dicen."""
+    name = os.path.relpath(path, root).lower()
+    for pattern, label in _LABELS:
+        if pattern.search(name):
+            return label
+    return None
+
+
+def load_batches(root, batch_size, limit=None):
+    paths = find_images(root)[:limit]
+    batches, labels = [], []
+    for first in range(0, len(paths), batch_size):
+        chunk = paths[first:first + batch_size]
+        arrays = []
+        for path in chunk:
+            with open(path, "rb") as f:
+                arrays.append(decode_image(f.read()))
+        batches.append(preprocess_batch(arrays))
+        labels.extend(label_of(path, root) for path in chunk)
+    return batches, torch.tensor([-1 if label is None else label for label in labels])
+
+
+def timed(forward, batches, repeat):
+    """(predicciones [N], imágenes/s del mejor de repeat pasadas)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predictions = [forward(batch).argmax(1) for batch in batches]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    total = sum(batch.shape[0] for batch in batches)
+    return torch.cat(predictions), total / best
+
+
+def accuracy(predictions, labels):
+    known = labels >= 0
+    if not known.any():
+        return None
+    return round((predictions[known] == labels[known]).float().mean().item(), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and agreement of the confidence-gated cascade")
+    parser.add_argument("folder", nargs="?", default=TEST_IMAGES)
+    parser.add_argument("--weights", help="trained weights (default: random init, throughput only)")
+    parser.add_argument("--screen-model", help="TorchScript screen model (default: the full model at --screen-sizes)")
+    parser.add_argument("--screen-sizes", default="112")
+    parser.add_argument("--thresholds", default="0.8,0.9,0.95,0.99")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--limit", type=int, help="use only the first N images")
+    parser.add_argument("--repeat", type=int, default=3, help="passes per configuration (best one is kept)")
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = load_model(args.weights or random_weights(os.path.join(tmp, "random.pth")))
+    screen = torch.jit.load(args.screen_model, map_location="cpu").eval() if args.screen_model else model
+
+    batches, labels = load_batches(args.folder, args.batch_size, args.limit)
+    if not batches:
+        raise SystemExit(f"No images found in {args.folder}")
+
+    with torch.no_grad():
+        timed(model, batches[:1], 1)# warm-up
+        reference, full_rate = timed(model, batches, args.repeat)
+
+    configs = []
+    for size in (int(s) for s in args.screen_sizes.split(",")):
+        for threshold in (float(t) for t in args.thresholds.split(",")):
+            cascade = Cascade(screen, model, size, threshold)
+            timed(lambda batch: cascade(batch)[0], batches[:1], 1)
+            cascade.screened = cascade.escalated = 0
+            predictions, rate = timed(lambda batch: cascade(batch)[0], batches, args.repeat)
+            stats = cascade.snapshot()
+            configs.append({
+                "screen_size": size,
+                "threshold": threshold,
+                "escalation_rate": stats["escalation_rate"],
+                "images_per_sec_rps": round(rate, 2),
+                "speedup": round(rate / full_rate, 3),
+                "agreement_with_full": round((predictions == reference).float().mean().item(), 4),
+                "accuracy": accuracy(predictions, labels),
+            })
+
+    report = {
+        "environment": environment(),
+        "folder": os.path.abspath(args.folder),
+        "images": len(labels),
+        "labeled": int((labels >= 0).sum()),
+        "weights": args.weights or "random",
+        "screen_model": args.screen_model or "full model, reduced input",
+        "batch_size": args.batch_size,
+        "full_model": {"images_per_sec_rps": round(full_rate, 2), "accuracy": accuracy(reference, labels)},
+        "cascade": configs,
+    }
+    write_report(report, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import os
+import sys
+
 import torch
-from torchvision import transforms
 from PIL import Image
 
-from model_architecture import create_model
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from architecture.model_architecture import create_model
+from processing.preprocess import preprocess_image
 
 model = create_model()
 
@@ -16,18 +21,13 @@ model.load_state_dict(# It receives that dictionary of weights and assigns them
 
 model.eval()
 
-# Image transformations (same preprocessing as training)
-transformation = transforms.Compose([
-    transforms.Resize((224, 224)), # Change to the size used in your training
-    transforms.ToTensor(),# Scale values of [0, 255] to [0, 1].
-    transforms.Normalize([0.485, 0.456, 0.406],  # Si usaste normalización
-                         [0.229, 0.224, 0.225])
-])
+# Image transformations (same preprocessing as training): Resize 224 + ToTensor + Normalize,
+# shared with the API in src/processing/preprocess.py
 
 # inference
 def predict_image(image_path, model):
     image = Image.open(image_path).convert("RGB")# upload image
-    tensor_imagen = transformation(image).unsqueeze(0) #the transformation is applied and a dimension called batch is added at the beginning. 
+    tensor_imagen = preprocess_image(image) #the transformation is applied, the result already has the batch dimension at the beginning. 
     
 #Disables gradient calculation, saving memory and speeding up prediction, because we don't need backpropagation.
     with torch.no_grad():
@@ -0,0 +1,119 @@
+#CPU execution backends for the (no-grad) prediction path.
+#
+#   eager        the fp32 torchvision ResNet18 from create_model (reference)
+#   torchscript  traced + frozen + optimize_for_inference (fuses conv/bn, no Python overhead)
+#   int8         static post-training quantization (FX graph mode), calibrated on sample images
+#   int8-dynamic dynamic quantization (only the final Linear is quantized; no calibration needed)
+#   onnx         ONNX Runtime session (optional, needs onnx + onnxruntime)
+#
+#Grad-CAM needs autograd, so explanations always use the eager fp32 model; the
+#backend only replaces the plain forward of label-only predictions and batch jobs.
+#benchmarks/compare_backends.py checks each backend against eager fp32.
+
+import copy
+import inspect
+import io
+import logging
+import os
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "int8", "int8-dynamic", "onnx")
+
+
+def build_backend(name, model, calibration_batches=None, image_size=224):
+    """
+    Devuelve un callable batch [B,3,H,W] -> logits [B,num_classes] para el backend pedido.
+
+    calibration_batches: iterable de tensores normalizados, obligatorio para "int8".
+    """
+    model = model.eval()
+    example = torch.zeros(1, 3, image_size, image_size)
+
+    if name == "eager":
+        return model
+    if name == "torchscript":
+        return _torchscript(model, example)
+    if name == "int8":
+        if not calibration_batches:
+            raise ValueError("The int8 backend needs calibration images (MALARIA_CALIBRATION_DIR)")
+        return _static_int8(model, example, calibration_batches)
+    if name == "int8-dynamic":
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8)
+    if name == "onnx":
+        return OnnxRuntimeModel(model, example)
+    raise ValueError(f"Unknown backend: {name!r} (choose from {', '.join(BACKENDS)})")
+
+
+def _torchscript(model, example):
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.freeze(traced)
+        return torch.jit.optimize_for_inference(frozen)
+
+
+def _static_int8(model, example, calibration_batches):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        # Observers record activation ranges on real images
+        for batch in calibration_batches:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+class OnnxRuntimeModel:
+    """Exporta el modelo a ONNX en memoria y lo ejecuta con ONNX Runtime."""
+
+    def __init__(self, model, example, threads=0):
+        import onnxruntime as ort
+
+        buffer = io.BytesIO()
+        # Newer torch defaults to the dynamo exporter; the torch 2.0 of the Docker image has no such argument
+        legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(
+                model, example, buffer,
+                input_names=["input"], output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                **legacy,
+            )
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        self.session = ort.InferenceSession(buffer.getvalue(), options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, batch):
+        logits = self.session.run(["logits"], {"input": batch.detach().contiguous().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+def load_calibration_batches(directory, max_images=64, batch_size=16):
+    """Lee hasta max_images imágenes de un directorio y las devuelve preprocesadas en batches."""
+    from processing.preprocess import IMAGE_EXTENSIONS, decode_image, preprocess_batch
+
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(IMAGE_EXTENSIONS))
+    paths = sorted(paths)[:max_images]
+
+    batches = []
+    for start in range(0, len(paths), batch_size):
+        arrays = []
+        for path in paths[start:start + batch_size]:
+            try:
+                with open(path, "rb") as f:
+                    arrays.append(decode_image(f.read()))
+            except Exception as e:
+                logger.warning("Skipping %s: %s", path, e)
+        if arrays:
+            batches.append(preprocess_batch(arrays))
+    return batches
@@ -11,3 +11,18 @@ def create_model(num_classes=2):
     model.fc = nn.Linear(num_ftrs, num_classes)
     
     return model
+
+#create_model + trained weights, ready for inference
+def load_model(weights_path, num_classes=2):
+    model = create_model(num_classes)
+    model.load_state_dict(torch.load(weights_path, map_location=torch.device("cpu")))
+    model.eval()
+    return model
+
+#Penultimate layer: the 512-d vector the ResNet18 feeds to model.fc.
+#model.fc(forward_features(model, x)) gives the same logits as model(x), so one
+#pass returns both the embedding and the prediction
+def forward_features(model, x):
+    x = model.maxpool(model.relu(model.bn1(model.conv1(x))))
+    x = model.layer4(model.layer3(model.layer2(model.layer1(x))))
+    return torch.flatten(model.avgpool(x), 1)
@@ -0,0 +1,173 @@
+#Result cache for repeated images.
+#
+#Operators often resubmit the same crop; the key is a hash of the uploaded
+#bytes plus the model version, so a resubmission skips the forward pass,
+#Grad-CAM, the PNG encodes and the PDF. Entries live in an in-memory LRU
+#(bounded by count and approximate size, with a TTL) and optionally in a disk
+#tier that survives restarts and is shared by the server workers.
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+
+    def __init__(self, max_entries=512, max_bytes=256 * 1024 * 1024, ttl_seconds=3600,
+                 disk_dir=None, model_version=""):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.model_version = model_version
+
+        self._entries = OrderedDict()# key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()# used from the event loop, the worker pool and Gradio threads
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def key(self, *parts):
+        """Hash de los bytes de la imagen (y cualquier otra parte) + versión del modelo."""
+        digest = hashlib.sha256(self.model_version.encode())
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else str(part).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Devuelve una copia del resultado guardado, o None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[2])
+                self._remove(key)
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._memory_put(key, value)
+        return dict(value)
+
+    def put(self, key, value):
+        value = dict(value)
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def _memory_put(self, key, value):
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            # LRU eviction by number of entries and by (approximate) size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pkl")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write + rename so other workers never read a half written file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Error writing cache entry: %s", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_dir": self.disk_dir,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "model_version": self.model_version,
+            }
+
+
+def _approx_size(value):
+    # The images (base64 strings or PIL objects) dominate the size of a result
+    size = 0
+    for v in value.values():
+        if isinstance(v, (str, bytes)):
+            size += len(v)
+        elif hasattr(v, "size") and hasattr(v, "mode"):
+            size += v.size[0] * v.size[1] * len(v.getbands())
+        else:
+            size += 64
+    return size
+
+
+def file_version(path, length=12):
+    """
+    Versión de un archivo de pesos: hash de su ruta, tamaño y fecha de modificación.
+
+    Un stat en lugar de leer los 44 MB al arrancar; cualquier archivo de pesos nuevo
+    cambia la versión. None si el archivo no existe.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    identity = f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:length]
@@ -1,71 +1,103 @@
 #Grad-CAM utilities for explainable AI in malaria detection
 
+import threading
+from contextlib import nullcontext
+
 import torch
 import torch.nn.functional as F
-import numpy as np
 
 #Generate Grad-CAM to visualize which parts of the image are important
 #image_tensor [1,C,H,W]
 def generate_gradcam(model, image_tensor, target_class=None):
+    _, cam = predict_with_gradcam(model, image_tensor, target_class)
+    return cam
+
+#Prediction and Grad-CAM from ONE hooked forward pass (plus its backward)
+#Returns (logits [1,num_classes] without grad, cam numpy [h,w])
+def predict_with_gradcam(model, image_tensor, target_class=None):
+    target_classes = None if target_class is None else [target_class]
+    output, cams = predict_with_gradcam_batch(model, image_tensor, target_classes)
+    return output, cams[0]
+
+#Batched Grad-CAM: image_tensor [B,C,H,W] -> cams numpy [B,h,w]
+def generate_gradcam_batch(model, image_tensor, target_classes=None):
+    _, cams = predict_with_gradcam_batch(model, image_tensor, target_classes)
+    return cams
+
+#One forward and one backward for the whole batch.
+#target_classes: one class per sample (None = predicted class of each sample)
+#Returns (logits [B,num_classes] without grad, cams numpy [B,h,w] normalized per sample)
+#timer: optional StageTimer (inference/timing.py), gets "forward" and "gradcam"
+def predict_with_gradcam_batch(model, image_tensor, target_classes=None, timer=None):
     target_layer = _find_target_layer(model)#  Find the last convolutional layer
-    
+
     if target_layer is None:
-        return _create_simple_gradient_map(model, image_tensor, target_class)
-    
-    gradients = []
+        return _create_simple_gradient_map(model, image_tensor, target_classes)
+
+    def stage(name):
+        return timer.stage(name) if timer is not None else nullcontext()
+
     activations = []
-    
-    def backward_hook(module, grad_input, grad_output):
-        gradients.append(grad_output[0])
-    
+    owner = threading.get_ident()
+
     def forward_hook(module, input, output):
-        activations.append(output)
-    
-    # Registrar hooks
-    backward_handle = target_layer.register_backward_hook(backward_hook)
+        # The model is shared between threads (API + Gradio): only keep our own pass
+        if threading.get_ident() == owner:
+            activations.append(output)
+
+    # Registrar hook
     forward_handle = target_layer.register_forward_hook(forward_hook)
-    
+
     try:
-        # Forward pass
-        model.zero_grad()
-        output = model(image_tensor)
-        
-        # Usar clase predicha si no se especifica
-        if target_class is None:
-            target_class = output.argmax(dim=1).item()
-        
-        # Backward pass
-        output[0, target_class].backward()
-        
-        # Obtener gradientes y activaciones
-        gradients_tensor = gradients[0]
-        activations_tensor = activations[0]
-        
-        # Calcular pesos (promedio global de gradientes)
-        weights = torch.mean(gradients_tensor, dim=(2, 3))
-        
-        # Generar CAM
-        cam = torch.zeros(activations_tensor.shape[2:], dtype=torch.float32)
-        for i in range(len(weights[0])):
-            cam += weights[0, i] * activations_tensor[0, i, :, :]
-        
-        # Aplicar ReLU y normalizar
-        cam = F.relu(cam)
-        cam = _normalize_cam(cam)
-        
-        return cam.detach().numpy()
-        
+        # Forward pass (con gradientes, es el único forward de la petición)
+        with torch.enable_grad():
+            with stage("forward"):
+                output = model(image_tensor)
+            selected = _select_logits(output, target_classes)
+
+        with stage("gradcam"):
+            with torch.enable_grad():
+                # Backward pass solo hasta las activaciones: no se calculan
+                # gradientes de los pesos del modelo. En modo eval las muestras
+                # son independientes, así que el gradiente de la suma da el
+                # gradiente de cada muestra respecto a sus propias activaciones.
+                gradients_tensor = torch.autograd.grad(selected.sum(), activations[0])[0]
+
+            activations_tensor = activations[0].detach()
+
+            # Calcular pesos (promedio global de gradientes) [B,C]
+            weights = torch.mean(gradients_tensor, dim=(2, 3))
+
+            # Generar CAM: suma ponderada de los canales en una sola operación [B,h,w]
+            cams = torch.einsum("bc,bchw->bhw", weights, activations_tensor)
+
+            # Aplicar ReLU y normalizar
+            cams = F.relu(cams)
+            cams = _normalize_cam(cams)
+
+        return output.detach(), cams.numpy()
+
     finally:
         # Limpiar hooks
-        backward_handle.remove()
         forward_handle.remove()
 
+def _select_logits(output, target_classes):
+    """
+    Logit de la clase objetivo de cada muestra [B]
+    """
+    if target_classes is None:
+        # Usar clase predicha si no se especifica
+        index = output.argmax(dim=1)
+    else:
+        index = torch.as_tensor(target_classes, dtype=torch.long, device=output.device).reshape(-1)
+    return output.gather(1, index.unsqueeze(1)).squeeze(1)
+
 def _find_target_layer(model):
     """
     Encuentra la última capa convolucional del modelo
     """
     target_layer = None
-    
+
     # Buscar por diferentes arquitecturas comunes
     if hasattr(model, 'features'):
         # VGG-style
@@ -78,40 +110,42 @@ def _find_target_layer(model):
         for name, module in model.named_modules():
             if isinstance(module, torch.nn.Conv2d):
                 target_layer = module
-    
+
     return target_layer
 
-def _create_simple_gradient_map(model, image_tensor, target_class=None):
+def _create_simple_gradient_map(model, image_tensor, target_classes=None):
     """
     Método fallback usando gradientes de entrada
     """
-    image_tensor.requires_grad_(True)
-    
-    # Forward pass
-    output = model(image_tensor)
-    if target_class is None:
-        target_class = output.argmax(dim=1).item()
-    
-    # Backward pass
-    model.zero_grad()
-    output[0, target_class].backward()
-    
+    image_tensor = image_tensor.detach().requires_grad_(True)
+
+    with torch.enable_grad():
+        # Forward pass
+        output = model(image_tensor)
+        selected = _select_logits(output, target_classes)
+
+        # Backward pass
+        gradients = torch.autograd.grad(selected.sum(), image_tensor)[0]
+
     # Obtener gradientes respecto a la entrada
-    gradients = image_tensor.grad.data.abs()
-    
+    gradients = gradients.abs()
+
     # Tomar máximo a través de canales de color
-    cam = torch.max(gradients[0], dim=0)[0]
-    
+    cams = torch.amax(gradients, dim=1)
+
     # Normalizar
-    cam = _normalize_cam(cam)
-    
-    return cam.numpy()
+    cams = _normalize_cam(cams)
+
+    return output.detach(), cams.numpy()
 
 def _normalize_cam(cam):
     """
-    Normaliza el CAM a rango [0, 1]
+    Normaliza el CAM a rango [0, 1] (cada muestra por separado si es [B,h,w])
     """
-    cam = cam - cam.min()
-    if cam.max() > 0:
-        cam = cam / cam.max()
-    return cam
\ No newline at end of file
+    if cam.dim() == 2:
+        return _normalize_cam(cam.unsqueeze(0))[0]
+
+    flat = cam.flatten(1)
+    cam = cam - flat.min(dim=1).values[:, None, None]
+    peak = cam.flatten(1).max(dim=1).values[:, None, None]
+    return torch.where(peak > 0, cam / peak.clamp_min(1e-12), cam)
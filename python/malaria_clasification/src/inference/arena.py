@@ -0,0 +1,87 @@
+#Reusable input batches for the forward passes.
+#
+#Every micro-batch used to torch.cat the request tensors into a fresh
+#[B,3,224,224] float32 tensor (600 KB per image) and every /predict/batch chunk
+#allocated its own. Blocks this large are usually mmap'ed and handed back to
+#the OS when freed, so a batch could page-fault on memory the previous one had
+#just released. The arena keeps a few buffers per size bucket and hands out
+#views of them.
+
+import threading
+from contextlib import contextmanager
+
+import torch
+
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class TensorArena:
+    """Buffers float32 [bucket,3,H,W] reutilizables; un buffer prestado no se comparte hasta devolverlo."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, item_shape=(3, 224, 224), per_bucket=2):
+        self.buckets = tuple(sorted(set(buckets)))
+        self.item_shape = tuple(item_shape)
+        self.per_bucket = per_bucket
+        self._free = {size: [] for size in self.buckets}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.oversize = 0
+
+    def _bucket(self, count):
+        for size in self.buckets:
+            if size >= count:
+                return size
+        return None
+
+    def acquire(self, count):
+        """Devuelve un tensor [bucket,...] con bucket >= count (o uno nuevo de [count,...] si no hay bucket)."""
+        size = self._bucket(count)
+        if size is None:
+            self.oversize += 1
+            return torch.empty((count, *self.item_shape), dtype=torch.float32)
+        with self._lock:
+            if self._free[size]:
+                self.hits += 1
+                return self._free[size].pop()
+            self.misses += 1
+        return torch.empty((size, *self.item_shape), dtype=torch.float32)
+
+    def release(self, buffer):
+        size = buffer.shape[0]
+        with self._lock:
+            free = self._free.get(size)
+            if free is not None and len(free) < self.per_bucket and all(b is not buffer for b in free):
+                free.append(buffer)
+
+    @contextmanager
+    def borrow(self, count):
+        """with arena.borrow(n) as out: ... -> out es una vista [n,...] de un buffer del pool."""
+        buffer = self.acquire(count)
+        try:
+            yield buffer[:count]
+        finally:
+            self.release(buffer)
+
+    def preallocate(self, sizes):
+        """Reserva (y toca) un buffer por tamaño para que el primer batch real no lo haga."""
+        for size in sizes:
+            bucket = self._bucket(size)
+            if bucket is not None:
+                buffer = self.acquire(bucket)
+                buffer.zero_()
+                self.release(buffer)
+
+    def snapshot(self):
+        with self._lock:
+            pooled = {size: len(free) for size, free in self._free.items() if free}
+        item_bytes = 4
+        for dim in self.item_shape:
+            item_bytes *= dim
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "oversize": self.oversize,
+            "pooled_buffers": pooled,
+            "pooled_mb": round(sum(size * count for size, count in pooled.items()) * item_bytes / 2**20, 1),
+        }
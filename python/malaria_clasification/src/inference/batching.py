@@ -0,0 +1,157 @@
+#Dynamic micro-batching for the inference endpoints.
+#
+#Concurrent requests put their already preprocessed tensor in a queue. A single
+#background task collects them until MAX_BATCH_SIZE images are waiting or the
+#oldest one has waited MAX_BATCH_WAIT_MS, runs ONE batched forward pass and
+#gives each request back its own row of the output.
+#
+#The queue is bounded like the worker pool (inference/workers.py): once
+#max_queue images are waiting, submit() raises PoolFullError (429) instead of
+#letting the backlog in front of the model grow without limit.
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from inference.workers import PoolFullError
+
+
+class BatchScheduler:
+    """
+    Agrupa tensores [1,C,H,W] (o [C,H,W]) de distintas peticiones en un batch.
+
+    run_batch recibe el tensor apilado [B,C,H,W] y devuelve algo indexable
+    por muestra (un tensor [B,...] o una lista de longitud B).
+    arena: TensorArena opcional (inference/arena.py) donde se apila el batch.
+    max_queue: imágenes en espera antes de rechazar con PoolFullError (0 = sin límite).
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, name="predict", arena=None, max_queue=0):
+        self.run_batch = run_batch
+        self.arena = arena
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue = max(0, int(max_queue))
+        self.name = name
+
+        # The forward runs in its own thread so the event loop keeps accepting requests
+        # (and filling the next batch) while the current one is being computed.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batch-{name}")
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+        self.stats = {
+            "batches": 0,
+            "items": 0,
+            "avg_batch_size": 0.0,
+            "batch_size_counts": {},
+            "flush_full": 0,# flushed because the batch was full
+            "flush_timeout": 0,# flushed because max_wait_ms expired
+            "last_batch_ms": 0.0,
+            "total_batch_ms": 0.0,
+            "last_queue_wait_ms": 0.0,
+            "errors": 0,
+            "rejected": 0,# submits refused because max_queue images were already waiting
+        }
+
+    def _ensure_started(self):
+        # The queue is bound to the running event loop, so it is created lazily on the
+        # first request (this also keeps the scheduler fork-safe: nothing starts at import).
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._loop is not loop or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = loop.create_task(self._collect_loop())
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, tensor):
+        """Encola un tensor y espera el resultado de su fila en el batch."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((tensor, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise PoolFullError(f"Batch queue '{self.name}' is full ({self.max_queue} images)")
+        return await future
+
+    async def _collect_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                # Take whatever is already waiting without yielding
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            if len(batch) >= self.max_batch_size:
+                self.stats["flush_full"] += 1
+            else:
+                self.stats["flush_timeout"] += 1
+
+            await self._run(batch)
+
+    async def _run(self, batch):
+        # Requests whose client went away are dropped before doing any work
+        batch = [item for item in batch if not item[1].cancelled()]
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        rows = [t if t.dim() == 4 else t.unsqueeze(0) for t, _, _ in batch]
+        buffer = self.arena.acquire(len(rows)) if self.arena is not None else None
+        try:
+            stacked = torch.cat(rows) if buffer is None else torch.cat(rows, out=buffer[:len(rows)])
+            outputs = await self._loop.run_in_executor(self._executor, self.run_batch, stacked)
+        except Exception as e:
+            self.stats["errors"] += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            # run_batch has returned: nothing refers to the stacked input any more
+            if buffer is not None:
+                self.arena.release(buffer)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for i, (_, future, _) in enumerate(batch):
+            if not future.done():
+                future.set_result(outputs[i])
+
+        self._record(len(batch), elapsed_ms, (start - batch[0][2]) * 1000)
+
+    def _record(self, size, elapsed_ms, queue_wait_ms):
+        stats = self.stats
+        stats["batches"] += 1
+        stats["items"] += size
+        stats["avg_batch_size"] = round(stats["items"] / stats["batches"], 2)
+        stats["batch_size_counts"][size] = stats["batch_size_counts"].get(size, 0) + 1
+        stats["last_batch_ms"] = round(elapsed_ms, 2)
+        stats["total_batch_ms"] = round(stats["total_batch_ms"] + elapsed_ms, 2)
+        stats["last_queue_wait_ms"] = round(queue_wait_ms, 2)
+
+    def snapshot(self):
+        """Copia de las métricas para /health."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queue_depth(),
+            **self.stats,
+            "batch_size_counts": dict(self.stats["batch_size_counts"]),
+        }
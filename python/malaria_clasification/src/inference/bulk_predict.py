@@ -0,0 +1,234 @@
+#Offline bulk inference over a directory tree (no HTTP server involved).
+#
+#Images are decoded and resized to 224x224 uint8 in DataLoader worker
+#processes, normalized in the main process in one op per batch, and classified
+#with batched no_grad forward passes. Results are appended to a CSV after every
+#batch, so an interrupted run continues where it stopped with --resume.
+#
+#Run from src/:
+#   python -m inference.bulk_predict /data/slides --output preds.csv --workers 4 --batch-size 64
+#   python -m inference.bulk_predict /data/slides --output preds.parquet --resume
+#   python -m inference.bulk_predict /data/reviewed --index embeddings/   (also fill the /similar index)
+
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from architecture.model_architecture import forward_features, load_model
+from architecture.backends import BACKENDS, build_backend, load_calibration_batches
+from inference import config
+from processing.preprocess import IMAGE_EXTENSIONS, decode_image, normalize_uint8_batch, resize_uint8
+from similarity.embedding_index import EmbeddingIndex
+
+COLUMNS = ["path", "prediction", "class_id", "confidence", "prob_infected", "prob_uninfected", "error"]
+
+
+def find_images(root):
+    """Todas las imágenes bajo root, en orden estable."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return paths
+
+
+class ImageFolderDataset(Dataset):
+    """Lee y redimensiona una imagen; devuelve (índice, tensor uint8 [3,224,224] o None, error)."""
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            with open(self.paths[index], "rb") as f:
+                array = decode_image(f.read())
+            # A fresh array (not the thread-local buffer) because it leaves the worker
+            resized = resize_uint8(array, out=np.empty((224, 224, 3), dtype=np.uint8))
+            return index, torch.from_numpy(resized).permute(2, 0, 1), None
+        except Exception as e:
+            return index, None, str(e)
+
+
+def _collate(items):
+    ok = [(i, t) for i, t, _ in items if t is not None]
+    failed = [(i, e) for i, t, e in items if t is None]
+    indices = [i for i, _ in ok]
+    batch = torch.stack([t for _, t in ok]) if ok else None# uint8: 4x less IPC than float
+    return indices, batch, failed
+
+
+def _read_done(path):
+    """Rutas ya procesadas en una ejecución anterior (CSV o Parquet)."""
+    if not os.path.exists(path):
+        return set()
+    if path.endswith(".parquet"):
+        import pandas as pd
+        return set(pd.read_parquet(path, columns=["path"])["path"])
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["path"] for row in csv.DictReader(f)}
+
+
+def run(input_dir, output, weights, batch_size=64, workers=2, threads=0, resume=False, report_path=None,
+        backend="eager", calibration_dir="", index_dir=None):
+    parquet = output.endswith(".parquet")
+    # Parquet cannot be appended to: stream into a CSV checkpoint and convert at the end
+    csv_path = output + ".partial.csv" if parquet else output
+
+    paths = find_images(input_dir)
+    done = set()
+    if resume:
+        done = _read_done(csv_path) | (_read_done(output) if parquet else set())
+    pending = [p for p in paths if p not in done]
+    print(f"{len(paths)} images found, {len(done)} already done, {len(pending)} to process")
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    model = build_backend(
+        backend,
+        load_model(weights),
+        load_calibration_batches(calibration_dir or input_dir, config.CALIBRATION_IMAGES) if backend == "int8" else None,
+    )
+    # The embeddings come out of the same eager forward as the logits
+    embedding_index = EmbeddingIndex(index_dir) if index_dir else None
+
+    loader = DataLoader(
+        ImageFolderDataset(pending),
+        batch_size=batch_size,
+        num_workers=workers,
+        collate_fn=_collate,
+        prefetch_factor=4 if workers > 0 else None,
+        persistent_workers=False,
+    )
+
+    append = resume and os.path.exists(csv_path)
+    out_buffer = torch.empty((batch_size, 3, 224, 224), dtype=torch.float32)
+    processed = errors = 0
+    wait_time = forward_time = 0.0
+    start = time.perf_counter()
+    last = start
+
+    with open(csv_path, "a" if append else "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if not append:
+            writer.writeheader()
+
+        for indices, batch, failed in loader:
+            now = time.perf_counter()
+            wait_time += now - last
+
+            for index, error in failed:
+                writer.writerow({"path": pending[index], "error": error})
+                errors += 1
+
+            if batch is not None:
+                with torch.no_grad():
+                    normalized = normalize_uint8_batch(batch, out=out_buffer)
+                    if embedding_index is not None:
+                        features = forward_features(model, normalized)
+                        logits = model.fc(features)
+                    else:
+                        logits = model(normalized)
+                    probabilities = torch.softmax(logits, dim=1)
+                confidences, predictions = probabilities.max(dim=1)
+                if embedding_index is not None:
+                    embedding_index.add(
+                        features.numpy(),
+                        filenames=[pending[i] for i in indices],
+                        predictions=["Infectado" if p == 0 else "No infectado" for p in predictions.tolist()],
+                        confidences=[round(c * 100, 2) for c in confidences.tolist()],
+                    )
+                for index, prediction, confidence, probs in zip(
+                        indices, predictions.tolist(), confidences.tolist(), probabilities.tolist()):
+                    writer.writerow({
+                        "path": pending[index],
+                        "prediction": "Infectado" if prediction == 0 else "No infectado",
+                        "class_id": prediction,
+                        "confidence": round(confidence * 100, 2),
+                        "prob_infected": round(probs[0], 6),
+                        "prob_uninfected": round(probs[1], 6),
+                        "error": "",
+                    })
+                processed += len(indices)
+
+            f.flush()# a crash loses at most the batch in flight
+            last = time.perf_counter()
+            forward_time += last - now
+            print(f"\r{processed + errors}/{len(pending)} images", end="", flush=True)
+
+    elapsed = time.perf_counter() - start
+    print()
+
+    if parquet:
+        import pandas as pd
+        frames = [pd.read_csv(csv_path, keep_default_na=False)]
+        if resume and os.path.exists(output):
+            frames.insert(0, pd.read_parquet(output))
+        pd.concat(frames, ignore_index=True).to_parquet(output, index=False)
+        os.remove(csv_path)
+
+    report = {
+        "images": processed,
+        "errors": errors,
+        "skipped_resume": len(done),
+        "elapsed_s": round(elapsed, 3),
+        "images_per_sec": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        "waiting_for_decode_s": round(wait_time, 3),
+        "forward_s": round(forward_time, 3),
+        "batch_size": batch_size,
+        "workers": workers,
+        "torch_threads": torch.get_num_threads(),
+        "backend": backend,
+        "indexed": len(embedding_index) if embedding_index is not None else None,
+    }
+    print(json.dumps(report, indent=2))
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every image under a directory")
+    parser.add_argument("input_dir")
+    parser.add_argument("--output", default="predictions.csv", help=".csv or .parquet")
+    parser.add_argument("--weights", default=config.MODEL_PATH)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="decode processes (0 = decode in the main process)")
+    parser.add_argument("--threads", type=int, default=config.TORCH_THREADS, help="torch intra-op threads")
+    parser.add_argument("--resume", action="store_true", help="skip images already in the output")
+    parser.add_argument("--backend", default=config.BACKEND, choices=BACKENDS)
+    parser.add_argument("--calibration-dir", default=config.CALIBRATION_DIR,
+                        help="images to calibrate the int8 backend (default: the input directory)")
+    parser.add_argument("--report", help="also write the throughput report to this JSON file")
+    parser.add_argument("--index", help="also add the 512-d embeddings to this index directory (eager backend only)")
+    args = parser.parse_args()
+    # pandas writes Parquet through pyarrow or fastparquet, neither in requirements.txt:
+    # fail now rather than after the whole directory has been classified
+    if args.output.endswith(".parquet") and not any(
+            importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")):
+        parser.error("--output .parquet needs pyarrow (pip install pyarrow); use a .csv output otherwise")
+    if args.index and args.backend != "eager":
+        parser.error("--index needs --backend eager (the other backends only return the logits)")
+
+    run(args.input_dir, args.output, args.weights, args.batch_size, args.workers,
+        args.threads, args.resume, args.report, args.backend, args.calibration_dir, args.index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#Confidence-gated cascade for the no-grad forwards.
+#
+#Most cells of a smear are clearly uninfected. The cascade first runs a cheap
+#screen: by default the same network on a 112x112 version of the batch (the
+#ResNet18 ends in an adaptive pool, so it accepts any input size; 1/4 of the
+#pixels is roughly 1/4 of the FLOPs), or a separate small TorchScript model.
+#Only the images whose screen confidence (max softmax, as in
+#build_prediction_result) is below the threshold go through the full 224x224
+#model. How much agreement a threshold costs is measured with
+#benchmarks/eval_cascade.py on a labeled folder before turning it on.
+
+import threading
+
+import torch
+import torch.nn.functional as F
+
+
+class Cascade:
+    """
+    screen: callable [B,3,s,s] -> logits (el modelo barato); full: callable [B,3,224,224] -> logits.
+
+    threshold: confianza mínima (0-1) del screen para aceptar su predicción.
+    """
+
+    def __init__(self, screen, full, screen_size=112, threshold=0.9):
+        self.screen = screen
+        self.full = full
+        self.screen_size = screen_size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.escalated = 0
+
+    def downsample(self, batch):
+        """[B,3,H,W] normalizado -> [B,3,s,s] (media de bloques si H es múltiplo de s)."""
+        size = batch.shape[-1]
+        if size == self.screen_size:
+            return batch
+        if size % self.screen_size == 0:
+            # Same result as an antialiased resize for integer factors, and cheaper
+            return F.avg_pool2d(batch, size // self.screen_size)
+        return F.interpolate(batch, size=(self.screen_size, self.screen_size), mode="bilinear",
+                             align_corners=False, antialias=True)
+
+    def screen_batch(self, batch):
+        """Solo el screen: (logits [B,2], escalate bool [B]) con escalate = confianza < threshold."""
+        with torch.no_grad():
+            logits = self.screen(self.downsample(batch))
+        confidence = torch.softmax(logits, dim=1).max(dim=1).values
+        escalate = confidence < self.threshold
+        with self._lock:
+            self.screened += batch.shape[0]
+            self.escalated += int(escalate.sum())
+        return logits, escalate
+
+    def __call__(self, batch):
+        """Screen + modelo completo para las dudosas: (logits [B,2], escalated bool [B])."""
+        logits, escalate = self.screen_batch(batch)
+        if escalate.any():
+            rows = escalate.nonzero().flatten()
+            with torch.no_grad():
+                logits[rows] = self.full(batch[rows])
+        return logits, escalate
+
+    def snapshot(self):
+        with self._lock:
+            screened, escalated = self.screened, self.escalated
+        return {
+            "screen_size": self.screen_size,
+            "threshold": self.threshold,
+            "screened": screened,
+            "escalated": escalated,
+            "escalation_rate": round(escalated / screened, 4) if screened else 0.0,
+        }
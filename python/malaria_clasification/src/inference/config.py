@@ -0,0 +1,135 @@
+# Runtime configuration for the inference server.
+# Every value can be overridden with an environment variable, so the same
+# Docker image can be tuned per node (docker run -e MALARIA_MAX_BATCH_SIZE=16 ...).
+
+import os
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+# Model weights: MALARIA_MODEL_PATH, else the Docker location, else python/malaria_clasification/models/
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if os.environ.get("MALARIA_MODEL_PATH"):
+    MODEL_PATH = os.environ["MALARIA_MODEL_PATH"]
+elif os.path.exists("/app/models/malaria_detection_model.pth"):
+    MODEL_PATH = "/app/models/malaria_detection_model.pth"
+else:
+    MODEL_PATH = os.path.join(_BASE_DIR, "..", "..", "models", "malaria_detection_model.pth")
+
+# Execution backend of the no-grad forwards (see architecture/backends.py); Grad-CAM always uses eager fp32
+BACKEND = os.environ.get("MALARIA_BACKEND", "eager")# eager | torchscript | int8 | int8-dynamic | onnx
+CALIBRATION_DIR = os.environ.get("MALARIA_CALIBRATION_DIR", "")# sample images for the int8 backend
+CALIBRATION_IMAGES = _env_int("MALARIA_CALIBRATION_IMAGES", 64)
+
+# Micro-batching of /predict requests (see inference/batching.py)
+BATCHING_ENABLED = _env_bool("MALARIA_BATCHING", True)
+MAX_BATCH_SIZE = _env_int("MALARIA_MAX_BATCH_SIZE", 8)# flush as soon as this many images are queued
+MAX_BATCH_WAIT_MS = _env_float("MALARIA_MAX_BATCH_WAIT_MS", 5.0)# ...or when the oldest one waited this long
+LABEL_MAX_BATCH_SIZE = _env_int("MALARIA_LABEL_MAX_BATCH_SIZE", 32)# /predict?detail=label|probs: no-grad forward only
+
+# Confidence-gated cascade of the no-grad forwards (see inference/cascade.py): a cheap
+# screen first, the full model only for images below the threshold. Off by default:
+# pick the threshold with benchmarks/eval_cascade.py on labeled images first
+CASCADE_ENABLED = _env_bool("MALARIA_CASCADE", False)
+CASCADE_THRESHOLD = _env_float("MALARIA_CASCADE_THRESHOLD", 0.9)# max softmax of the screen to accept its answer
+CASCADE_SCREEN_SIZE = _env_int("MALARIA_CASCADE_SCREEN_SIZE", 112)# input side of the screen
+CASCADE_MODEL_PATH = os.environ.get("MALARIA_CASCADE_MODEL_PATH", "")# TorchScript screen model; empty = the full model at CASCADE_SCREEN_SIZE
+
+# Test-time augmentation of /predict (see inference/tta.py): 8 flips / rotations in one batch
+TTA_MODE = os.environ.get("MALARIA_TTA", "off")# default of ?tta=: off | on | auto
+TTA_CONFIDENCE_THRESHOLD = _env_float("MALARIA_TTA_THRESHOLD", 0.9)# auto: only predictions below this confidence
+
+# Worker pool for the blocking CPU stages: decode, images, PDF (see inference/workers.py)
+POOL_KIND = os.environ.get("MALARIA_POOL_KIND", "thread")# "thread" or "process"
+POOL_WORKERS = _env_int("MALARIA_POOL_WORKERS", 0)# 0 = one per CPU core
+POOL_MAX_QUEUE = _env_int("MALARIA_POOL_MAX_QUEUE", 64)# waiting jobs before answering 429
+# The model forwards are bounded too: images waiting in a micro-batcher, and the batched
+# forwards of /predict/batch, /predict/slide, /embed and TTA in their own small thread pool
+BATCH_MAX_QUEUE = _env_int("MALARIA_BATCH_MAX_QUEUE", 64)# images waiting for the Grad-CAM / label batches
+FORWARD_WORKERS = _env_int("MALARIA_FORWARD_WORKERS", 2)# concurrent batched forwards (each uses the torch threads)
+FORWARD_MAX_QUEUE = _env_int("MALARIA_FORWARD_MAX_QUEUE", 16)# forwards waiting before answering 429
+
+# Multi-process serving (see inference/serve.py)
+SERVER_WORKERS = _env_int("MALARIA_SERVER_WORKERS", 2)
+TORCH_THREADS = _env_int("MALARIA_TORCH_THREADS", 0)# intra-op threads per process, 0 = torch default
+
+# Result cache keyed by the hash of the uploaded image (see cache/result_cache.py)
+CACHE_ENABLED = _env_bool("MALARIA_CACHE", True)
+CACHE_MAX_ENTRIES = _env_int("MALARIA_CACHE_MAX_ENTRIES", 512)
+CACHE_MAX_MB = _env_int("MALARIA_CACHE_MAX_MB", 256)
+CACHE_TTL_SECONDS = _env_int("MALARIA_CACHE_TTL_SECONDS", 3600)
+CACHE_DIR = os.environ.get("MALARIA_CACHE_DIR", "")# empty = memory only
+
+# Images rendered on demand for /predict?images=url (see processing/artifacts.py)
+ARTIFACT_MAX_ENTRIES = _env_int("MALARIA_ARTIFACT_MAX_ENTRIES", 256)
+ARTIFACT_TTL_SECONDS = _env_int("MALARIA_ARTIFACT_TTL_SECONDS", 900)
+
+# Streaming /predict/batch: images per forward pass
+STREAM_BATCH_SIZE = _env_int("MALARIA_STREAM_BATCH_SIZE", 32)
+STREAM_MAX_BATCH_SIZE = _env_int("MALARIA_STREAM_MAX_BATCH_SIZE", 128)
+
+# Background PDF reports of /predict (see pdf/report_jobs.py)
+REPORT_WORKERS = _env_int("MALARIA_REPORT_WORKERS", 2)
+REPORT_MAX_JOBS = _env_int("MALARIA_REPORT_MAX_JOBS", 1024)# finished jobs remembered for status/download
+REPORT_MAX_PENDING = _env_int("MALARIA_REPORT_MAX_PENDING", 64)# queued PDFs before /predict?detail=pdf answers 429
+
+# Logging of our own modules (DEBUG shows per-request details); warnings and errors are always shown
+LOG_LEVEL = os.environ.get("MALARIA_LOG_LEVEL", "WARNING").upper()
+
+# Startup: MALARIA_UI=0 serves the API only (no gradio / fpdf at import);
+# MALARIA_WARMUP loads and warms the model in the background as soon as the server starts
+UI_ENABLED = _env_bool("MALARIA_UI", True)
+WARMUP = _env_bool("MALARIA_WARMUP", True)
+WARMUP_BATCH_SIZES = os.environ.get("MALARIA_WARMUP_BATCH_SIZES", "")# e.g. "1,4,8,32"; empty = powers of two up to the batch limits
+WARMUP_ITERATIONS = _env_int("MALARIA_WARMUP_ITERATIONS", 2)# passes per batch size
+
+# Reused input batches (see inference/arena.py)
+ARENA_ENABLED = _env_bool("MALARIA_ARENA", True)
+ARENA_BUFFERS_PER_SIZE = _env_int("MALARIA_ARENA_BUFFERS_PER_SIZE", 2)
+
+# CPU pinning (see inference/cpu.py): MALARIA_CPU_AFFINITY="0-3" pins the process to those
+# cores and, unless MALARIA_TORCH_THREADS says otherwise, runs one intra-op thread per core
+CPU_AFFINITY = os.environ.get("MALARIA_CPU_AFFINITY", "")
+TORCH_INTEROP_THREADS = _env_int("MALARIA_TORCH_INTEROP_THREADS", 0)
+PIN_CORES = _env_bool("MALARIA_PIN_CORES", False)# inference/serve.py: one block of cores per worker
+
+# Whole-slide / large field images, POST /predict/slide (see processing/slide.py)
+SLIDE_MODE = os.environ.get("MALARIA_SLIDE_MODE", "cells")# cells (OpenCV cell detection) | tiles (regular grid)
+SLIDE_TILE_SIZE = _env_int("MALARIA_SLIDE_TILE_SIZE", 224)# pixels of the slide per tile (tiles mode)
+SLIDE_MIN_FOREGROUND = _env_float("MALARIA_SLIDE_MIN_FOREGROUND", 0.05)# tiles with less stained area are skipped
+SLIDE_MIN_CELL_AREA = _env_int("MALARIA_SLIDE_MIN_CELL_AREA", 200)# px^2, smaller blobs are noise
+SLIDE_MAX_CELL_AREA = _env_int("MALARIA_SLIDE_MAX_CELL_AREA", 20000)# px^2, larger blobs are clumps / artifacts
+SLIDE_HEATMAP_MAX_SIDE = _env_int("MALARIA_SLIDE_HEATMAP_MAX_SIDE", 1024)# stitched heatmap resolution
+
+# Upload limits: bigger uploads get 413 before they are read into memory, and the image
+# dimensions are checked in the header before decoding (see processing/preprocess.py)
+MAX_UPLOAD_MB = _env_float("MALARIA_MAX_UPLOAD_MB", 20)# per image (/predict, each file or zip member of /predict/batch)
+MAX_IMAGE_PIXELS = _env_int("MALARIA_MAX_IMAGE_PIXELS", 40_000_000)# width * height of a single cell image, 0 = no limit
+SLIDE_MAX_UPLOAD_MB = _env_float("MALARIA_SLIDE_MAX_UPLOAD_MB", 200)# /predict/slide
+SLIDE_MAX_IMAGE_PIXELS = _env_int("MALARIA_SLIDE_MAX_IMAGE_PIXELS", 150_000_000)# PIL refuses more than ~179 MP anyway
+JPEG_DRAFT = _env_bool("MALARIA_JPEG_DRAFT", True)# decode large JPEGs at 1/2..1/8 scale, short side still >= 224
+
+# Where the PDFs are kept (see pdf/report_store.py): oldest reports are deleted
+# beyond the size limit or the age limit (0 disables either)
+REPORT_DIR = os.environ.get("MALARIA_REPORT_DIR", "reports")
+REPORT_STORE_MAX_MB = _env_float("MALARIA_REPORT_STORE_MAX_MB", 1024)
+REPORT_STORE_MAX_AGE_HOURS = _env_float("MALARIA_REPORT_STORE_MAX_AGE_HOURS", 24 * 7)
+
+# Penultimate-layer embeddings of /embed and /similar (see similarity/embedding_index.py)
+EMBEDDING_DIR = os.environ.get("MALARIA_EMBEDDING_DIR", "embeddings")
+EMBEDDING_NPROBE = _env_int("MALARIA_EMBEDDING_NPROBE", 8)# IVF clusters scanned per query (once trained)
@@ -0,0 +1,60 @@
+#CPU placement of the torch thread pools.
+#
+#torch's intra-op pool starts one thread per core it can see. With several
+#server workers, or next to other services, those threads migrate between
+#cores and fight each other. Pinning the process to a fixed set of cores and
+#sizing the pool to that set keeps each thread on its own core. This must run
+#before the first parallel op, because that op creates the pool.
+
+import logging
+import os
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cpu_list(spec):
+    """'0-3,6' -> [0, 1, 2, 3, 6] (formato de taskset / cpuset)."""
+    cores = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cores.extend(range(int(first), int(last) + 1))
+        else:
+            cores.append(int(part))
+    return sorted(set(cores))
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def configure_threads(intra_op=0, inter_op=0, cores=None):
+    """
+    Fija la afinidad del proceso (cores) y el tamaño de los pools de torch.
+
+    intra_op=0 con cores -> un hilo por core asignado; sin cores se deja el valor de torch.
+    """
+    if cores:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        else:
+            logger.warning("CPU affinity is not supported on this platform, ignoring %s", cores)
+        if intra_op <= 0:
+            intra_op = len(cores)
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # Only allowed once, before any inter-op work
+            logger.warning("Could not set inter-op threads: %s", e)
+    logger.info("torch threads: intra-op %d, inter-op %d, cores %s",
+                torch.get_num_threads(), torch.get_num_interop_threads(), cores or "all")
@@ -1,126 +1,332 @@
 #The decorator connects your Python function to the internet. 
 # Without it, your function only exists on your computer.
 
-from unittest import result
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import torch
-from torchvision import transforms
-
 from PIL import Image
-import io
-import sys
+import itertools
+import json
+import logging
+import threading
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+
 import os
 
 #sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ui'))
 
 
-from pdf.pdf_generator import generate_pdf
-from architecture.model_architecture import create_model
-from processing.image import image_to_base64
-from processing.image import prepare_visualization_data
+#Heavy modules are imported on first use: torchvision with the model (get_model),
+#fpdf with the first report, gradio only with the UI
+from pdf.report_jobs import DONE, ERROR, PENDING, RUNNING, ReportJobQueue, ReportQueueFullError
+from pdf.report_store import ReportStore, set_default_store
+
+from gradcam.gradcam_utils import predict_with_gradcam_batch
+from cache.result_cache import ResultCache, file_version
+
+from inference import config
+from inference.arena import TensorArena
+from inference.batching import BatchScheduler
+from inference.cascade import Cascade
+from inference.cpu import configure_threads, parse_cpu_list
+from inference.pipeline import build_prediction_result
+from inference.pipeline import IMAGE_MODES, decode_stage, finish_stage, render_batch_report, render_report
+from inference.pipeline import build_batch_results, cam_to_list, decode_batch_stage, decode_tensor_stage
+from processing.artifacts import ARTIFACT_KINDS, ArtifactStore, artifact_urls
+from processing.image import image_to_base64, overlay_heatmap
+from processing.preprocess import IMAGE_EXTENSIONS, ImageTooLargeError, decode_image
+from processing.slide import SLIDE_MODES, HeatmapCanvas, detect_cells, foreground_mask, preprocess_boxes, tile_boxes
+from similarity.embedding_index import EmbeddingIndex
+from inference.timing import StageTimer
+from inference.tta import TTA_MODES, VIEWS, needs_tta, run_tta
+from inference.metrics import BATCH_SIZE, MetricsMiddleware, add_collector, observe_stages, render_metrics
+from inference.workers import InferencePool, PoolFullError
+
+# Our modules log through logging.getLogger(__name__); debug/info are off unless MALARIA_LOG_LEVEL says so
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+for _package in ("inference", "processing", "gradcam", "pdf", "cache", "architecture", "ui"):
+    logging.getLogger(_package).setLevel(config.LOG_LEVEL)
+logger = logging.getLogger(__name__)
 
-from gradcam.gradcam_utils import generate_gradcam
+#The server starts answering right away; the model is loaded (and warmed up,
+#unless MALARIA_WARMUP=0) in the background and /ready turns 200 when it is done
+@asynccontextmanager
+async def lifespan(app):
+    target = warm_up if config.WARMUP else load_only
+    threading.Thread(target=target, name="warmup", daemon=True).start()
+    yield
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Malaria Detection API",
     description="API to detect malaria in blood cell images",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# Latency histogram + counter of every request, exported on /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Ruta absoluta basada en la ubicación de main.py
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-print("BASE_DIR:", BASE_DIR)
-
-#MODEL_PATH = os.path.join(BASE_DIR, "..", "models", "malaria_detection_model.pth")
-#MODEL_PATH = os.path.join(BASE_DIR, "models", "malaria_detection_model.pth")
-# Detectar si estamos en Docker
-
-if os.path.exists("/app/models/malaria_detection_model.pth"):
-    MODEL_PATH = "/app/models/malaria_detection_model.pth"
-else:
-    MODEL_PATH = os.path.join(BASE_DIR, "..", "..", "models", "malaria_detection_model.pth")
+logger.info("BASE_DIR: %s", BASE_DIR)
 
+# Detectar si estamos en Docker (ver MODEL_PATH en inference/config.py)
+MODEL_PATH = config.MODEL_PATH
 
 #MODEL_PATH = os.path.join(BASE_DIR, "..", "..", "models", "malaria_detection_model.pth")
-print("MODEL_PATH:", MODEL_PATH)
+logger.info("MODEL_PATH: %s", MODEL_PATH)
 #model = torch.load(MODEL_PATH, map_location="cpu")
 
-# Load model once at startup
-model = create_model()
-model.load_state_dict(
-    torch.load(MODEL_PATH, map_location=torch.device("cpu"))
-)
-model.eval()
-
-# Image transformations (same as training)
-transformation = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], 
-                        [0.229, 0.224, 0.225])
-])
-
-#def predict_image_from_bytes(image_bytes: bytes, model) -> dict:# -> dict means return a dictionary
-#Predicts whether an image contains malaria-infected cells
-def predict_image_from_bytes(image_bytes: bytes, model, include_gradcam=True) -> dict:
+# Intra-op threads / core pinning of this process (inference/serve.py divides the cores between workers)
+configure_threads(config.TORCH_THREADS, config.TORCH_INTEROP_THREADS, parse_cpu_list(config.CPU_AFFINITY))
+
+# Preallocated input batches shared by the micro-batcher and /predict/batch
+arena = TensorArena(per_bucket=config.ARENA_BUFFERS_PER_SIZE) if config.ARENA_ENABLED else None
+
+# Loaded once, on first use (get_model), not at import
+model = None
+# Backend for the plain (no-grad) forwards; Grad-CAM needs autograd and always uses `model`
+predict_model = None
+# Screen + predict_model for the no-grad forwards when MALARIA_CASCADE is on (else None)
+cascade = None
+_model_lock = threading.Lock()
+# Eager fp32 weights, loaded without running the model (inference/serve.py loads them before forking)
+_weights = None
+startup = {"model_load_s": None, "warmup_s": None, "warmup_batch_sizes": [], "ready": False, "error": None}
+
+def get_model():
+    global model, predict_model, cascade
+    if model is None:
+        with _model_lock:
+            if model is None:
+                from architecture.backends import build_backend, load_calibration_batches
+
+                start = time.perf_counter()
+                loaded = load_weights()
+                predict_model = build_backend(
+                    config.BACKEND,
+                    loaded,
+                    load_calibration_batches(config.CALIBRATION_DIR, config.CALIBRATION_IMAGES) if config.BACKEND == "int8" else None,
+                )
+                if config.CASCADE_ENABLED:
+                    cascade = Cascade(_screen_model(loaded, build_backend), predict_model,
+                                      config.CASCADE_SCREEN_SIZE, config.CASCADE_THRESHOLD)
+                model = loaded# last: other threads only see a model once its backend exists
+                startup["model_load_s"] = round(time.perf_counter() - start, 3)
+                logger.info("Model loaded in %.2fs, BACKEND: %s", startup["model_load_s"], config.BACKEND)
+                if not config.WARMUP:
+                    # Nothing else to wait for: a loaded model is a ready one
+                    startup["ready"] = True
+    return model
+
+#Only torch.load: no forward pass and no backend, so it can run in the parent of
+#inference/serve.py before the fork. get_model() builds the rest on top of it
+def load_weights():
+    global _weights
+    if _weights is None:
+        from architecture.model_architecture import load_model
+        _weights = load_model(MODEL_PATH)
+    return _weights
+
+def get_predict_model():
+    get_model()
+    return predict_model
+
+def get_cascade():
+    get_model()
+    return cascade
+
+#Screen of the cascade: a small TorchScript model (MALARIA_CASCADE_MODEL_PATH), or the
+#full network at the screen size. The ONNX graph has a fixed H/W, so it is exported again
+def _screen_model(loaded, build_backend):
+    if config.CASCADE_MODEL_PATH:
+        return torch.jit.load(config.CASCADE_MODEL_PATH, map_location="cpu").eval()
+    if config.BACKEND == "onnx":
+        return build_backend("onnx", loaded, image_size=config.CASCADE_SCREEN_SIZE)
+    return predict_model
+
+#MALARIA_WARMUP=0: only load the model, so /ready still turns 200 without a first request
+def load_only():
     try:
-        # Convert bytes to PIL Image
-        #image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        original_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        tensor_imagen = transformation(original_image).unsqueeze(0)# Apply transformations
-        
-        # Make prediction
-        with torch.no_grad():
-            output = model(tensor_imagen)#logits or predictions
-            prediction = torch.argmax(output, dim=1).item()#Find the index with the highest value
-            
-            # Get confidence score
-            probabilities = torch.softmax(output, dim=1)#Convert logits (raw numbers) to probabilities [0-1] For example: [-2.1, 3.4] → [0.15, 0.85]
-            confidence = probabilities.max().item()#Take the highest probability (that of the predicted class). .item(): Converts a tensor to a Python number (example: 0.85) This is the model's confidence level in its prediction.
-            
-            # Map prediction to label
-            predicted_class = "Infectado" if prediction == 0 else "No infectado"
-            
-            #Returns a dictionary with all the information
-            #return {
-            #    "prediction": predicted_class,
-            #    "confidence": round(confidence * 100, 2),#Confidence in percentage (85.67%)
-            #    "class_id": prediction
-            #}
-            result = {
-                "prediction": predicted_class,
-                "confidence": round(confidence * 100, 2),#Confidence in percentage (85.67%)
-                "class_id": prediction
-            }
-            
-            # Generar Grad-CAM si se solicita
-        if include_gradcam:
-            try:
-                # Generar heatmap
-                heatmap = generate_gradcam(model, tensor_imagen, target_class=prediction)
-                
-                # Preparar visualizaciones
-                visualization_data = prepare_visualization_data(original_image, heatmap)
-                
-                # Agregar visualizaciones al resultado
-                result.update({
-                    "original_image": visualization_data["original"],
-                    "heatmap": visualization_data["heatmap"],
-                    "overlay": visualization_data["overlay"],
-                    "explanation": f"Las áreas en rojo/amarillo muestran las regiones que más influyeron en la predicción '{predicted_class}'"
-                })
-                
-            except Exception as e:
-                print(f"Error generating Grad-CAM: {e}")
-                # Continuar sin Grad-CAM
-                result["original_image"] = image_to_base64(original_image)
-        
-        return result
-    
+        get_model()
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
+        startup["error"] = str(e)
+        logger.exception("Model load failed: %s", e)
+
+#Batch sizes to warm up: MALARIA_WARMUP_BATCH_SIZES, or 1, the powers of two and
+#the limits of the micro-batcher and /predict/batch
+def _warmup_sizes():
+    if config.WARMUP_BATCH_SIZES:
+        return sorted({int(s) for s in config.WARMUP_BATCH_SIZES.split(",") if s.strip()})
+    limits = {1, get_batcher().max_batch_size, get_label_batcher().max_batch_size, config.STREAM_BATCH_SIZE}
+    if config.TTA_MODE != "off":
+        limits |= {VIEWS - 1, VIEWS}
+    size = 2
+    while size < max(limits):
+        limits.add(size)
+        size *= 2
+    return sorted(limits)
+
+#Runs the model at every batch size the server will use (Grad-CAM up to the
+#micro-batch limit, the backend forward at all of them) plus one image + PDF
+#render, so the first real requests do not pay for lazy initialization: kernel
+#selection per input shape, autograd setup, allocator growth, thread pools and
+#the fpdf import
+def warm_up():
+    try:
+        get_model()
+        start = time.perf_counter()
+        sizes = _warmup_sizes()
+        for size in sizes:
+            dummy = torch.zeros(size, 3, 224, 224)
+            for _ in range(max(1, config.WARMUP_ITERATIONS)):
+                if size <= get_batcher().max_batch_size:
+                    explain_batch(model, dummy)
+                with torch.no_grad():
+                    predict_model(dummy)
+                if cascade is not None:
+                    # Straight to the screen, so the warm-up does not count in its stats
+                    with torch.no_grad():
+                        cascade.screen(cascade.downsample(dummy))
+        if arena is not None:
+            arena.preallocate(sizes)
+
+        # First heatmap colors, PNG encode and PDF build
+        from PIL import Image
+        from pdf.pdf_generator import build_report
+        outputs, heatmaps = explain_batch(model, torch.zeros(1, 3, 224, 224))
+        result, _ = finish_stage(build_prediction_result(outputs[0]), Image.new("RGB", (224, 224)), heatmaps[0],
+                                 "warmup.png", images="inline", report=False)
+        build_report(result, "warmup.png")
+
+        startup["warmup_batch_sizes"] = sizes
+        startup["warmup_s"] = round(time.perf_counter() - start, 3)
+        startup["ready"] = True
+        logger.info("Warm-up done in %.2fs", startup["warmup_s"])
+    except Exception as e:
+        startup["error"] = str(e)
+        logger.exception("Warm-up failed: %s", e)
+
+# Cache of finished results; the weights version is part of the key so a new model never serves old results
+MODEL_VERSION = file_version(MODEL_PATH)
+if MODEL_VERSION is None:
+    # The import still succeeds: /ready answers 503 with this error instead of the server not starting
+    startup["error"] = f"Model weights not found: {MODEL_PATH}"
+    logger.error(startup["error"])
+result_cache = ResultCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    max_bytes=config.CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+    disk_dir=config.CACHE_DIR,
+    model_version=MODEL_VERSION or "",
+) if config.CACHE_ENABLED else None
+
+#Prediction + Grad-CAM from a single hooked forward pass.
+#Returns (logits, heatmap); heatmap is None if Grad-CAM could not be computed
+def explain_tensor(model, tensor_imagen, timer=None):
+    outputs, heatmaps = explain_batch(model, tensor_imagen, timer)
+    return outputs[0:1], heatmaps[0]
+
+#Same for a whole batch [B,C,H,W]: one forward + one backward
+#Returns (logits [B,2], list of B heatmaps or Nones)
+def explain_batch(model, batch, timer=None):
+    try:
+        outputs, heatmaps = predict_with_gradcam_batch(model, batch, timer=timer)
+        return outputs, list(heatmaps)
+    except Exception as e:
+        logger.warning("Error generating Grad-CAM: %s", e)
+        # Continuar sin Grad-CAM
+        with torch.no_grad():
+            return model(batch), [None] * batch.shape[0]
+
+#Run by the scheduler: [B,C,H,W] -> list of (logits, heatmap), one per image.
+#forward / gradcam are timed per batch (the request only sees the total, queue wait included)
+def _explain_batch(batch):
+    timer = StageTimer()
+    outputs, heatmaps = explain_batch(get_model(), batch, timer)
+    observe_stages(timer.stages)
+    BATCH_SIZE.observe(batch.shape[0], "gradcam")
+    return list(zip(outputs, heatmaps))
+
+_batcher = None
+
+#The forward always goes through the scheduler: with batching disabled it is
+#just a batch of 1, still run off the event loop in the scheduler's own thread
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        _batcher = BatchScheduler(
+            _explain_batch,
+            max_batch_size=config.MAX_BATCH_SIZE if config.BATCHING_ENABLED else 1,
+            max_wait_ms=config.MAX_BATCH_WAIT_MS if config.BATCHING_ENABLED else 0,
+            name="gradcam",
+            arena=arena,
+            max_queue=config.BATCH_MAX_QUEUE,
+        )
+    return _batcher
+
+#Run by the label scheduler: no-grad forward on the configured backend (or the cascade)
+#-> list of (logits [2], escalated or None), one per image
+def _forward_rows(batch):
+    timer = StageTimer()
+    with timer.stage("forward"):
+        outputs, escalated = _forward_batch(batch)
+    observe_stages(timer.stages)
+    BATCH_SIZE.observe(batch.shape[0], "label")
+    return list(zip(outputs, escalated))
+
+_label_batcher = None
+
+#Second scheduler for /predict?detail=label|probs: its batches have no backward pass,
+#so they can be larger and never wait behind a Grad-CAM batch
+def get_label_batcher():
+    global _label_batcher
+    if _label_batcher is None:
+        _label_batcher = BatchScheduler(
+            _forward_rows,
+            max_batch_size=config.LABEL_MAX_BATCH_SIZE if config.BATCHING_ENABLED else 1,
+            max_wait_ms=config.MAX_BATCH_WAIT_MS if config.BATCHING_ENABLED else 0,
+            name="label",
+            arena=arena,
+            max_queue=config.BATCH_MAX_QUEUE,
+        )
+    return _label_batcher
+
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = InferencePool(
+            kind=config.POOL_KIND,
+            max_workers=config.POOL_WORKERS,
+            max_queue=config.POOL_MAX_QUEUE,
+        )
+    return _pool
+
+_forward_pool = None
+
+#Batched forwards outside the micro-batchers (/predict/batch, /predict/slide, /embed, TTA).
+#Always threads: they use the model of this process
+def get_forward_pool():
+    global _forward_pool
+    if _forward_pool is None:
+        _forward_pool = InferencePool(
+            kind="thread",
+            max_workers=config.FORWARD_WORKERS,
+            max_queue=config.FORWARD_MAX_QUEUE,
+        )
+    return _forward_pool
+
+#429 before accepting a streaming request when the decode or the forward pool is already full
+def _reject_if_busy():
+    if get_pool().is_full() or get_forward_pool().is_full():
+        raise HTTPException(status_code=429, detail="Inference queue is full", headers={"Retry-After": "1"})
 
 #When someone visits the root of the site ("/"), run this function.
 @app.get("/")
@@ -131,31 +337,822 @@ async def root():
         "status": "active",
         "features": ["Prediction", "Grad-CAM Visualization", "Explainable AI"],
         "endpoints": {
-            "predict": "/predict - POST with image",
-            "health": "/health - GET to check status"
+            "predict": "/predict - POST with image (?detail=label|probs|cam|images|pdf&images=inline|url|none&report=true|false&tta=off|on|auto)",
+            "predict_batch": "/predict/batch - POST several images or a zip, NDJSON stream (?report=true for one summary PDF)",
+            "predict_slide": "/predict/slide - POST one large smear image, NDJSON per cell/tile + parasitemia and stitched heatmap (?mode=cells|tiles)",
+            "embed": "/embed - POST one image, its 512-d embedding (?store=true adds it to the index); /embed/batch - several images or a zip, NDJSON",
+            "similar": "/similar - POST an image, the k most similar stored cells; /similar/{id} - GET the same for a stored one",
+            "artifacts": "/artifacts/{id}/{original|heatmap|overlay} - GET rendered PNG",
+            "reports": "/reports/{id} - GET report status, /reports/{id}/download - GET the PDF, /reports?prediction=&since=&until= - GET stored reports",
+            "health": "/health - GET to check status (liveness)",
+            "ready": "/ready - GET 200 once the model is loaded and warmed up (readiness)",
+            "metrics": "/metrics - GET Prometheus metrics (stage latency histograms, queues, cache)"
         }
     }
 
 #Endpoint. When someone visits /health, run this function
+#Liveness: answers as soon as the process is up, even while the model is still loading
 @app.get("/health")# FastAPI reads this
 async def health_check(): # and this and automatically creates a button and so on.
     return {"status": "healthy", 
-            "model_loaded": True,
-            "gradcam_enabled": True
+            "model_loaded": model is not None,
+            "ready": startup["ready"],
+            "gradcam_enabled": True,
+            "backend": config.BACKEND,
+            "batching": get_batcher().snapshot(),
+            "label_batching": get_label_batcher().snapshot(),
+            "cascade": cascade.snapshot() if cascade is not None else None,
+            "worker_pool": get_pool().snapshot(),
+            "forward_pool": get_forward_pool().snapshot(),
+            "arena": arena.snapshot() if arena is not None else None,
+            "cache": result_cache.snapshot() if result_cache is not None else None,
+            "reports": report_jobs.snapshot(),
+            "report_store": report_store.snapshot(),
+            "embedding_index": embedding_index.snapshot()
             }
 
-def process_prediction_internal(image_bytes, filename="image.png"):
+#Gauges read at scrape time from the components that already keep them
+def _collect_metrics():
+    batchers = (get_batcher(), get_label_batcher())
+    yield "malaria_batch_queue_depth", "gauge", "Images waiting in a micro-batcher (gradcam / label)", {
+        (("batcher", batcher.name),): batcher.queue_depth() for batcher in batchers
+    }
+    yield "malaria_batch_flushes_total", "counter", "Batches sent to the model by micro-batcher and flush reason", {
+        (("batcher", batcher.name), ("reason", reason)): batcher.stats[f"flush_{reason}"]
+        for batcher in batchers for reason in ("full", "timeout")
+    }
+    yield "malaria_batch_rejected_total", "counter", "Images rejected with 429 because a micro-batcher queue was full", {
+        (("batcher", batcher.name),): batcher.stats["rejected"] for batcher in batchers
+    }
+    pool = get_pool().snapshot()
+    yield "malaria_pool_in_flight", "gauge", "Jobs running or waiting in the worker pool", pool["in_flight"]
+    yield "malaria_pool_queued", "gauge", "Jobs waiting for a worker", pool["queued"]
+    yield "malaria_pool_rejected_total", "counter", "Jobs rejected with 429 because the pool was full", pool["rejected"]
+    forward = get_forward_pool().snapshot()
+    yield "malaria_forward_pool_in_flight", "gauge", "Batched forwards running or waiting", forward["in_flight"]
+    yield "malaria_forward_pool_rejected_total", "counter", "Forwards rejected with 429 because the forward pool was full", forward["rejected"]
+    if result_cache is not None:
+        cache = result_cache.snapshot()
+        yield "malaria_cache_entries", "gauge", "Results in the memory cache", cache["entries"]
+        yield "malaria_cache_bytes", "gauge", "Approximate size of the memory cache", cache["bytes"]
+        yield "malaria_cache_lookups_total", "counter", "Cache lookups by outcome", {
+            (("result", "hit"),): cache["hits"],
+            (("result", "miss"),): cache["misses"],
+        }
+        yield "malaria_cache_evictions_total", "counter", "Entries evicted from the memory cache", cache["evictions"]
+    if arena is not None:
+        pooled = arena.snapshot()
+        yield "malaria_arena_acquires_total", "counter", "Input batch buffers taken from the arena", {
+            (("result", "reused"),): pooled["hits"],
+            (("result", "allocated"),): pooled["misses"] + pooled["oversize"],
+        }
+        yield "malaria_arena_pooled_mb", "gauge", "Memory held by idle arena buffers", pooled["pooled_mb"]
+    if cascade is not None:
+        screened = cascade.snapshot()
+        yield "malaria_cascade_images_total", "counter", "Images through the cascade screen by outcome", {
+            (("result", "accepted"),): screened["screened"] - screened["escalated"],
+            (("result", "escalated"),): screened["escalated"],
+        }
+    jobs = report_jobs.snapshot()
+    yield "malaria_report_jobs", "gauge", "Known PDF report jobs by status", {
+        (("status", status),): count for status, count in jobs["jobs"].items()
+    }
+    yield "malaria_report_rejected_total", "counter", "PDF reports refused because the queue was full", jobs["rejected"]
+    stored = report_store.snapshot()
+    yield "malaria_report_store_reports", "gauge", "PDF reports kept on disk", stored["reports"]
+    yield "malaria_report_store_mb", "gauge", "Disk used by the stored PDF reports", stored["mb"]
+    yield "malaria_report_store_evicted_total", "counter", "Reports deleted by size or age (this process)", stored["evicted"]
+    yield "malaria_embedding_index_size", "gauge", "Embeddings stored for similarity search", embedding_index.snapshot()["embeddings"]
+
+add_collector(_collect_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+#Readiness: 503 until the model is loaded and warmed up (route traffic only after this)
+@app.get("/ready")
+async def readiness():
+    if startup["ready"]:
+        return {"status": "ready", **startup}
+    status = "error" if startup["error"] else "loading"
+    return JSONResponse(status_code=503, content={"status": status, **startup})
+
+#Images rendered on demand for /predict?images=url
+artifacts = ArtifactStore(max_entries=config.ARTIFACT_MAX_ENTRIES, ttl_seconds=config.ARTIFACT_TTL_SECONDS)
+
+#Every PDF (API jobs and the Gradio UI) is saved here, under its report id
+report_store = ReportStore(
+    config.REPORT_DIR,
+    max_mb=config.REPORT_STORE_MAX_MB,
+    max_age_seconds=config.REPORT_STORE_MAX_AGE_HOURS * 3600,
+)
+set_default_store(report_store)
+
+#Penultimate-layer vectors of the images embedded with store=true, searched by /similar
+embedding_index = EmbeddingIndex(config.EMBEDDING_DIR, nprobe=config.EMBEDDING_NPROBE)
+
+#PDF reports of /predict, rendered in the background
+report_jobs = ReportJobQueue(workers=config.REPORT_WORKERS, max_jobs=config.REPORT_MAX_JOBS,
+                             max_pending=config.REPORT_MAX_PENDING, store=report_store)
+
+#Runs in a report job: the PDF is off the request path but still gets its "pdf" histogram
+def _timed_report(render, *args, report_id=None):
+    timer = StageTimer()
+    with timer.stage("pdf"):
+        path = render(*args, report_id=report_id)
+    observe_stages(timer.stages)
+    return path
+
+#Key of an in-memory PIL image (Gradio): hashing the pixels avoids encoding it to PNG first
+def image_cache_key(image, images="pil"):
+    if result_cache is None:
+        return None
+    return result_cache.key(image.mode, image.size, image.tobytes(), images)
+
+def get_cached_result(cache_key):
+    if result_cache is None or cache_key is None:
+        return None
+    result = result_cache.get(cache_key)
+    if result is None:
+        return None
+    # A cached url-mode result is only useful while its artifact still exists
+    if result.get("artifact_id") and result["artifact_id"] not in artifacts:
+        return None
+    # Same for a result whose report is neither queued (here or in another worker) nor stored any more
+    if result.get("report_id") and not _report_known(result["report_id"]):
+        return None
+    # A synchronous PDF (Gradio) may have been evicted from the report store: render it again
+    if result.get("pdf_path") and not os.path.exists(result["pdf_path"]):
+        _rerender_report(cache_key, result)
+    result["cached"] = True
+    return result
+
+#The cached result already holds the overlay the PDF embeds, so no forward is needed
+def _rerender_report(cache_key, result):
+    timer = StageTimer()
+    with timer.stage("pdf"):
+        result["pdf_path"] = render_report(result, result.get("original_image"), None, "image.png")
+    observe_stages(timer.stages)
+    if result["pdf_path"] is not None:
+        result_cache.put(cache_key, result)
+
+#cache_key: already computed key (e.g. image_cache_key); with lookup=False the
+#caller has already checked the cache and only the store is done here.
+#images="pil" returns PIL images instead of base64 (no PNG encode/decode round trip)
+def process_prediction_internal(image_bytes, filename="image.png", cache_key=None, lookup=True, images="inline"):
     """Función interna sin FastAPI para procesar predicción"""
-    result = predict_image_from_bytes(image_bytes, model, include_gradcam=True)
-    pdf_path = generate_pdf(result, filename)
-    result["pdf_path"] = pdf_path
+    if cache_key is None and result_cache is not None:
+        cache_key = result_cache.key(image_bytes, images)
+    cached = get_cached_result(cache_key) if lookup else None
+    if cached is not None:
+        return cached
+
+    timer = StageTimer()
+    try:
+        original_image, tensor_imagen, stages = decode_stage(image_bytes)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
+    timer.update(stages)
+
+    output, heatmap = explain_tensor(get_model(), tensor_imagen, timer)
+    result = build_prediction_result(output)
+    artifact_id = artifacts.add(original_image, heatmap) if images == "url" else None
+    result, stages = finish_stage(result, original_image, heatmap, filename, images, artifact_id)
+    timer.update(stages)
+    observe_stages(timer.stages)
     #print(result)
+    if result_cache is not None:
+        result_cache.put(cache_key, result)
     return result
 
+async def _decode(pool, stage, image_bytes):
+    try:
+        return await pool.run(stage, image_bytes)
+    except PoolFullError:
+        raise
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
+
+#Runs in a thread: the TTA views of one image through the backend in a single batch.
+#output: logits already computed for the original view (only the other 7 are run), or None
+def _tta_forward(tensor, output):
+    outputs, uncertainty = run_tta(get_predict_model(), tensor, output)
+    return outputs[0], uncertainty[0]
+
+async def _apply_tta(tensor, output, tta, timer):
+    if tta == "off" or (tta == "auto" and not needs_tta(output, config.TTA_CONFIDENCE_THRESHOLD)):
+        return output, None
+    with timer.stage("tta"):
+        return await get_forward_pool().run(_tta_forward, tensor, output)
+
+async def process_prediction_batched(image_bytes, filename="image.png", images="inline", report=True, detail="pdf",
+                                     tta="off"):
+    """Igual que process_prediction_internal, pero sin bloquear el event loop:
+    las etapas de CPU van al pool de workers y el forward se agrupa con otras peticiones.
+    detail: nivel de respuesta (DETAIL_TIERS), solo se hace el trabajo que ese nivel necesita.
+    tta: off | on | auto (TTA_MODES); el resultado lleva "tta" con agreement / uncertainty si se hizo.
+    El PDF no se genera aquí: con detail="pdf" y report=True se encola y el resultado lleva su report_id"""
+    level = DETAIL_TIERS.index(detail)
+    cache_key = result_cache.key(image_bytes, images, report, detail, tta) if result_cache is not None else None
+    cached = get_cached_result(cache_key)
+    if cached is not None:
+        return cached
+    if detail == "pdf" and report:
+        # Refuse before the forward, not after: the report would have nowhere to go
+        report_jobs.check()
+
+    pool = get_pool()
+    timer = StageTimer()
+
+    if level < DETAIL_TIERS.index("cam"):
+        # label / probs: no-grad forward on the configured backend, nothing to draw
+        tensor_imagen, stages = await _decode(pool, decode_tensor_stage, image_bytes)
+        timer.update(stages)
+        if tta == "on":
+            # All 8 views in one forward, the original one included
+            output, escalated = None, None
+        else:
+            with timer.stage("forward_batch"):
+                output, escalated = await get_label_batcher().submit(tensor_imagen)
+        output, uncertainty = await _apply_tta(tensor_imagen, output, tta, timer)
+        result = build_prediction_result(output, with_probabilities=detail == "probs")
+        if escalated is not None:
+            result["escalated"] = escalated
+    else:
+        original_image, tensor_imagen, stages = await _decode(pool, decode_stage, image_bytes)
+        timer.update(stages)
+
+        with timer.stage("forward_gradcam"):
+            output, heatmap = await get_batcher().submit(tensor_imagen)
+        # The heatmap stays the one of the original view
+        output, uncertainty = await _apply_tta(tensor_imagen, output, tta, timer)
+        result = build_prediction_result(output, with_probabilities=True)
+        result["cam"] = cam_to_list(heatmap)
+
+        if level >= DETAIL_TIERS.index("images") and images != "none":
+            # Artifacts are registered here, in the server process, even with a process pool
+            artifact_id = artifacts.add(original_image, heatmap) if images == "url" else None
+            result, stages = await pool.run(finish_stage, result, original_image, heatmap, filename, images, artifact_id, False)
+            timer.update(stages)
+
+        if detail == "pdf" and report:
+            # A copy: the job must not see timings_ms / cached added to the response later
+            report_id = report_jobs.submit(_timed_report, render_report, dict(result), original_image, heatmap, filename)
+            result["report_id"] = report_id
+            result["report_url"] = f"/reports/{report_id}"
+
+    if uncertainty is not None:
+        result["tta"] = uncertainty
+    result["detail"] = detail
+    if result_cache is not None:
+        result_cache.put(cache_key, result)
+    observe_stages(timer.stages)
+    result["timings_ms"] = timer.stages
+    return result
+
+
+#Renders one of the images of a url-mode prediction the first time it is requested
+@app.get("/artifacts/{artifact_id}/{kind}")
+async def get_artifact(artifact_id: str, kind: str):
+    if kind not in ARTIFACT_KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown artifact kind: {kind}")
+    # The store lives in this process, so render in a thread (not in the worker pool)
+    png = await run_in_threadpool(artifacts.render, artifact_id, kind)
+    if png is None:
+        raise HTTPException(status_code=404, detail="Artifact not found or expired")
+    return Response(content=png, media_type="image/png")
+
+def _report_status(report_id, job):
+    status = {"report_id": report_id, "status": job["status"], "render_ms": job.get("render_ms")}
+    if job["status"] == DONE:
+        status["download_url"] = f"/reports/{report_id}/download"
+    elif job["status"] == ERROR:
+        status["error"] = job["error"]
+    return status
+
+#Index row as returned by the API (the server path stays private)
+def _stored_report(report):
+    report = {k: v for k, v in report.items() if k != "path"}
+    report["created"] = datetime.fromtimestamp(report["created"]).isoformat(timespec="seconds")
+    report["download_url"] = f"/reports/{report['id']}/download"
+    return report
+
+def _timestamp(value, name):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date, e.g. 2024-05-01 or 2024-05-01T10:30")
+
+#Stored reports, newest first, from the report index (no directory scan).
+#since / until: ISO dates; prediction: "Infectado" | "No infectado"; kind: reporte | reporte_lamina
+@app.get("/reports")
+async def list_reports(prediction: str = None, kind: str = None, since: str = None, until: str = None, limit: int = 100):
+    limit = max(1, min(limit, 1000))
+    reports = await run_in_threadpool(report_store.query, prediction, kind,
+                                      _timestamp(since, "since"), _timestamp(until, "until"), limit)
+    return {"reports": [_stored_report(report) for report in reports]}
+
+#A report queued in this worker, queued in another one (shared job row) or already stored
+def _report_known(report_id):
+    if report_id in report_jobs or report_id in report_store:
+        return True
+    job = report_store.job(report_id)
+    return job is not None and job["status"] in (PENDING, RUNNING)
+
+#Status of a background PDF: pending | running | done | error.
+#A job of another server worker, or one already forgotten (or after a restart),
+#is answered from the shared report index
+@app.get("/reports/{report_id}")
+async def get_report_status(report_id: str):
+    job = report_jobs.get(report_id)
+    if job is not None:
+        return _report_status(report_id, job)
+    report = await run_in_threadpool(report_store.get, report_id)
+    if report is not None:
+        return dict(_stored_report(report), report_id=report_id, status=DONE)
+    job = await run_in_threadpool(report_store.job, report_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report not found or expired")
+    return _report_status(report_id, job)
+
+#The PDF itself; 202 with the status while it is still being generated
+@app.get("/reports/{report_id}/download")
+async def download_report(report_id: str):
+    job = report_jobs.get(report_id)
+    if job is not None:
+        if job["status"] == ERROR:
+            raise HTTPException(status_code=500, detail=f"Error generating the report: {job['error']}")
+        if job["status"] != DONE:
+            return JSONResponse(status_code=202, content=_report_status(report_id, job), headers={"Retry-After": "1"})
+    # The path comes from the id and the index row is a primary-key lookup
+    report = await run_in_threadpool(report_store.get, report_id)
+    if report is None and job is None:
+        # Maybe still rendering in another server worker
+        job = await run_in_threadpool(report_store.job, report_id)
+        if job is not None and job["status"] == ERROR:
+            raise HTTPException(status_code=500, detail=f"Error generating the report: {job['error']}")
+        if job is not None:
+            return JSONResponse(status_code=202, content=_report_status(report_id, job), headers={"Retry-After": "1"})
+    if report is None or not os.path.exists(report["path"]):
+        raise HTTPException(status_code=404, detail="Report not found or expired")
+    return FileResponse(report["path"], media_type="application/pdf", filename=report["name"])
+
+#Plain batched forward (no Grad-CAM) for /predict/batch, on the configured backend.
+#Returns (logits [B,2], B flags): with the cascade, whether each image went to the full model, else Nones
+def _forward_batch(batch):
+    forward = get_cascade()
+    if forward is not None:
+        outputs, escalated = forward(batch)
+        return outputs, escalated.tolist()
+    with torch.no_grad():
+        return predict_model(batch), [None] * batch.shape[0]
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def _too_large(max_bytes):
+    return ImageTooLargeError(f"File exceeds the upload limit of {max_bytes / 2**20:.1f} MB")
+
+#Reads an upload in chunks and stops (413) as soon as it goes over max_bytes, so an
+#oversized file is never held in memory. Starlette has already spooled the multipart
+#body to a temporary file, whose size is known up front in most cases
+async def read_upload(upload, max_bytes):
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=str(_too_large(max_bytes)))
+    chunks, size = [], 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=str(_too_large(max_bytes)))
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+#Yields (index, filename, bytes) for every uploaded image and every image inside uploaded
+#zips, one at a time (members are read from the spooled upload, never all at once).
+#Files or members over MALARIA_MAX_UPLOAD_MB are not read: their bytes are an error
+def _iter_upload_images(files):
+    max_bytes = int(config.MAX_UPLOAD_MB * 2**20)
+    index = 0
+    for upload in files:
+        name = upload.filename or f"file_{index}"
+        upload.file.seek(0)
+        if name.lower().endswith(".zip") or upload.content_type in ZIP_CONTENT_TYPES:
+            try:
+                with zipfile.ZipFile(upload.file) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        # file_size is the uncompressed size from the zip directory (zip bombs)
+                        if info.file_size > max_bytes:
+                            yield index, info.filename, _too_large(max_bytes)
+                        else:
+                            yield index, info.filename, archive.read(info)
+                        index += 1
+            except zipfile.BadZipFile as e:
+                yield index, name, e
+                index += 1
+        elif upload.size is not None and upload.size > max_bytes:
+            yield index, name, _too_large(max_bytes)
+            index += 1
+        else:
+            data = upload.file.read(max_bytes + 1)
+            yield index, name, data if len(data) <= max_bytes else _too_large(max_bytes)
+            index += 1
+
+def _next_chunk(iterator, size):
+    return list(itertools.islice(iterator, size))
+
+#Several files and/or zip archives; results are streamed as NDJSON, one line per image,
+#as soon as each batch finishes, followed by a final {"summary": ...} line.
+#report=true also queues ONE PDF summarizing every image (its report_id goes in the summary)
+@app.post("/predict/batch")
+async def predict_batch(files: List[UploadFile] = File(...), batch_size: int = config.STREAM_BATCH_SIZE,
+                        report: bool = False):
+    batch_size = max(1, min(batch_size, config.STREAM_MAX_BATCH_SIZE))
+    _reject_if_busy()
+    pool = get_pool()
+
+    async def stream():
+        iterator = _iter_upload_images(files)
+        start = time.perf_counter()
+        total = errors = infected = batches = escalated = 0
+        report_lines = []
+
+        while True:
+            # Only one chunk of images is in memory at a time
+            items = await run_in_threadpool(_next_chunk, iterator, batch_size)
+            if not items:
+                break
+            # Decoded straight into an arena buffer (a process pool cannot write into it)
+            buffer = arena.acquire(len(items)) if arena is not None and pool.kind == "thread" else None
+            try:
+                kept, tensor, error_lines = await pool.run(decode_batch_stage, items, buffer, wait_for_slot=True)
+                outputs, flags = (await get_forward_pool().run(_forward_batch, tensor, wait_for_slot=True)
+                                  if tensor is not None else (None, None))
+            finally:
+                if buffer is not None:
+                    arena.release(buffer)
+
+            for line in error_lines:
+                errors += 1
+                yield json.dumps(line) + "\n"
+            if outputs is None:
+                continue
+            BATCH_SIZE.observe(len(kept), "batch")
+            batches += 1
+            for line, flag in zip(build_batch_results(kept, outputs), flags):
+                total += 1
+                infected += line["class_id"] == 0
+                if flag is not None:
+                    line["escalated"] = flag
+                    escalated += flag
+                if report:
+                    report_lines.append(line)
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "images": total,
+            "errors": errors,
+            "infected": infected,
+            "batches": batches,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "images_per_sec": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        if cascade is not None:
+            summary["escalated"] = escalated
+        if report:
+            try:
+                report_id = report_jobs.submit(_timed_report, render_batch_report, report_lines)
+                summary["report_id"] = report_id
+                summary["report_url"] = f"/reports/{report_id}"
+            except ReportQueueFullError as e:
+                # The results are already streamed: only the summary PDF is dropped
+                summary["report_error"] = str(e)
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+#Runs in a thread: decode the slide and find what to classify.
+#Returns (array, boxes [(x, y, w, h)], skipped): skipped = oversized blobs (cells) or background tiles
+def _prepare_slide(image_bytes, mode, tile_size, stride):
+    timer = StageTimer()
+    with timer.stage("decode"):
+        array = decode_image(image_bytes, max_pixels=config.SLIDE_MAX_IMAGE_PIXELS)
+    with timer.stage("detect"):
+        mask = foreground_mask(array)
+        if mode == "cells":
+            boxes, skipped = detect_cells(mask, config.SLIDE_MIN_CELL_AREA, config.SLIDE_MAX_CELL_AREA)
+        else:
+            boxes = list(tile_boxes(array.shape[1], array.shape[0], tile_size, stride, mask, config.SLIDE_MIN_FOREGROUND))
+            skipped = boxes.count(None)
+            boxes = [box for box in boxes if box is not None]
+    observe_stages(timer.stages)
+    return array, boxes, skipped
+
+#Runs in a thread: crops of one chunk -> (logits [N,2], N cams or Nones, N escalated flags or Nones).
+#With the cascade only the crops the screen is unsure about get the full model, and with
+#gradcam their Grad-CAM comes from that same forward; the confident ones have no cam
+def _classify_slide_chunk(array, boxes, gradcam):
+    buffer = arena.acquire(len(boxes)) if arena is not None else None
+    try:
+        timer = StageTimer()
+        with timer.stage("preprocess"):
+            tensor = preprocess_boxes(array, boxes, out=buffer)
+        screen = get_cascade()
+        if screen is not None and gradcam:
+            with timer.stage("screen"):
+                outputs, escalate = screen.screen_batch(tensor)
+            cams = [None] * len(boxes)
+            rows = escalate.nonzero().flatten()
+            if len(rows):
+                full_outputs, full_cams = explain_batch(model, tensor[rows], timer)
+                outputs[rows] = full_outputs.detach()
+                for row, cam in zip(rows.tolist(), full_cams):
+                    cams[row] = cam
+            flags = escalate.tolist()
+        elif gradcam:
+            outputs, cams = explain_batch(get_model(), tensor, timer)
+            flags = [None] * len(boxes)
+        else:
+            with timer.stage("forward"):
+                outputs, flags = _forward_batch(tensor)
+            cams = [None] * len(boxes)
+    finally:
+        if buffer is not None:
+            arena.release(buffer)
+    observe_stages(timer.stages)
+    BATCH_SIZE.observe(len(boxes), "slide")
+    return outputs, cams, flags
+
+#Stitched heatmap of a slide as url artifacts or an inline overlay
+def _slide_heatmap(canvas, array, images):
+    thumbnail = Image.fromarray(canvas.thumbnail(array))
+    heatmap = canvas.heatmap()
+    if images == "url":
+        artifact_id = artifacts.add(thumbnail, heatmap)
+        return dict(artifact_urls(artifact_id), artifact_id=artifact_id)
+    return {"overlay": image_to_base64(overlay_heatmap(thumbnail, heatmap))}
+
+#One large smear image (thick/thin film field) instead of a cropped cell.
+#mode=cells classifies every cell found by OpenCV (parasitemia = infected / cells),
+#mode=tiles a grid of tile_size windows (overlap 0..0.9). Streams one NDJSON line per
+#cell/tile with its box [x, y, w, h], then a {"summary": ...} with the stitched heatmap
+@app.post("/predict/slide")
+async def predict_slide(file: UploadFile = File(...), mode: str = config.SLIDE_MODE,
+                        tile_size: int = config.SLIDE_TILE_SIZE, overlap: float = 0.0,
+                        batch_size: int = config.STREAM_BATCH_SIZE, gradcam: bool = True, images: str = "url"):
+    if mode not in SLIDE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SLIDE_MODES)}")
+    if images not in ("inline", "url", "none"):
+        raise HTTPException(status_code=400, detail="images must be 'inline', 'url' or 'none'")
+    if tile_size < 16 or not 0 <= overlap <= 0.9:
+        raise HTTPException(status_code=400, detail="tile_size must be >= 16 and overlap between 0 and 0.9")
+    batch_size = max(1, min(batch_size, config.STREAM_MAX_BATCH_SIZE))
+    _reject_if_busy()
+
+    start = time.perf_counter()
+    image_bytes = await read_upload(file, int(config.SLIDE_MAX_UPLOAD_MB * 2**20))
+    stride = max(1, int(tile_size * (1 - overlap)))
+    try:
+        array, boxes, skipped = await run_in_threadpool(_prepare_slide, image_bytes, mode, tile_size, stride)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image: {e}")
+    del image_bytes
+    height, width = array.shape[:2]
+
+    async def stream():
+        canvas = HeatmapCanvas(width, height, config.SLIDE_HEATMAP_MAX_SIDE)
+        infected = batches = escalated = 0
+        for first in range(0, len(boxes), batch_size):
+            chunk = boxes[first:first + batch_size]
+            # An accepted slide waits for a slot between chunks instead of failing halfway
+            outputs, cams, flags = await get_forward_pool().run(_classify_slide_chunk, array, chunk, gradcam,
+                                                                wait_for_slot=True)
+            batches += 1
+            kept = [(first + i, file.filename) for i in range(len(chunk))]
+            for line, box, cam, flag in zip(build_batch_results(kept, outputs), chunk, cams, flags):
+                del line["filename"]
+                line["box"] = list(box)
+                if flag is not None:
+                    line["escalated"] = flag
+                    escalated += flag
+                infected += line["class_id"] == 0
+                # Heat = probability of the infected class, spread over the box by its Grad-CAM
+                canvas.add(box, line["probabilities"][0], cam)
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+        unit = "cells" if mode == "cells" else "tiles"
+        percent = round(infected / len(boxes) * 100, 2) if boxes else 0.0
+        elapsed = time.perf_counter() - start
+        summary = {
+            "filename": file.filename,
+            "mode": mode,
+            "width": width,
+            "height": height,
+            unit: len(boxes),
+            "infected": infected,
+            # cells: oversized blobs (clumps, artifacts) not classified; tiles: background tiles
+            "skipped": skipped,
+            # Parasitemia is a fraction of cells: a tile may hold several cells or none
+            "parasitemia_percent": percent if mode == "cells" else None,
+            "positive_tiles_percent": percent if mode == "tiles" else None,
+            "batches": batches,
+            "elapsed_ms": round(elapsed * 1000, 2),
+        }
+        if cascade is not None:
+            summary["escalated"] = escalated
+        if images != "none":
+            summary["heatmap"] = await run_in_threadpool(_slide_heatmap, canvas, array, images)
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+DIAGNOSES = ("Infectado", "No infectado")
+
+#Runs in a thread: one eager forward -> (embeddings [B,512], logits [B,2]).
+#Always the eager model: the other backends only return the logits
+def _embed_batch(batch):
+    from architecture.model_architecture import forward_features
+
+    model = get_model()
+    timer = StageTimer()
+    with timer.stage("embed"), torch.no_grad():
+        features = forward_features(model, batch)
+        outputs = model.fc(features)
+    observe_stages(timer.stages)
+    BATCH_SIZE.observe(batch.shape[0], "embed")
+    return features, outputs
+
+def _embedding_list(vector, decimals=5):
+    return [round(v, decimals) for v in vector.tolist()]
+
+#Adds embeddings to the index with the model's prediction; label = the diagnosis confirmed by a reviewer
+def _store_embeddings(features, lines, label=None):
+    return embedding_index.add(
+        features.numpy(),
+        filenames=[line["filename"] for line in lines],
+        predictions=[line["prediction"] for line in lines],
+        confidences=[line["confidence"] for line in lines],
+        labels=[label] * len(lines),
+    )
+
+def _check_label(label):
+    if label is not None and label not in DIAGNOSES:
+        raise HTTPException(status_code=400, detail=f"label must be one of {', '.join(DIAGNOSES)}")
+
+#Index row as returned by the API
+def _neighbor(row):
+    return dict(row, created=datetime.fromtimestamp(row["created"]).isoformat(timespec="seconds"))
+
+async def _embed_upload(file):
+    image_bytes = await read_upload(file, int(config.MAX_UPLOAD_MB * 2**20))
+    try:
+        tensor, _ = await _decode(get_pool(), decode_tensor_stage, image_bytes)
+        features, outputs = await get_forward_pool().run(_embed_batch, tensor)
+    except PoolFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    line = build_batch_results([(0, file.filename)], outputs)[0]
+    del line["index"]
+    return features, line
+
+#512-d penultimate-layer vector (the input of model.fc) of one image, with its prediction.
+#store=true adds it to the index for /similar; label: diagnosis confirmed by a reviewer
+@app.post("/embed")
+async def embed(file: UploadFile = File(...), store: bool = False, label: str = None):
+    _check_label(label)
+    features, line = await _embed_upload(file)
+    line["embedding"] = _embedding_list(features[0])
+    if store:
+        line["id"] = (await run_in_threadpool(_store_embeddings, features, [line], label))[0]
+    return line
+
+#Batch mode of /embed: several files and/or zips, one NDJSON line per image (as /predict/batch).
+#embeddings=false leaves the vectors out of the response (e.g. to only fill the index)
+@app.post("/embed/batch")
+async def embed_batch(files: List[UploadFile] = File(...), batch_size: int = config.STREAM_BATCH_SIZE,
+                      store: bool = False, label: str = None, embeddings: bool = True):
+    _check_label(label)
+    batch_size = max(1, min(batch_size, config.STREAM_MAX_BATCH_SIZE))
+    _reject_if_busy()
+    pool = get_pool()
+
+    async def stream():
+        iterator = _iter_upload_images(files)
+        start = time.perf_counter()
+        total = errors = stored = 0
+        while True:
+            items = await run_in_threadpool(_next_chunk, iterator, batch_size)
+            if not items:
+                break
+            kept, tensor, error_lines = await pool.run(decode_batch_stage, items, None, wait_for_slot=True)
+            for line in error_lines:
+                errors += 1
+                yield json.dumps(line) + "\n"
+            if tensor is None:
+                continue
+            features, outputs = await get_forward_pool().run(_embed_batch, tensor, wait_for_slot=True)
+            lines = build_batch_results(kept, outputs)
+            ids = await run_in_threadpool(_store_embeddings, features, lines, label) if store else [None] * len(lines)
+            for line, vector, embedding_id in zip(lines, features, ids):
+                total += 1
+                if embeddings:
+                    line["embedding"] = _embedding_list(vector)
+                if embedding_id is not None:
+                    line["id"] = embedding_id
+                    stored += 1
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "images": total,
+            "errors": errors,
+            "stored": stored,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "images_per_sec": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+#The k stored cells most similar (cosine of the embeddings) to an uploaded image, with their
+#prediction / reviewer label. exact=true scans the whole index even when IVF lists are trained
+@app.post("/similar")
+async def similar(file: UploadFile = File(...), k: int = 10, exact: bool = False):
+    k = max(1, min(k, 100))
+    features, line = await _embed_upload(file)
+    start = time.perf_counter()
+    neighbors = await run_in_threadpool(embedding_index.search, features[0].numpy(), k, None, exact)
+    line["search_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    line["neighbors"] = [_neighbor(row) for row in neighbors[0]]
+    return line
+
+#Same for a cell already in the index (itself left out)
+@app.get("/similar/{embedding_id}")
+async def similar_stored(embedding_id: int, k: int = 10, exact: bool = False):
+    k = max(1, min(k, 100))
+    vector = await run_in_threadpool(embedding_index.vector, embedding_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Embedding not found")
+    row = await run_in_threadpool(embedding_index.get, embedding_id)
+    start = time.perf_counter()
+    neighbors = await run_in_threadpool(embedding_index.search, vector, k + 1, None, exact)
+    return {
+        **_neighbor(row),
+        "search_ms": round((time.perf_counter() - start) * 1000, 2),
+        "neighbors": [_neighbor(row) for row in neighbors[0] if row["id"] != embedding_id][:k],
+    }
+
+#Response tiers of /predict, cheapest first; each one returns everything the previous one does.
+#Measured with benchmarks/bench_api.py --detail (1 CPU, random weights): p50 of one request
+#at a time, and throughput with 8 concurrent clients
+#  label   prediction, confidence, class_id   decode + no-grad forward (backend)    63 ms  17.9 req/s
+#  probs   + probabilities of both classes    same work as label                     65 ms  18.0 req/s
+#  cam     + "cam": 7x7 Grad-CAM in [0,1]     eager forward + backward               67 ms  10.8 req/s
+#  images  + original / heatmap / overlay     + rendering and PNG/base64 (images=)   84 ms  11.9 req/s
+#  pdf     + report_id of the queued PDF      + the PDF, in a background job         98 ms   4.6 req/s
+#The ResNet18 forward dominates one request at a time; under load label/probs batch up to
+#MALARIA_LABEL_MAX_BATCH_SIZE without a backward pass, and pdf shares the CPU with its PDFs
+DETAIL_TIERS = ("label", "probs", "cam", "images", "pdf")
+
+#Requests without detail= keep their old meaning: report=true -> pdf, images=inline|url -> images,
+#images=none -> label (the Grad-CAM it used to compute was never returned)
+def _legacy_detail(images, report):
+    if report:
+        return "pdf"
+    return "images" if images != "none" else "label"
 
 #we are going to send an image
 @app.post("/predict")
-async def predict_malaria(file: UploadFile = File(...)):#=File(...): Tells FastAPI "expect a required file"
+#detail=label|probs|cam|images|pdf (see DETAIL_TIERS); default from images / report
+#images=inline (base64 in the JSON, default) | url (GET /artifacts/... renders on demand) | none
+#report=false skips the PDF; otherwise it is queued and the response carries report_id / report_url
+#tta=on averages the 8 flips/rotations of the cell (one batched forward), tta=auto only when the
+#plain prediction is below MALARIA_TTA_THRESHOLD confidence; the result then has "tta": agreement / uncertainty
+async def predict_malaria(file: UploadFile = File(...), images: str = "inline", report: bool = True, detail: str = None,
+                          tta: str = config.TTA_MODE):#=File(...): Tells FastAPI "expect a required file"
+    if images not in IMAGE_MODES or images == "pil":
+        raise HTTPException(status_code=400, detail="images must be 'inline', 'url' or 'none'")
+    if tta not in TTA_MODES:
+        raise HTTPException(status_code=400, detail=f"tta must be one of {', '.join(TTA_MODES)}")
+    if detail is None:
+        detail = _legacy_detail(images, report)
+    elif detail not in DETAIL_TIERS:
+        raise HTTPException(status_code=400, detail=f"detail must be one of {', '.join(DETAIL_TIERS)}")
+
     # Validate file type
     #If the content type EXISTS (not None) AND is NOT an image → error
     if file.content_type and not file.content_type.startswith("image/"):
@@ -165,9 +1162,11 @@ async def predict_malaria(file: UploadFile = File(...)):#=File(...): Tells FastA
         )
     
     # Read image bytes
-    #file.read() may take time (large file)
+    #file.read() may take time (large file); more than MALARIA_MAX_UPLOAD_MB -> 413 without reading the rest
     try:
-        image_bytes = await file.read()#read the entire file and await: "Wait for me to finish reading" (because it may take time)
+        image_bytes = await read_upload(file, int(config.MAX_UPLOAD_MB * 2**20))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
     
@@ -177,7 +1176,11 @@ async def predict_malaria(file: UploadFile = File(...)):#=File(...): Tells FastA
     pdf_path = generate_pdf(result, file.filename)
     result["pdf_path"] = pdf_path """
 
-    result = process_prediction_internal(image_bytes, file.filename)
+    try:
+        result = await process_prediction_batched(image_bytes, file.filename, images, report, detail, tta)
+    except (PoolFullError, ReportQueueFullError) as e:
+        # Backpressure: the client should retry later instead of piling up requests
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     
     return JSONResponse(
         content={
@@ -187,12 +1190,14 @@ async def predict_malaria(file: UploadFile = File(...)):#=File(...): Tells FastA
         }
     )
 
-import gradio as gr
-from ui.gradio_app import demo
+# Montar Gradio en FastAPI (MALARIA_UI=0: API only, gradio is never imported)
+if config.UI_ENABLED:
+    import gradio as gr
+    from ui.gradio_app import build_demo
 
-# Montar Gradio en FastAPI
-#app = gr.mount_gradio_app(app, demo, path="/")
-app = gr.mount_gradio_app(app, demo, path="/gradio")
+    demo = build_demo(process_prediction_internal, image_cache_key, get_cached_result)
+    #app = gr.mount_gradio_app(app, demo, path="/")
+    app = gr.mount_gradio_app(app, demo, path="/gradio")
 
 # Run with: uvicorn main:app --reload
 #cd D:\malaria_inference_project\python\malaria_clasification\src
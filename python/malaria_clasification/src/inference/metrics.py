@@ -0,0 +1,165 @@
+#Latency histograms and counters exported in the Prometheus text format (GET /metrics).
+#
+#No prometheus_client dependency: a histogram here is a list of bucket counters
+#plus sum/count, which is all the exposition format needs. Gauges that already
+#live elsewhere (batch queue depth, worker pool, cache, report jobs) are read
+#at scrape time through collectors registered with add_collector().
+#
+#Everything is per process: with inference/serve.py each worker exposes its own.
+
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; from sub-millisecond stages (base64) up to slow Grad-CAM batches and PDFs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}# label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = _labels(self.label_names, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{{{labels + ',' + le if labels else le}}} {cumulative}")
+            lines.append(f"{self.name}_sum{_braces(labels)} {values[-1]:.6f}")
+            lines.append(f"{self.name}_count{_braces(labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_braces(_labels(self.label_names, label_values))} {value}")
+        return lines
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _braces(labels):
+    return f"{{{labels}}}" if labels else ""
+
+
+STAGE_SECONDS = Histogram(
+    "malaria_stage_seconds", "Duration of each stage of a prediction", ("stage",))
+REQUEST_SECONDS = Histogram(
+    "malaria_request_seconds", "End-to-end HTTP request latency", ("route", "method", "status"))
+# kind: gradcam (micro-batched /predict with Grad-CAM), label (no-grad /predict), batch (/predict/batch),
+# slide (/predict/slide chunks), embed (/embed, /embed/batch)
+BATCH_SIZE = Histogram(
+    "malaria_batch_size", "Images per batched forward pass, by kind of batch", ("kind",), buckets=BATCH_SIZE_BUCKETS)
+REQUESTS = Counter(
+    "malaria_requests_total", "HTTP requests", ("route", "method", "status"))
+
+_metrics = [STAGE_SECONDS, REQUEST_SECONDS, BATCH_SIZE, REQUESTS]
+_collectors = []
+
+
+def observe_stages(timings_ms):
+    """Registra un diccionario {etapa: ms} (StageTimer.stages) en el histograma de etapas."""
+    for stage, elapsed_ms in timings_ms.items():
+        STAGE_SECONDS.observe(elapsed_ms / 1000, stage)
+
+
+def add_collector(collect):
+    """collect() -> iterable de (nombre, tipo, ayuda, valor); se lee en cada scrape.
+
+    valor es un número o un dict {(("label", "valor"), ...): número} para series con labels."""
+    _collectors.append(collect)
+
+
+def _render_collected(name, kind, help_text, value):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    if isinstance(value, dict):
+        for labels, v in sorted(value.items()):
+            names = [n for n, _ in labels]
+            lines.append(f"{name}{_braces(_labels(names, [x for _, x in labels]))} {v}")
+    else:
+        lines.append(f"{name} {value}")
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            for name, kind, help_text, value in collect():
+                lines.extend(_render_collected(name, kind, help_text, value))
+        except Exception as e:
+            lines.append(f"# collector error: {_escape(e)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia y estado de cada petición HTTP (hasta el último byte enviado,
+    así que las respuestas en streaming cuentan completas). La ruta es la plantilla
+    (/reports/{report_id}), no la URL, para no crear una serie por id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            labels = (route, scope["method"], str(status[0]))
+            REQUEST_SECONDS.observe(time.perf_counter() - start, *labels)
+            REQUESTS.inc(*labels)
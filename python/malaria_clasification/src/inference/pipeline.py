@@ -0,0 +1,179 @@
+#CPU stages of a prediction that do not need the model:
+#decode + preprocess before the forward pass, images + PDF after it.
+#
+#Kept apart from inference/main.py on purpose: this module is what the worker
+#pool runs, and in "process" mode every worker imports it, so it must not load
+#the model, FastAPI or Gradio. fpdf is only imported when the first report is built.
+
+import torch
+from PIL import Image
+
+from processing.image import image_to_base64, overlay_heatmap
+from processing.image import prepare_visualization_data, render_visualizations
+from processing.artifacts import artifact_urls
+from processing.preprocess import IMAGE_SIZE, ImageTooLargeError, decode_image, preprocess_batch, preprocess_image
+
+from inference import config
+from inference.timing import StageTimer
+
+#Decode of an uploaded cell image: dimensions checked before decoding, large JPEGs at reduced scale
+def decode_upload(image_bytes: bytes):
+    return decode_image(image_bytes, max_pixels=config.MAX_IMAGE_PIXELS,
+                        reduce_to=IMAGE_SIZE if config.JPEG_DRAFT else None)
+
+#Label-only tiers (/predict?detail=label|probs): nothing is drawn, so no PIL copy of the image.
+#Returns (tensor [1,3,224,224], timings)
+def decode_tensor_stage(image_bytes: bytes):
+    timer = StageTimer()
+    with timer.stage("decode"):
+        array = decode_upload(image_bytes)
+    with timer.stage("preprocess"):
+        tensor_imagen = preprocess_image(array)
+    return tensor_imagen, timer.stages
+
+#Same, timed, for the worker pool: returns (original_image, tensor, timings)
+def decode_stage(image_bytes: bytes):
+    timer = StageTimer()
+    with timer.stage("decode"):
+        array = decode_upload(image_bytes)
+        original_image = Image.fromarray(array)
+    with timer.stage("preprocess"):
+        tensor_imagen = preprocess_image(array)
+    return original_image, tensor_imagen, timer.stages
+
+#Decode + preprocess a chunk of (index, filename, bytes) into ONE batch tensor (/predict/batch).
+#out: optional float32 [>=N,3,224,224] buffer to write into (thread pool only, see inference/arena.py)
+#Returns (kept [(index, filename)], tensor [N,3,224,224] or None, error lines)
+def decode_batch_stage(items, out=None):
+    arrays, kept, errors = [], [], []
+    for index, filename, image_bytes in items:
+        try:
+            if isinstance(image_bytes, Exception):
+                raise image_bytes
+            arrays.append(decode_upload(image_bytes))
+            kept.append((index, filename))
+        except Exception as e:
+            # Same codes as /predict: 413 for a file or image over the limits, 400 for anything else
+            errors.append({"index": index, "filename": filename, "error": f"Error processing image: {e}",
+                           "status": 413 if isinstance(e, ImageTooLargeError) else 400})
+    tensor = preprocess_batch(arrays, out=out) if arrays else None
+    return kept, tensor, errors
+
+#Result lines of a batch: one softmax for the whole batch, then one dict per image
+def build_batch_results(kept, outputs):
+    probabilities = torch.softmax(outputs, dim=1)
+    confidences, predictions = probabilities.max(dim=1)
+    lines = []
+    for (index, filename), prediction, confidence, probs in zip(
+            kept, predictions.tolist(), confidences.tolist(), probabilities.tolist()):
+        lines.append({
+            "index": index,
+            "filename": filename,
+            "prediction": "Infectado" if prediction == 0 else "No infectado",
+            "confidence": round(confidence * 100, 2),
+            "class_id": prediction,
+            "probabilities": [round(p, 4) for p in probs],
+        })
+    return lines
+
+#Turns the logits of ONE image (shape [2] or [1,2]) into the response dictionary
+#with_probabilities=True also returns the softmax of both classes (like /predict/batch)
+def build_prediction_result(output, with_probabilities=False) -> dict:
+    if output.dim() == 1:
+        output = output.unsqueeze(0)
+    prediction = torch.argmax(output, dim=1).item()#Find the index with the highest value
+
+    # Get confidence score
+    probabilities = torch.softmax(output, dim=1)#Convert logits (raw numbers) to probabilities [0-1] For example: [-2.1, 3.4] → [0.15, 0.85]
+    confidence = probabilities.max().item()#Take the highest probability (that of the predicted class). .item(): Converts a tensor to a Python number (example: 0.85) This is the model's confidence level in its prediction.
+
+    # Map prediction to label
+    predicted_class = "Infectado" if prediction == 0 else "No infectado"
+
+    result = {
+        "prediction": predicted_class,
+        "confidence": round(confidence * 100, 2),#Confidence in percentage (85.67%)
+        "class_id": prediction
+    }
+    if with_probabilities:
+        result["probabilities"] = [round(p, 4) for p in probabilities[0].tolist()]
+    return result
+
+#Grad-CAM as plain numbers (/predict?detail=cam): [h][w] in [0,1], 7x7 for the ResNet18
+def cam_to_list(heatmap, decimals=3):
+    # float64 first: rounded float32 values print as 0.09700000286102295
+    return None if heatmap is None else heatmap.astype("float64").round(decimals).tolist()
+
+#How the images travel in a response:
+#  "inline" base64 data URIs (default), "url" links to /artifacts/{id}/{kind},
+#  "pil" PIL images for in-process callers (Gradio), "none" label only
+IMAGE_MODES = ("inline", "url", "pil", "none")
+
+#Adds the Grad-CAM images to an existing result (modifies it in place)
+#timer: optional StageTimer, gets "overlay" (rendering) and "base64" (PNG encoding)
+def add_visualizations(result, original_image, heatmap, images="inline", artifact_id=None, timer=None):
+    timer = timer or StageTimer()
+    if images == "none":
+        return result
+
+    if images == "url":
+        urls = artifact_urls(artifact_id, has_heatmap=heatmap is not None)
+        result["artifact_id"] = artifact_id
+        result["original_image"] = urls["original"]
+        if heatmap is not None:
+            result["heatmap"] = urls["heatmap"]
+            result["overlay"] = urls["overlay"]
+    elif heatmap is None:
+        with timer.stage("base64"):
+            result["original_image"] = original_image if images == "pil" else image_to_base64(original_image)
+        return result
+    elif images == "pil":
+        with timer.stage("overlay"):
+            visualization_data = render_visualizations(original_image, heatmap)
+        result.update({
+            "original_image": visualization_data["original"],
+            "heatmap": visualization_data["heatmap"],
+            "overlay": visualization_data["overlay"],
+        })
+    else:
+        # Preparar visualizaciones
+        visualization_data = prepare_visualization_data(original_image, heatmap, timer)
+
+        # Agregar visualizaciones al resultado
+        result.update({
+            "original_image": visualization_data["original"],
+            "heatmap": visualization_data["heatmap"],
+            "overlay": visualization_data["overlay"],
+        })
+
+    result["explanation"] = f"Las áreas en rojo/amarillo muestran las regiones que más influyeron en la predicción '{result['prediction']}'"
+    return result
+
+#The PDF embeds the overlay: reuse the one in the result when it is a real image,
+#otherwise (url / none modes) render just that one image for the report
+def _report_data(result, original_image, heatmap):
+    overlay = result.get("overlay")
+    if heatmap is not None and (overlay is None or (isinstance(overlay, str) and not overlay.startswith("data:"))):
+        return dict(result, overlay=overlay_heatmap(original_image, heatmap))
+    return result
+
+#Builds the PDF of a finished prediction, saves it in the report store and returns its
+#path (None on error). Run by the report job queue (pdf/report_jobs.py), off the request path
+def render_report(result, original_image, heatmap, filename, report_id=None):
+    from pdf.pdf_generator import generate_pdf
+    return generate_pdf(_report_data(result, original_image, heatmap), filename, report_id)
+
+#One PDF summarizing many results (/predict/batch?report=true)
+def render_batch_report(results, report_id=None):
+    from pdf.pdf_generator import generate_batch_pdf
+    return generate_batch_pdf(results, report_id=report_id)
+
+#Everything after the forward pass, timed, for the worker pool.
+#report=False skips the PDF (the API queues it as a background job instead)
+def finish_stage(result, original_image, heatmap, filename, images="inline", artifact_id=None, report=True):
+    timer = StageTimer()
+    add_visualizations(result, original_image, heatmap, images, artifact_id, timer)
+    if report:
+        with timer.stage("pdf"):
+            result["pdf_path"] = render_report(result, original_image, heatmap, filename)
+    return result, timer.stages
@@ -0,0 +1,134 @@
+#Multi-process server with ONE copy of the model weights.
+#
+#`uvicorn --workers N` starts N fresh interpreters and each one runs
+#create_model() + torch.load(), so RSS grows with every worker. Here the parent
+#loads the eager fp32 weights once, moves them to shared
+#memory and then forks the workers: they all read the same pages and only
+#their own activations/buffers are private.
+#
+#What is shared is the eager model: Grad-CAM always runs on it, and with
+#MALARIA_BACKEND=eager it is also the predict model. The other backends are
+#built by each worker after the fork (tracing, INT8 calibration and the ONNX
+#export all run the model, which must not happen in the parent) and hold their
+#own copy of the weights: frozen/folded TorchScript constants, int8 tensors or
+#an ONNX Runtime session.
+#
+#Run from src/:
+#   python -m inference.serve --workers 4 --threads-per-worker 2 [--pin-cores]
+#(the same options can be set with MALARIA_SERVER_WORKERS / MALARIA_TORCH_THREADS / MALARIA_PIN_CORES)
+
+import argparse
+import os
+import signal
+import socket
+import sys
+
+import uvicorn
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from inference import config
+from inference.cpu import available_cores, configure_threads
+
+
+def _bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _threads_per_worker(workers, requested):
+    # By default split the cores between the workers so the intra-op threads of
+    # N processes do not fight for the same cores
+    if requested > 0:
+        return requested
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _worker_cores(slot, threads):
+    # Worker `slot` gets its own consecutive block of cores (wrapping if there are fewer cores than threads)
+    cores = available_cores()
+    return [cores[(slot * threads + i) % len(cores)] for i in range(threads)]
+
+
+def _run_worker(app, sock, threads, cores=None):
+    configure_threads(threads, cores=cores)
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def serve(host="0.0.0.0", port=8000, workers=2, threads_per_worker=0, pin_cores=False):
+    # Load the weights once in the parent and share them. No forward pass here: each
+    # worker builds its backend and warms up in its own startup (OpenMP thread
+    # pools do not survive fork)
+    from inference import main
+
+    main.load_weights().share_memory()
+    threads = _threads_per_worker(workers, threads_per_worker)
+    sock = _bind_socket(host, port)
+    print(f"Serving on {host}:{port} with {workers} workers x {threads} torch threads"
+          + (" (pinned to cores)" if pin_cores else ""))
+
+    children = {}
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            # Child: restore default signal handling and serve until told to stop
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                _run_worker(main.app, sock, threads, _worker_cores(slot, threads) if pin_cores else None)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+
+    # Supervise: replace workers that die unexpectedly
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            spawn(slot)
+
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Malaria API with shared model weights")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    parser.add_argument("--threads-per-worker", type=int, default=config.TORCH_THREADS,
+                        help="torch.set_num_threads per worker (0 = cores / workers)")
+    parser.add_argument("--pin-cores", action="store_true", default=config.PIN_CORES,
+                        help="pin each worker to its own block of cores (MALARIA_PIN_CORES)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.threads_per_worker, args.pin_cores)
+
+
+if __name__ == "__main__":
+    main()
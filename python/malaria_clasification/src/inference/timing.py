@@ -0,0 +1,26 @@
+#Small helper to time the stages of a request (decode, forward, PDF...)
+
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Acumula la duración (ms) de cada etapa en un diccionario."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, elapsed_ms):
+        self.stages[name] = round(self.stages.get(name, 0.0) + elapsed_ms, 2)
+
+    def update(self, stages):
+        for name, elapsed_ms in stages.items():
+            self.add(name, elapsed_ms)
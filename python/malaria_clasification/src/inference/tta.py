@@ -0,0 +1,66 @@
+#Test-time augmentation: the 8 flips / 90 degree rotations of a cell.
+#
+#A cell on a smear has no "up", so the model should give the same answer for
+#every rotation and mirror image of it. All the views go through the model as
+#ONE batch (a batched forward of 8 costs far less than 8 forwards of 1 on CPU),
+#their softmax outputs are averaged and the spread between views is reported as
+#an uncertainty score. In "auto" mode only inputs whose plain prediction is below
+#a confidence threshold get the extra views, so confident cells cost 1x.
+
+import torch
+
+TTA_MODES = ("off", "on", "auto")
+VIEWS = 8
+
+
+def augment(batch, include_identity=True):
+    """
+    [B,3,H,W] -> [8B,3,H,W]: las 4 rotaciones de la imagen y las 4 de su espejo, vista a vista.
+
+    include_identity=False omite la primera vista (la imagen tal cual) cuando ya se tienen sus logits.
+    """
+    views = [torch.rot90(image, k, dims=(2, 3)) for image in (batch, batch.flip(3)) for k in range(4)]
+    return torch.cat(views if include_identity else views[1:])
+
+
+def needs_tta(logits, threshold):
+    """True si la confianza (max softmax) de alguna imagen está por debajo de threshold."""
+    if logits.dim() == 1:
+        logits = logits.unsqueeze(0)
+    return bool((torch.softmax(logits, dim=1).max(dim=1).values < threshold).any())
+
+
+def aggregate(logits, views=VIEWS):
+    """
+    Logits [views*B,2] (ordenados vista a vista) -> (logits [B,2], B dicts de incertidumbre).
+
+    Los logits devueltos son log(media de softmax), así que build_prediction_result
+    da la probabilidad media. agreement: fracción de vistas con la clase final;
+    uncertainty: 2 * desviación estándar de la probabilidad de infección entre
+    vistas (0 = todas iguales, 1 = la mitad dice 0 y la otra mitad 1).
+    """
+    probabilities = torch.softmax(logits.detach().float(), dim=1).reshape(views, -1, logits.shape[1])
+    mean = probabilities.mean(dim=0)
+    predicted = mean.argmax(dim=1)
+    agreement = (probabilities.argmax(dim=2) == predicted).float().mean(dim=0)
+    spread = probabilities[..., 0].std(dim=0, unbiased=False) * 2
+    stats = [
+        {"views": views, "agreement": round(a, 4), "uncertainty": round(s, 4)}
+        for a, s in zip(agreement.tolist(), spread.tolist())
+    ]
+    return mean.clamp_min(1e-12).log(), stats
+
+
+def run_tta(forward, batch, logits=None):
+    """
+    Una sola pasada de forward (sin gradientes) con las vistas de batch [B,3,H,W].
+
+    logits: los de las imágenes originales si ya se calcularon (p. ej. con Grad-CAM);
+    entonces solo se evalúan las 7 vistas restantes.
+    """
+    with torch.no_grad():
+        if logits is None:
+            logits = forward(augment(batch))
+        else:
+            logits = torch.cat([logits.detach().reshape(batch.shape[0], -1), forward(augment(batch, include_identity=False))])
+    return aggregate(logits)
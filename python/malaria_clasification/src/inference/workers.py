@@ -0,0 +1,86 @@
+#Bounded worker pool for the blocking parts of a request.
+#
+#PIL decoding, PNG/base64 encoding and fpdf are synchronous; running them
+#directly inside an `async def` endpoint blocks uvicorn's event loop, so /health
+#and the mounted Gradio app stop answering while a prediction runs. The pool
+#runs them in threads (or processes) and refuses new work once `max_queue`
+#jobs are already waiting, so overload turns into fast 429s instead of an
+#ever-growing backlog.
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class PoolFullError(Exception):
+    """Se lanza cuando la cola del pool está llena (el endpoint responde 429)."""
+
+
+class InferencePool:
+
+    def __init__(self, kind="thread", max_workers=0, max_queue=64):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {kind!r} (use 'thread' or 'process')")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max(0, max_queue)
+        self._executor = None
+        self._in_flight = 0# only touched from the event loop thread
+        self.rejected = 0
+        self.completed = 0
+
+    def _get_executor(self):
+        # Created on first use so forked server workers each get their own
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="inference"
+                )
+        return self._executor
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def is_full(self):
+        return self._in_flight >= self.capacity
+
+    async def run(self, fn, *args, wait_for_slot=False, **kwargs):
+        """Ejecuta fn(*args, **kwargs) en el pool sin bloquear el event loop.
+
+        Con wait_for_slot=True espera a que haya sitio en vez de lanzar PoolFullError
+        (para trabajos ya aceptados, como una respuesta en streaming a medias)."""
+        while self.is_full():
+            if not wait_for_slot:
+                self.rejected += 1
+                raise PoolFullError(f"Inference queue is full ({self.capacity} jobs)")
+            await asyncio.sleep(0.005)
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            self._in_flight -= 1
+            self.completed += 1
+
+    def snapshot(self):
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - self.max_workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,92 +1,167 @@
 # pdf_generator.py
+# Los reportes se construyen en memoria: las imágenes (PIL, bytes PNG o base64)
+# se insertan directamente desde buffers y el PDF se escribe a disco una sola vez,
+# en el almacén de reportes (pdf/report_store.py).
 from fpdf import FPDF
 from datetime import datetime
 import base64
 import io
+import logging
 from PIL import Image
-import os
 
-def create_simple_report(prediction_data, filename):
-    pdf = FPDF()
+from pdf.report_store import get_default_store
+
+logger = logging.getLogger(__name__)
+
+# Core font: built into fpdf2, nothing to load or embed per report
+# ("Arial" is only an alias of it and prints a deprecation warning)
+FONT = "helvetica"
+THUMBNAILS_PER_ROW = 4
+
+
+class ReportPDF(FPDF):
+    """Plantilla de página de todos los reportes: título en la cabecera y número de página al pie."""
+
+    def __init__(self, title="Reporte Malaria"):
+        super().__init__()
+        self.report_title = title
+        self.set_auto_page_break(auto=True, margin=15)
+
+    def header(self):
+        self.set_font(FONT, 'B', 16)
+        self.cell(0, 10, self.report_title, new_x="LMARGIN", new_y="NEXT", align='C')
+        self.ln(5)
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font(FONT, '', 8)
+        self.cell(0, 8, f'Página {self.page_no()}', align='C')
+
+
+# Convierte lo que venga en el resultado a algo que fpdf2 acepta sin tocar el disco
+def to_pdf_image(image):
+    if image is None or isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return io.BytesIO(image)
+    if isinstance(image, str):
+        # Data URI o base64 plano
+        image_data = image.split(',', 1)[1] if image.startswith('data:') else image
+        return io.BytesIO(base64.b64decode(image_data))
+    raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+
+def _add_image(pdf, image, title, width=80):
+    image = to_pdf_image(image)
+    if image is None:
+        return
+    try:
+        pdf.set_font(FONT, 'B', 12)
+        pdf.cell(0, 10, title, new_x="LMARGIN", new_y="NEXT")
+        info = pdf.image(image, x=10, y=pdf.get_y(), w=width)
+        pdf.set_y(pdf.get_y() + info.rendered_height + 10)
+    except Exception as e:
+        logger.warning("Error agregando imagen %s: %s", title, e)
+
+
+def build_report(prediction_data, filename):
+    """Reporte de una muestra; devuelve el PDF como bytes."""
+    pdf = ReportPDF()
     pdf.add_page()
-    pdf.set_font('Arial', 'B', 16)
-    
-    # Título
-    pdf.cell(0, 10, 'Reporte Malaria', ln=True, align='C')
-    pdf.ln(10)
-    
+
     # Información básica
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(0, 10, f'Archivo: {filename}', ln=True)
-    pdf.cell(0, 10, f'Fecha: {datetime.now().strftime("%d/%m/%Y %H:%M")}', ln=True)
+    pdf.set_font(FONT, '', 12)
+    pdf.cell(0, 10, f'Archivo: {filename}', new_x="LMARGIN", new_y="NEXT")
+    pdf.cell(0, 10, f'Fecha: {datetime.now().strftime("%d/%m/%Y %H:%M")}', new_x="LMARGIN", new_y="NEXT")
     pdf.ln(5)
-    
+
     # Resultado
-    pdf.set_font('Arial', 'B', 14)
+    pdf.set_font(FONT, 'B', 14)
     prediction = prediction_data.get('prediction', 'N/A')
     confidence = prediction_data.get('confidence', 0)
-    
-    pdf.cell(0, 10, f'Resultado: {prediction}', ln=True)
-    pdf.cell(0, 10, f'Confianza: {confidence}%', ln=True)
+
+    pdf.cell(0, 10, f'Resultado: {prediction}', new_x="LMARGIN", new_y="NEXT")
+    pdf.cell(0, 10, f'Confianza: {confidence}%', new_x="LMARGIN", new_y="NEXT")
     pdf.ln(10)
-    
-    # Función para agregar imagen desde base64
-    def add_image_from_base64(base64_str, title, y_position):
-        if not base64_str:
-            return y_position
-            
-        try:
-            # Decodificar base64
-            if base64_str.startswith('data:'):
-                image_data = base64_str.split(',')[1]
-            else:
-                image_data = base64_str
-            
-            image_bytes = base64.b64decode(image_data)
-            img = Image.open(io.BytesIO(image_bytes))
-            
-            # Guardar temp
-            temp_path = f"temp_{title.lower()}.png"
-            img.save(temp_path)
-            
-            # Agregar al PDF
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, title, ln=True)
-            pdf.image(temp_path, x=10, y=pdf.get_y(), w=80)
-            
-            # Limpiar temp
-            os.remove(temp_path)
-            
-            return pdf.get_y() + 60  # Espacio para la imagen
-            
-        except Exception as e:
-            print(f"Error agregando imagen {title}: {e}")
-            return y_position
-    
-    # Agregar imágenes
-    current_y = pdf.get_y()
-    
+
     # Imagen overlay
-    overlay_b64 = prediction_data.get('overlay')
-    if overlay_b64:
-        current_y = add_image_from_base64(overlay_b64, "Imagen con Analisis:", current_y)
-        pdf.set_y(current_y + 10)
-    
-    # Crear directorio reports si no existe
-    os.makedirs("reports", exist_ok=True) 
-    # Guardar PDF
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    pdf_path = f"reports\\reporte_{timestamp}.pdf"
-
-    #pdf_path = f"python\\malaria_clasification\\src\\reports\\reporte_{timestamp}.pdf"
-    pdf.output(pdf_path)    
-    
+    _add_image(pdf, prediction_data.get('overlay'), "Imagen con Análisis:")
+
+    return bytes(pdf.output())
+
+
+def build_batch_report(results, title="Resumen de la lámina", thumbnails=None):
+    """
+    Un solo PDF para muchas muestras (por ejemplo todas las células de una lámina).
+
+    results: lista de dicts con filename, prediction, confidence (como las líneas de /predict/batch).
+    thumbnails: imágenes opcionales (PIL / bytes / base64) por filename, se dibujan en una cuadrícula.
+    """
+    pdf = ReportPDF(title)
+    pdf.add_page()
+
+    total = len(results)
+    infected = sum(1 for r in results if r.get('class_id') == 0)
+
+    pdf.set_font(FONT, '', 12)
+    pdf.cell(0, 8, f'Fecha: {datetime.now().strftime("%d/%m/%Y %H:%M")}', new_x="LMARGIN", new_y="NEXT")
+    pdf.cell(0, 8, f'Muestras analizadas: {total}', new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font(FONT, 'B', 14)
+    rate = infected / total * 100 if total else 0.0
+    pdf.cell(0, 10, f'Infectadas: {infected} ({rate:.2f}%)', new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(5)
+
+    # Tabla de resultados
+    pdf.set_font(FONT, '', 10)
+    with pdf.table(col_widths=(100, 50, 40), text_align=("LEFT", "LEFT", "RIGHT")) as table:
+        table.row(("Archivo", "Resultado", "Confianza"))
+        for r in results:
+            table.row((str(r.get('filename', '')), str(r.get('prediction', 'N/A')), f"{r.get('confidence', 0)}%"))
+
+    if thumbnails:
+        pdf.add_page()
+        pdf.set_font(FONT, 'B', 12)
+        pdf.cell(0, 10, "Imágenes:", new_x="LMARGIN", new_y="NEXT")
+        size = (pdf.epw - 5 * (THUMBNAILS_PER_ROW - 1)) / THUMBNAILS_PER_ROW
+        pdf.set_font(FONT, '', 7)
+        for i, (name, image) in enumerate(thumbnails.items()):
+            column = i % THUMBNAILS_PER_ROW
+            if column == 0 and i > 0:
+                pdf.ln(size + 8)
+            if pdf.will_page_break(size + 8):
+                pdf.add_page()
+            x = pdf.l_margin + column * (size + 5)
+            y = pdf.get_y()
+            pdf.image(to_pdf_image(image), x=x, y=y, w=size, h=size)
+            pdf.set_xy(x, y + size)
+            pdf.cell(size, 5, str(name)[:30], align='C')
+            pdf.set_xy(pdf.l_margin, y)
+
+    return bytes(pdf.output())
+
+
+def save_report(pdf_bytes, prefix="reporte", report_id=None, **metadata):
+    """Guarda el PDF ya construido en el almacén de reportes (pdf/report_store.py) y devuelve su ruta."""
+    _, pdf_path = get_default_store().save(pdf_bytes, kind=prefix, report_id=report_id, **metadata)
     return pdf_path
 
+
+def create_simple_report(prediction_data, filename, report_id=None):
+    return save_report(build_report(prediction_data, filename), report_id=report_id, filename=filename,
+                       prediction=prediction_data.get('prediction'), confidence=prediction_data.get('confidence'))
+
 # Función para llamar desde tu API
-def generate_pdf(prediction_result, filename):
+def generate_pdf(prediction_result, filename, report_id=None):
+    try:
+        return create_simple_report(prediction_result, filename, report_id)
+    except Exception as e:
+        logger.exception("Error generating the PDF: %s", e)
+        return None
+
+# Reporte de varias muestras en un único PDF
+def generate_batch_pdf(results, title="Resumen de la lámina", thumbnails=None, report_id=None):
     try:
-        return create_simple_report(prediction_result, filename)
+        return save_report(build_batch_report(results, title, thumbnails), prefix="reporte_lamina", report_id=report_id)
     except Exception as e:
-        print(f"Error: {e}")
-        return None
\ No newline at end of file
+        logger.exception("Error generating the PDF: %s", e)
+        return None
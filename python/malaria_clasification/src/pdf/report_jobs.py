@@ -0,0 +1,136 @@
+# report_jobs.py
+# Generación de reportes PDF en segundo plano.
+#
+# /predict ya no espera a fpdf: encola el reporte, devuelve un report_id y un
+# pool de workers genera el PDF. El cliente consulta el estado en
+# GET /reports/{id} y lo descarga en GET /reports/{id}/download.
+#
+# Every pending job holds its whole result (base64 images, the PIL image) until
+# it is rendered, and PDFs are slower to render than /predict accepts them: at
+# most max_pending jobs are queued or running, submit() raises
+# ReportQueueFullError beyond that and the endpoint answers 429.
+#
+# With a store (pdf/report_store.py) the pending / running / error status is
+# also written to its SQLite index, which all server workers share: the job
+# dicts below only exist in the process that accepted the request.
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+logger = logging.getLogger(__name__)
+
+
+class ReportQueueFullError(Exception):
+    """Se lanza cuando ya hay max_pending reportes esperando (el endpoint responde 429)."""
+
+
+class ReportJobQueue:
+
+    def __init__(self, workers=2, max_jobs=1024, max_pending=64, store=None):
+        self.workers = workers
+        self.store = store# ReportStore shared with the other workers, or None
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending# 0 = no limit
+        self._executor = None
+        self._jobs = OrderedDict()# id -> dict with status, path, error, timings
+        self._pending = 0# queued or running
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Created on first use so forked server workers each get their own threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reports")
+        return self._executor
+
+    def submit(self, render, *args):
+        """
+        Encola render(*args, report_id=id) -> ruta del PDF (o None si falla). Devuelve el id del reporte.
+
+        El PDF se guarda con el mismo id en el almacén (pdf/report_store.py), así que
+        sigue disponible cuando este trabajo ya se ha olvidado.
+        """
+        report_id = uuid.uuid4().hex
+        job = {"status": PENDING, "path": None, "error": None, "created": time.time(), "render_ms": None}
+        with self._lock:
+            self._check_locked()
+            self._pending += 1
+            self._jobs[report_id] = job
+            self._evict()
+        # Before the id is returned, so any worker can answer the first poll
+        self._mark(report_id, PENDING)
+        self._get_executor().submit(self._run, report_id, job, render, args)
+        return report_id
+
+    def _mark(self, report_id, status, error=None):
+        if self.store is None:
+            return
+        try:
+            self.store.mark(report_id, status, error)
+        except Exception as e:
+            # The local status still works for polls that reach this worker
+            logger.warning("Could not record report %s as %s: %s", report_id, status, e)
+
+    def _run(self, report_id, job, render, args):
+        job["status"] = RUNNING
+        self._mark(report_id, RUNNING)
+        start = time.perf_counter()
+        try:
+            path = render(*args, report_id=report_id)
+            if path is None:
+                raise RuntimeError("The PDF could not be generated")
+            job["path"] = path
+            job["status"] = DONE
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = ERROR
+            self._mark(report_id, ERROR, job["error"])
+        finally:
+            with self._lock:
+                self._pending -= 1
+        job["render_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    def check(self):
+        """Lanza ReportQueueFullError si submit() no aceptaría otro reporte ahora mismo."""
+        with self._lock:
+            self._check_locked()
+
+    def _check_locked(self):
+        if self.max_pending and self._pending >= self.max_pending:
+            self.rejected += 1
+            raise ReportQueueFullError(f"Report queue is full ({self.max_pending} reports pending)")
+
+    def _evict(self):
+        # Forget the oldest finished jobs (their PDFs stay in the report store)
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for report_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[report_id]["status"] in (DONE, ERROR):
+                del self._jobs[report_id]
+
+    def get(self, report_id):
+        with self._lock:
+            job = self._jobs.get(report_id)
+            return dict(job) if job is not None else None
+
+    def __contains__(self, report_id):
+        with self._lock:
+            return report_id in self._jobs
+
+    def snapshot(self):
+        with self._lock:
+            counts = {PENDING: 0, RUNNING: 0, DONE: 0, ERROR: 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return {"workers": self.workers, "max_pending": self.max_pending, "rejected": self.rejected, "jobs": counts}
@@ -0,0 +1,235 @@
+# report_store.py
+# Almacén acotado de los PDF generados.
+#
+# Every report gets a random 128-bit id (no more second-resolution names that
+# overwrite each other) and is written to <dir>/<id[:2]>/<id>.pdf, so no
+# directory ever holds more than a small share of the files. A SQLite index in
+# <dir>/index.sqlite keeps one row per report (date, kind, prediction, size):
+# lookup by id is a primary-key read, listings by date / prediction use an
+# index, and the running count / bytes are kept by triggers, so neither
+# retrieval nor eviction ever scans the directory. Reports older than max_age
+# or beyond max_bytes (oldest first) are deleted when a new one is saved.
+#
+# Several server workers (inference/serve.py) can share the same directory:
+# each process opens its own connection and SQLite serializes the writes.
+# The status of the reports still being rendered lives here too (jobs table),
+# so a poll that lands on another worker than the one rendering gets a 202
+# instead of a 404; save() drops the job row in the same transaction.
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_ID = re.compile(r"[0-9a-f]{32}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    filename TEXT,
+    prediction TEXT,
+    confidence REAL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_created ON reports (created);
+CREATE INDEX IF NOT EXISTS reports_prediction ON reports (prediction, created);
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), reports INTEGER NOT NULL, bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS reports_added AFTER INSERT ON reports
+    BEGIN UPDATE totals SET reports = reports + 1, bytes = bytes + NEW.size WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS reports_removed AFTER DELETE ON reports
+    BEGIN UPDATE totals SET reports = reports - 1, bytes = bytes - OLD.size WHERE id = 0; END;
+CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, created REAL NOT NULL, status TEXT NOT NULL, error TEXT);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+"""
+
+_COLUMNS = ("id", "created", "kind", "name", "filename", "prediction", "confidence", "size")
+
+# Rows deleted per round when the store is over its size limit
+_EVICT_BATCH = 32
+
+# A job row this old belongs to a worker that died mid-render (or to a failed report)
+_JOB_MAX_AGE = 24 * 3600
+
+
+class ReportStore:
+
+    def __init__(self, directory="reports", max_mb=1024, max_age_seconds=7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)# 0 = no size limit
+        self.max_age_seconds = max_age_seconds# 0 = no age limit
+        self.evicted = 0
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # One connection per process: a forked server worker must not reuse its parent's
+        if self._db is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=30,
+                                 check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def path(self, report_id):
+        """Ruta del PDF de un id (no comprueba que exista). ValueError si el id no es válido."""
+        if not _ID.fullmatch(report_id or ""):
+            raise ValueError(f"Invalid report id: {report_id!r}")
+        return os.path.join(self.directory, report_id[:2], f"{report_id}.pdf")
+
+    def save(self, pdf_bytes, kind="reporte", filename=None, prediction=None, confidence=None, report_id=None):
+        """Guarda el PDF y su fila en el índice; devuelve (report_id, ruta)."""
+        report_id = report_id or self.new_id()
+        path = self.path(report_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name, so a reader never sees half a PDF
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+
+        created = time.time()
+        name = f"{kind}_{datetime.fromtimestamp(created).strftime('%Y%m%d_%H%M%S')}.pdf"
+        with self._lock:
+            db = self._connect()
+            # The new row and the evictions it causes are one transaction
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (report_id, created, kind, name, filename, prediction, confidence, len(pdf_bytes)))
+                db.execute("DELETE FROM jobs WHERE id = ?", (report_id,))
+                evicted = self._evict(db, created)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            self.evicted += len(evicted)
+        # Files are deleted once their rows are gone, outside the transaction
+        self._remove_files(evicted)
+        return report_id, path
+
+    def _evict(self, db, now):
+        # Oldest first, through the created index; returns the ids whose rows were deleted
+        evicted = []
+        db.execute("DELETE FROM jobs WHERE created < ?", (now - _JOB_MAX_AGE,))
+        if self.max_age_seconds:
+            rows = db.execute("SELECT id FROM reports WHERE created < ?", (now - self.max_age_seconds,)).fetchall()
+            evicted.extend(row[0] for row in rows)
+            db.execute("DELETE FROM reports WHERE created < ?", (now - self.max_age_seconds,))
+        if self.max_bytes:
+            while self._total_bytes(db) > self.max_bytes:
+                rows = db.execute("SELECT id FROM reports ORDER BY created LIMIT ?", (_EVICT_BATCH,)).fetchall()
+                if not rows:
+                    break
+                # One batch at a time, stopping as soon as the total fits again
+                for (report_id,) in rows:
+                    db.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+                    evicted.append(report_id)
+                    if self._total_bytes(db) <= self.max_bytes:
+                        break
+        return evicted
+
+    @staticmethod
+    def _total_bytes(db):
+        return db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def _remove_files(self, report_ids):
+        for report_id in report_ids:
+            try:
+                os.remove(self.path(report_id))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not delete report %s: %s", report_id, e)
+
+    def get(self, report_id):
+        """Fila del índice (con la ruta) de un reporte guardado, o None."""
+        if not _ID.fullmatch(report_id or ""):
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM reports WHERE id = ?", (report_id,)).fetchone()
+        if row is None:
+            return None
+        report = dict(zip(_COLUMNS, row))
+        report["path"] = self.path(report_id)
+        return report
+
+    def __contains__(self, report_id):
+        return self.get(report_id) is not None
+
+    def mark(self, report_id, status, error=None):
+        """Estado compartido (pending / running / error) de un reporte que aún no está guardado."""
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET status = excluded.status, "
+                "error = excluded.error", (report_id, time.time(), status, error))
+
+    def job(self, report_id):
+        """{"status", "error", "created"} de un reporte marcado con mark() y aún sin guardar, o None."""
+        if not _ID.fullmatch(report_id or ""):
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT status, error, created FROM jobs WHERE id = ?", (report_id,)).fetchone()
+        return dict(zip(("status", "error", "created"), row)) if row is not None else None
+
+    def query(self, prediction=None, kind=None, since=None, until=None, limit=100):
+        """Reportes más recientes primero, filtrados por predicción, tipo y rango de fechas (timestamps)."""
+        conditions, params = [], []
+        for column, op, value in (("prediction", "=", prediction), ("kind", "=", kind),
+                                  ("created", ">=", since), ("created", "<", until)):
+            if value is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM reports {where} ORDER BY created DESC LIMIT ?",
+                (*params, limit)).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def snapshot(self):
+        with self._lock:
+            count, total = self._connect().execute("SELECT reports, bytes FROM totals WHERE id = 0").fetchone()
+        return {
+            "directory": self.directory,
+            "reports": count,
+            "mb": round(total / 2**20, 2),
+            "max_mb": round(self.max_bytes / 2**20, 2),
+            "max_age_hours": round(self.max_age_seconds / 3600, 2),
+            "evicted": self.evicted,
+        }
+
+
+_default_store = None
+
+
+def get_default_store():
+    """Store usado por save_report: ./reports con los límites por defecto, salvo que el servidor instale el suyo."""
+    global _default_store
+    if _default_store is None:
+        _default_store = ReportStore()
+    return _default_store
+
+
+def set_default_store(store):
+    global _default_store
+    _default_store = store
@@ -0,0 +1,80 @@
+#On-demand rendering of the prediction images.
+#
+#Instead of PNG-encoding and base64-ing the original, the heatmap and the
+#overlay in every response, /predict?images=url keeps the decoded image and the
+#Grad-CAM array here and returns short URLs; GET /artifacts/{id}/{kind} renders
+#the PNG only when (and if) a client asks for it.
+#
+#The store lives in the memory of the server process: with several workers
+#(inference/serve.py) the artifact is only found by the worker that made the
+#prediction, so url mode needs sticky routing there.
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from processing.image import heatmap_to_image, image_to_png_bytes, overlay_heatmap
+
+ARTIFACT_KINDS = ("original", "heatmap", "overlay")
+
+
+class ArtifactStore:
+
+    def __init__(self, max_entries=256, ttl_seconds=900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()# id -> [expires_at, original_image, heatmap, {kind: png}]
+        self._lock = threading.Lock()
+
+    def add(self, original_image, heatmap, artifact_id=None):
+        """Guarda la imagen y el heatmap; devuelve el id del artefacto."""
+        artifact_id = artifact_id or uuid.uuid4().hex
+        with self._lock:
+            self._entries[artifact_id] = [time.monotonic() + self.ttl_seconds, original_image, heatmap, {}]
+            self._entries.move_to_end(artifact_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return artifact_id
+
+    def _get(self, artifact_id):
+        with self._lock:
+            entry = self._entries.get(artifact_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[artifact_id]
+                return None
+            self._entries.move_to_end(artifact_id)
+            return entry
+
+    def __contains__(self, artifact_id):
+        return self._get(artifact_id) is not None
+
+    def render(self, artifact_id, kind):
+        """PNG de la imagen pedida, o None si el artefacto no existe / expiró."""
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown artifact kind: {kind!r}")
+        entry = self._get(artifact_id)
+        if entry is None:
+            return None
+
+        _, original_image, heatmap, rendered = entry
+        png = rendered.get(kind)
+        if png is None:
+            if kind == "original":
+                image = original_image
+            elif heatmap is None:
+                return None
+            elif kind == "heatmap":
+                image = heatmap_to_image(heatmap)
+            else:
+                image = overlay_heatmap(original_image, heatmap)
+            # Rendered once, then served from memory
+            png = rendered[kind] = image_to_png_bytes(image)
+        return png
+
+
+def artifact_urls(artifact_id, has_heatmap=True):
+    kinds = ARTIFACT_KINDS if has_heatmap else ("original",)
+    return {kind: f"/artifacts/{artifact_id}/{kind}" for kind in kinds}
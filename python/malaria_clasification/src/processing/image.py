@@ -1,80 +1,71 @@
 #Image processing utilities for malaria detection
 
+import logging
+from contextlib import nullcontext
+
 import numpy as np
 import cv2
-import matplotlib.cm as cm
 from PIL import Image
 import io
 import base64
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 
+from processing.render import colorize, overlay
+
+logger = logging.getLogger(__name__)
+
+#Colors come from the uint8 lookup tables of processing/render.py (no matplotlib)
 def overlay_heatmap(original_image, heatmap, alpha=0.4):
-   
-    # Redimensionar heatmap para coincidir con imagen original
-    heatmap_resized = cv2.resize(heatmap, (original_image.width, original_image.height))
-    
-    # Convertir a mapa de colores (jet colormap)
-    heatmap_colored = cm.jet(heatmap_resized)
-    heatmap_colored = (heatmap_colored[:, :, :3] * 255).astype(np.uint8)
-    
-    # Convertir PIL a numpy
-    original_np = np.array(original_image)
-    
-    # Mezclar imágenes
-    blended = cv2.addWeighted(original_np, 1-alpha, heatmap_colored, alpha, 0)
-    
-    return Image.fromarray(blended)
+    # Resize + jet + mezcla en una sola pasada sobre uint8
+    original_np = np.asarray(original_image if original_image.mode == "RGB" else original_image.convert("RGB"))
+    return Image.fromarray(overlay(original_np, heatmap, alpha, "jet"))
 
-def image_to_base64(image):
-    
+def image_to_png_bytes(image):
     buffer = io.BytesIO()
     image.save(buffer, format='PNG')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.read()).decode('utf-8')
+    return buffer.getvalue()
+
+def image_to_base64(image):
+    
+    image_base64 = base64.b64encode(image_to_png_bytes(image)).decode('utf-8')
     return f"data:image/png;base64,{image_base64}"
 
 def heatmap_to_image(heatmap,size=(224,224)):
-   
-    # Convertir a rango [0, 255]
-    heatmap_uint8 = (heatmap * 255).astype(np.uint8)
-    
-    # Crear imagen PIL y convertir a RGB
-    heatmap_pil = Image.fromarray(heatmap_uint8)
-    heatmap_pil = heatmap_pil.resize(size, Image.NEAREST)
-    #heatmap_pil = heatmap_pil.convert('RGB')
-    # Convertir a colormap "hot" o "jet"
-    heatmap_colored = cm.hot(np.array(heatmap_pil) / 255.0)
-    heatmap_colored = (heatmap_colored[:, :, :3] * 255).astype(np.uint8)
-    
-    return Image.fromarray(heatmap_colored)
+    # Nearest (same pixel centers as PIL's resize) keeps the CAM cells visible as blocks; "hot" colormap
+    return Image.fromarray(colorize(heatmap, size, "hot", cv2.INTER_NEAREST_EXACT))
     
 
-def prepare_visualization_data(original_image, heatmap):
-    print(f"Heatmap shape: {heatmap.shape}")
-    print(f"Heatmap min/max: {heatmap.min()}/{heatmap.max()}")
-    print(f"Heatmap dtype: {heatmap.dtype}")
+#Same images as PIL objects, without PNG/base64 (for in-process callers and on-demand rendering)
+def render_visualizations(original_image, heatmap):
+    return {
+        "original": original_image,
+        "heatmap": heatmap_to_image(heatmap),
+        "overlay": overlay_heatmap(original_image, heatmap)
+    }
+
+#timer: optional StageTimer (inference/timing.py), gets "overlay" and "base64"
+def prepare_visualization_data(original_image, heatmap, timer=None):
+    def stage(name):
+        return timer.stage(name) if timer is not None else nullcontext()
+
+    # min()/max() are not free: only computed when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Heatmap shape=%s min/max=%s/%s dtype=%s", heatmap.shape, heatmap.min(), heatmap.max(), heatmap.dtype)
 
     try:
-        # Crear overlay
-        overlay_image = overlay_heatmap(original_image, heatmap)
-        
-        # Convertir heatmap a imagen
-        heatmap_image = heatmap_to_image(heatmap)
-        
-        # Antes de convertir a base64:
-        print(f"Heatmap image size: {heatmap_image.size}")
-        print(f"Heatmap image mode: {heatmap_image.mode}")
-        
+        # Crear overlay y convertir heatmap a imagen
+        with stage("overlay"):
+            images = render_visualizations(original_image, heatmap)
+
         # Convertir todo a base64
-        return {
-            "original": image_to_base64(original_image),
-            "heatmap": image_to_base64(heatmap_image),
-            "overlay": image_to_base64(overlay_image)
-        }
+        with stage("base64"):
+            return {
+                "original": image_to_base64(images["original"]),
+                "heatmap": image_to_base64(images["heatmap"]),
+                "overlay": image_to_base64(images["overlay"])
+            }
     
     except Exception as e:
-        print(f"Error preparing visualization data: {e}")
+        logger.warning("Error preparing visualization data: %s", e)
         return {
             "original": image_to_base64(original_image),
             "heatmap": None,
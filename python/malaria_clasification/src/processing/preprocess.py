@@ -0,0 +1,152 @@
+#Fast preprocessing shared by the API, the scripts and the batch tools.
+#
+#Equivalent to the training transformation
+#   Resize((224, 224)) -> ToTensor() -> Normalize(mean, std)
+#but without the intermediate PIL/float copies: OpenCV decodes to uint8,
+#resizes into a reusable uint8 buffer, and the uint8 -> float conversion,
+#the /255 scaling and the normalization happen in a single pass that writes
+#straight into the (optionally preallocated) batch tensor.
+#
+#decode_image can also check the dimensions in the header before decoding
+#anything, and decode large JPEGs at a reduced scale: the model only sees 224x224.
+
+import threading
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image, UnidentifiedImageError
+import io
+
+IMAGE_SIZE = 224
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+# Normalize((x / 255 - mean) / std) folded into a single multiply-add: x * scale + shift
+_SCALE = torch.tensor([1.0 / (255.0 * s) for s in STD]).view(1, 3, 1, 1)
+_SHIFT = torch.tensor([-m / s for m, s in zip(MEAN, STD)]).view(1, 3, 1, 1)
+
+# One resize buffer per thread (the worker pool preprocesses in parallel)
+_buffers = threading.local()
+
+
+class ImageTooLargeError(ValueError):
+    """La imagen supera el límite de píxeles (se detecta en la cabecera, antes de decodificar)."""
+
+
+def probe_image(image_bytes: bytes):
+    """(formato, ancho, alto) leídos de la cabecera, sin decodificar los píxeles."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.format, image.width, image.height
+    except Image.DecompressionBombError as e:
+        # PIL's own bomb check fires in open() for really absurd sizes
+        raise ImageTooLargeError(str(e)) from e
+    except (UnidentifiedImageError, OSError) as e:
+        # PIL's message already reads "cannot identify image file ..."
+        raise ValueError(str(e)) from e
+
+
+def _reduced_flag(width, height, min_side):
+    # libjpeg scales by 1/2, 1/4 or 1/8 while decoding (DCT scaling): pick the
+    # largest factor that still leaves the short side >= min_side
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if min(width, height) // factor >= min_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(image_bytes: bytes, max_pixels=None, reduce_to=None) -> np.ndarray:
+    """
+    Decodifica bytes a un array RGB uint8 [H,W,3].
+
+    max_pixels: rechaza (ImageTooLargeError) según las dimensiones de la cabecera, sin decodificar.
+    reduce_to: los JPEG se decodifican a escala reducida (1/2..1/8) con el lado corto >= reduce_to.
+    """
+    flags = cv2.IMREAD_COLOR
+    if max_pixels or reduce_to:
+        image_format, width, height = probe_image(image_bytes)
+        if max_pixels and width * height > max_pixels:
+            raise ImageTooLargeError(
+                f"Image is {width}x{height} ({width * height / 1e6:.1f} MP), the limit is {max_pixels / 1e6:.1f} MP")
+        if reduce_to and image_format == "JPEG":
+            flags = _reduced_flag(width, height, reduce_to)
+
+    array = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if array is None:
+        # Formats OpenCV does not read (GIF, some TIFFs...) go through PIL
+        return np.asarray(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+    return cv2.cvtColor(array, cv2.COLOR_BGR2RGB)
+
+
+def _to_array(image):
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    return image
+
+
+def _resize_buffer(size):
+    buffer = getattr(_buffers, "resize", None)
+    if buffer is None or buffer.shape[:2] != (size, size):
+        buffer = np.empty((size, size, 3), dtype=np.uint8)
+        _buffers.resize = buffer
+    return buffer
+
+
+def resize_uint8(image, size=IMAGE_SIZE, out=None):
+    """Redimensiona a size x size en un buffer uint8 reutilizable."""
+    array = _to_array(image)
+    if out is None:
+        out = _resize_buffer(size)
+    if array.shape[:2] == (size, size):
+        np.copyto(out, array)
+        return out
+    # INTER_AREA when shrinking behaves like PIL's antialiased bilinear resize
+    downscale = array.shape[0] > size or array.shape[1] > size
+    interpolation = cv2.INTER_AREA if downscale else cv2.INTER_LINEAR
+    return cv2.resize(array, (size, size), dst=out, interpolation=interpolation)
+
+
+def preprocess_batch(images, out=None, size=IMAGE_SIZE) -> torch.Tensor:
+    """
+    Lista de imágenes (PIL o arrays RGB uint8) -> tensor normalizado contiguo [B,3,size,size].
+
+    Si se pasa `out` (float32 [>=B,3,size,size]) se escribe ahí sin reservar memoria.
+    """
+    count = len(images)
+    if out is None:
+        out = torch.empty((count, 3, size, size), dtype=torch.float32)
+    else:
+        out = out[:count]
+
+    for i, image in enumerate(images):
+        resized = resize_uint8(image, size)
+        # HWC uint8 -> CHW float32, converted while copying into the batch
+        out[i].copy_(torch.from_numpy(resized).permute(2, 0, 1))
+
+    # Scale + normalize of the whole batch in one in-place op
+    torch.addcmul(_SHIFT, out, _SCALE, out=out)
+    return out
+
+
+def normalize_uint8_batch(batch, out=None) -> torch.Tensor:
+    """uint8 [B,3,H,W] (p. ej. de un DataLoader) -> float32 normalizado, en una sola pasada."""
+    if out is None:
+        out = torch.empty(batch.shape, dtype=torch.float32)
+    else:
+        out = out[:batch.shape[0]]
+    out.copy_(batch)
+    torch.addcmul(_SHIFT, out, _SCALE, out=out)
+    return out
+
+
+def preprocess_image(image) -> torch.Tensor:
+    """Una imagen -> tensor [1,3,224,224]."""
+    return preprocess_batch([image])
+
+
+def load_and_preprocess(image_bytes: bytes):
+    """Bytes -> (PIL Image RGB, tensor [1,3,224,224])."""
+    array = decode_image(image_bytes)
+    return Image.fromarray(array), preprocess_image(array)
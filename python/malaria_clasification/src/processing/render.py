@@ -0,0 +1,99 @@
+#Heatmap coloring and overlays without matplotlib.
+#
+#matplotlib's cm.jet / cm.hot turn every pixel of the (already resized) float
+#heatmap into an RGBA float64 value, which is then scaled and cast to uint8.
+#Here the two colormaps are 256-entry uint8 tables built once from the same
+#segment data, the heatmap is quantized to uint8 while it is still 7x7, resized
+#as uint8, colored with one table lookup (cv2.applyColorMap with our table,
+#faster than NumPy indexing) and blended in place with OpenCV: no float image
+#of the full size is ever created.
+
+import cv2
+import numpy as np
+
+#matplotlib's segment data: (x, value below x, value above x) per channel
+_SEGMENTS = {
+    "jet": (
+        ((0.0, 0.0, 0.0), (0.35, 0.0, 0.0), (0.66, 1.0, 1.0), (0.89, 1.0, 1.0), (1.0, 0.5, 0.5)),
+        ((0.0, 0.0, 0.0), (0.125, 0.0, 0.0), (0.375, 1.0, 1.0), (0.64, 1.0, 1.0), (0.91, 0.0, 0.0), (1.0, 0.0, 0.0)),
+        ((0.0, 0.5, 0.5), (0.11, 1.0, 1.0), (0.34, 1.0, 1.0), (0.65, 0.0, 0.0), (1.0, 0.0, 0.0)),
+    ),
+    "hot": (
+        ((0.0, 0.0416, 0.0416), (0.365079, 1.0, 1.0), (1.0, 1.0, 1.0)),
+        ((0.0, 0.0, 0.0), (0.365079, 0.0, 0.0), (0.746032, 1.0, 1.0), (1.0, 1.0, 1.0)),
+        ((0.0, 0.0, 0.0), (0.746032, 0.0, 0.0), (1.0, 1.0, 1.0)),
+    ),
+}
+COLORMAPS = tuple(_SEGMENTS)
+
+_luts = {}
+
+
+def colormap_lut(name):
+    """Tabla uint8 [256,1,3] (RGB, forma que espera cv2.applyColorMap): lut[v, 0] es el color del valor v/255."""
+    lut = _luts.get(name)
+    if lut is None:
+        if name not in _SEGMENTS:
+            raise ValueError(f"Unknown colormap: {name!r} (available: {', '.join(COLORMAPS)})")
+        # matplotlib samples 256 colors and maps x in [0,1] to color int(x * 256)
+        samples = np.linspace(0.0, 1.0, 256)
+        table = np.stack([np.interp(samples, [p[0] for p in seg], [p[1] for p in seg]) for seg in _SEGMENTS[name]], axis=1)
+        index = np.minimum((np.arange(256) / 255.0 * 256).astype(np.int64), 255)
+        lut = _luts[name] = np.ascontiguousarray((table[index] * 255).astype(np.uint8)[:, None, :])
+    return lut
+
+
+def heatmap_to_uint8(heatmap):
+    """Heatmap float en [0,1] -> uint8 [0,255] (a la resolución del CAM, antes de redimensionar)."""
+    return cv2.convertScaleAbs(np.asarray(heatmap, dtype=np.float32), alpha=255.0)
+
+
+def colorize(heatmap, size=None, colormap="jet", interpolation=cv2.INTER_LINEAR):
+    """
+    Heatmap [h,w] (float en [0,1] o uint8) -> imagen RGB uint8 [H,W,3].
+
+    size=(width, height) redimensiona antes de colorear (sobre uint8, no sobre float).
+    """
+    values = heatmap if heatmap.dtype == np.uint8 else heatmap_to_uint8(heatmap)
+    if size is not None and values.shape[1::-1] != tuple(size):
+        values = cv2.resize(values, tuple(size), interpolation=interpolation)
+    return cv2.applyColorMap(values, colormap_lut(colormap))
+
+
+def blend(original, colored, alpha=0.4, out=None):
+    """original * (1 - alpha) + colored * alpha, ambos RGB uint8 del mismo tamaño."""
+    return cv2.addWeighted(original, 1 - alpha, colored, alpha, 0, dst=out)
+
+
+def overlay(original, heatmap, alpha=0.4, colormap="jet"):
+    """Resize + color + mezcla en una pasada: array RGB uint8 [H,W,3] -> overlay del mismo tamaño."""
+    colored = colorize(heatmap, original.shape[1::-1], colormap)
+    # The colored image is a temporary: blend into it instead of allocating the result
+    return blend(original, colored, alpha, out=colored)
+
+
+def colorize_batch(heatmaps, size=None, colormap="jet", interpolation=cv2.INTER_LINEAR):
+    """Heatmaps [B,h,w] -> [B,H,W,3] uint8: una cuantización y una sola búsqueda en la tabla para todo el batch."""
+    heatmaps = np.asarray(heatmaps, dtype=np.float32)
+    values = heatmap_to_uint8(heatmaps.reshape(len(heatmaps), -1)).reshape(heatmaps.shape)
+    if size is not None and values.shape[:0:-1] != tuple(size):
+        width, height = size
+        resized = np.empty((len(values), height, width), dtype=np.uint8)
+        for i, value in enumerate(values):
+            cv2.resize(value, (width, height), dst=resized[i], interpolation=interpolation)
+        values = resized
+    batch, height, width = values.shape
+    # One lookup for the whole batch, seen as a single tall image
+    return cv2.applyColorMap(values.reshape(batch * height, width), colormap_lut(colormap)).reshape(batch, height, width, 3)
+
+
+def overlay_batch(originals, heatmaps, alpha=0.4, colormap="jet"):
+    """Overlays de un batch: originals [B,H,W,3] uint8 (mismo tamaño) o lista de arrays de tamaños distintos."""
+    if isinstance(originals, np.ndarray) and originals.ndim == 4:
+        batch, height, width = originals.shape[:3]
+        colored = colorize_batch(heatmaps, (width, height), colormap)
+        # addWeighted works on 2-D images: the batch is blended as one tall image
+        rows = (batch * height, width, 3)
+        blend(originals.reshape(rows), colored.reshape(rows), alpha, out=colored.reshape(rows))
+        return colored
+    return [overlay(original, heatmap, alpha, colormap) for original, heatmap in zip(originals, heatmaps)]
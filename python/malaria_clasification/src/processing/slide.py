@@ -0,0 +1,132 @@
+#Whole-slide / large field-of-view images (POST /predict/slide).
+#
+#The classifier was trained on single cropped cells squashed to 224x224, so a
+#smear field is cut into model-sized inputs first, in one of two ways:
+#   cells  OpenCV finds the cells (Otsu threshold of the stained cells against
+#          the bright background) and each one is cropped around its box
+#   tiles  a regular grid of tile x tile windows, background-only tiles skipped
+#Only the box coordinates are kept for the whole image: the crops are views of
+#the decoded array, resized into the batch tensor one chunk at a time, so
+#memory is the slide itself plus one batch. The per-box Grad-CAMs are pasted
+#into a downscaled canvas that becomes the stitched heatmap.
+
+import cv2
+import numpy as np
+
+from processing.preprocess import preprocess_batch
+
+SLIDE_MODES = ("cells", "tiles")
+
+
+def foreground_mask(array):
+    """Máscara uint8 (255 = célula/tejido) de una imagen RGB con fondo claro."""
+    gray = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    # Stained cells are darker than the background: inverse Otsu keeps them
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    # Opening removes specks of noise; closing fills the pale centre of the red cells
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+
+def detect_cells(mask, min_area=200, max_area=20000, margin=0.15):
+    """
+    Cajas (x, y, w, h) cuadradas alrededor de cada célula candidata de la máscara.
+
+    Devuelve (boxes, oversized): los blobs mayores que max_area (grupos de células
+    pegadas, artefactos) no se clasifican, solo se cuentan.
+    """
+    height, width = mask.shape[:2]
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes, oversized = [], 0
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area < min_area:
+            continue
+        if area > max_area:
+            oversized += 1
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        # Square crop with some background around the cell, like the training images
+        side = int(max(w, h) * (1 + 2 * margin))
+        x0 = max(0, min(x + w // 2 - side // 2, width - side))
+        y0 = max(0, min(y + h // 2 - side // 2, height - side))
+        boxes.append((x0, y0, min(side, width - x0), min(side, height - y0)))
+    # Reading order, so the NDJSON lines follow the image top to bottom
+    boxes.sort(key=lambda box: (box[1], box[0]))
+    return boxes, oversized
+
+
+def tile_boxes(width, height, tile=224, stride=None, mask=None, min_foreground=0.05):
+    """
+    Genera las ventanas (x, y, w, h) de una rejilla tile x tile (stride < tile = solape).
+
+    Con mask, las ventanas con menos de min_foreground de primer plano se saltan
+    (se generan como None para que el llamador pueda contarlas).
+    """
+    stride = stride or tile
+    last_x, last_y = max(0, width - tile), max(0, height - tile)
+    xs = list(range(0, last_x + 1, stride))
+    ys = list(range(0, last_y + 1, stride))
+    # The last row / column is aligned to the border instead of being cut short
+    if xs[-1] != last_x:
+        xs.append(last_x)
+    if ys[-1] != last_y:
+        ys.append(last_y)
+    for y in ys:
+        for x in xs:
+            box = (x, y, min(tile, width), min(tile, height))
+            if mask is not None and _foreground_fraction(mask, box) < min_foreground:
+                yield None
+            else:
+                yield box
+
+
+def _foreground_fraction(mask, box):
+    x, y, w, h = box
+    return cv2.countNonZero(mask[y:y + h, x:x + w]) / float(w * h)
+
+
+def crop(array, box):
+    x, y, w, h = box
+    return array[y:y + h, x:x + w]
+
+
+def preprocess_boxes(array, boxes, out=None):
+    """Recortes de la imagen -> tensor normalizado [N,3,224,224] (out: buffer opcional, ver inference/arena.py)."""
+    return preprocess_batch([crop(array, box) for box in boxes], out=out)
+
+
+class HeatmapCanvas:
+    """Heatmap de toda la imagen, a escala reducida (lado mayor <= max_side), promediando solapes."""
+
+    def __init__(self, width, height, max_side=1024):
+        self.scale = min(1.0, max_side / float(max(width, height)))
+        self.size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        self._sum = np.zeros(self.size[::-1], dtype=np.float32)
+        self._count = np.zeros(self.size[::-1], dtype=np.float32)
+
+    def add(self, box, value, cam=None):
+        """Pega value (p. ej. la probabilidad de infección) * cam en la caja; sin cam, value uniforme."""
+        x, y, w, h = (int(round(v * self.scale)) for v in box)
+        # Rounding can put a box touching the border one pixel outside the canvas
+        x = min(x, self.size[0] - 1)
+        y = min(y, self.size[1] - 1)
+        w = max(1, min(w, self.size[0] - x))
+        h = max(1, min(h, self.size[1] - y))
+        if cam is None:
+            self._sum[y:y + h, x:x + w] += value
+        else:
+            self._sum[y:y + h, x:x + w] += value * cv2.resize(cam.astype(np.float32), (w, h))
+        self._count[y:y + h, x:x + w] += 1
+
+    def heatmap(self):
+        """float32 [h,w] en [0,1]; 0 donde no se clasificó nada (fondo)."""
+        return np.divide(self._sum, self._count, out=np.zeros_like(self._sum), where=self._count > 0)
+
+    def thumbnail(self, array):
+        """La imagen original al tamaño del canvas (para el overlay)."""
+        if array.shape[1::-1] == self.size:
+            return array
+        return cv2.resize(array, self.size, interpolation=cv2.INTER_AREA)
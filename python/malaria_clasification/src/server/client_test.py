@@ -70,6 +70,34 @@ def test_multiple_images(image_paths):
     
     return results
 
+#Send many images (or .zip archives of a slide) in ONE request to /predict/batch.
+#The server answers one JSON line per image as soon as each batch is done.
+def predict_batch_stream(paths, batch_size=32):
+    results = []
+    opened = [open(path, 'rb') for path in paths]
+    try:
+        files = [("files", (os.path.basename(path), f)) for path, f in zip(paths, opened)]
+        with requests.post(f"{API_URL}/predict/batch", files=files,
+                           params={"batch_size": batch_size}, stream=True) as response:
+            print(f"Status Code: {response.status_code}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if "summary" in item:
+                    print(f" Summary: {item['summary']}")
+                elif "error" in item:
+                    print(f" {item['filename']}: {item['error']}")
+                else:
+                    results.append(item)
+                    print(f" {item['filename']}: {item['prediction']} ({item['confidence']}%)")
+    except requests.exceptions.ConnectionError:
+        print("Error: Unable to connect to the API.")
+    finally:
+        for f in opened:
+            f.close()
+    return results
+
 if __name__ == "__main__":
     test_images = [
         "D:\\malaria_inference_project\\uninfected2.png",
@@ -0,0 +1,301 @@
+# embedding_index.py
+# Índice de embeddings para encontrar las células ya diagnosticadas más parecidas.
+#
+# The 512-d penultimate vectors (architecture/model_architecture.forward_features)
+# are L2-normalized, so cosine similarity is a dot product, and stored as float16
+# rows of <dir>/embeddings.f16, a raw file opened with np.memmap: 1 KB per cell,
+# 300k cells = 300 MB that the OS pages in on demand instead of a load at
+# startup. <dir>/index.sqlite keeps one row per cell (filename, prediction,
+# reviewer label, ...) under the same row number, as in pdf/report_store.py.
+#
+# Exact search scores every row in blocks: each block is cast to float32 and
+# multiplied with the queries in one BLAS matmul, and only its top-k is kept.
+# For larger sets train_ivf() clusters the rows (spherical k-means) into
+# inverted lists: a query then scores only the rows of the nprobe closest
+# clusters, plus the rows added since the last training.
+#
+# Several server workers can share the directory: rows are numbered and written
+# inside one SQLite write transaction, and each process re-maps the file when
+# another one has grown it.
+#
+#   python -m similarity.embedding_index embeddings/ --train-ivf 1024
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    row INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    filename TEXT,
+    prediction TEXT,
+    confidence REAL,
+    label TEXT
+);
+"""
+
+_COLUMNS = ("id", "created", "filename", "prediction", "confidence", "label")
+
+# Rows scored per matmul (float32 copy of a block: 16384 x 512 x 4 B = 32 MB)
+_BLOCK = 16384
+# Minimum growth of the vector file, in rows
+_GROW = 4096
+
+
+def normalize(vectors, dim):
+    """[N,dim] o [dim] -> float32 [N,dim] de norma 1."""
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, dim)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(matrix, queries, k):
+    """
+    Los k productos escalares mayores de queries [Q,dim] contra matrix [n,dim] (float16 o float32).
+
+    Devuelve (índices [Q,k'], scores [Q,k']) ordenados de mayor a menor, k' = min(k, n).
+    """
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(matrix), _BLOCK):
+        scores = queries @ np.asarray(matrix[start:start + _BLOCK], dtype=np.float32).T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        # Candidates = best so far + this block; only the top k survive
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        if scores.shape[1] > k:
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            rows = np.take_along_axis(rows, keep, axis=1)
+        best_scores, best_rows = scores, rows
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _assign(vectors, centroids):
+    # Nearest centroid by cosine, in blocks so the [n, lists] score matrix stays small
+    return np.concatenate([
+        np.argmax(np.asarray(vectors[start:start + _BLOCK], dtype=np.float32) @ centroids.T, axis=1)
+        for start in range(0, len(vectors), _BLOCK)
+    ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+
+class EmbeddingIndex:
+
+    def __init__(self, directory="embeddings", dim=512, nprobe=8):
+        self.directory = directory
+        self.dim = dim
+        self.nprobe = nprobe# IVF clusters scanned per query
+        self._db = None
+        self._pid = None
+        self._vectors = None
+        self._ivf = None
+        self._ivf_mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, "embeddings.f16")
+
+    @property
+    def _ivf_path(self):
+        return os.path.join(self.directory, "ivf.npz")
+
+    def _connect(self):
+        # One connection per process, as in ReportStore
+        if self._db is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=30,
+                                 check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db, self._pid, self._vectors = db, os.getpid(), None
+        return self._db
+
+    @staticmethod
+    def _count(db):
+        # Rows are numbered 0, 1, 2...: the count is the largest one + 1 (a primary-key read)
+        return db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings").fetchone()[0]
+
+    def _map(self, rows):
+        # memmap of at least `rows` rows; the file grows by doubling, never shrinks
+        if self._vectors is None or len(self._vectors) < rows:
+            row_bytes = self.dim * 2
+            size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+            capacity = size // row_bytes
+            if capacity < rows:
+                capacity = max(rows, 2 * capacity, _GROW)
+                fd = os.open(self._vectors_path, os.O_RDWR | os.O_CREAT)
+                try:
+                    os.ftruncate(fd, capacity * row_bytes)
+                finally:
+                    os.close(fd)
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode="r+", shape=(capacity, self.dim))
+        return self._vectors
+
+    def add(self, vectors, filenames=None, predictions=None, confidences=None, labels=None):
+        """Añade vectores [N,dim] (se normalizan) con sus metadatos; devuelve sus ids (números de fila)."""
+        vectors = normalize(vectors, self.dim).astype(np.float16)
+        count = len(vectors)
+        columns = [values if values is not None else [None] * count
+                   for values in (filenames, predictions, confidences, labels)]
+        created = time.time()
+        with self._lock:
+            db = self._connect()
+            # The write lock numbers the rows: two processes never write the same ones
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                first = self._count(db)
+                self._map(first + count)[first:first + count] = vectors
+                db.executemany("INSERT INTO embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                               [(first + i, created, *row) for i, row in enumerate(zip(*columns))])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return list(range(first, first + count))
+
+    def __len__(self):
+        with self._lock:
+            return self._count(self._connect())
+
+    def get(self, row):
+        """Metadatos de un id, o None."""
+        return self._metadata([row]).get(row)
+
+    def vector(self, row):
+        """Vector float32 normalizado de un id, o None."""
+        with self._lock:
+            count = self._count(self._connect())
+            if not 0 <= row < count:
+                return None
+            return np.asarray(self._map(count)[row], dtype=np.float32)
+
+    def _metadata(self, rows):
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        with self._lock:
+            found = self._connect().execute(
+                f"SELECT * FROM embeddings WHERE row IN ({', '.join('?' * len(rows))})", rows).fetchall()
+        return {row[0]: dict(zip(_COLUMNS, row)) for row in found}
+
+    def _load_ivf(self):
+        # Reloaded when another process retrains it
+        try:
+            mtime = os.path.getmtime(self._ivf_path)
+        except OSError:
+            self._ivf = self._ivf_mtime = None
+            return None
+        if mtime != self._ivf_mtime:
+            with np.load(self._ivf_path) as data:
+                self._ivf = {name: data[name] for name in data.files}
+            self._ivf_mtime = mtime
+        return self._ivf
+
+    def search(self, queries, k=10, nprobe=None, exact=False):
+        """
+        Para cada consulta ([dim] o [Q,dim]): lista de hasta k dicts (metadatos + "score" coseno), mejor primero.
+
+        Con IVF entrenado se recorren solo nprobe clusters (más las filas nuevas); exact=True lo recorre todo.
+        """
+        queries = normalize(queries, self.dim)
+        with self._lock:
+            count = self._count(self._connect())
+            matrix = self._map(count)[:count] if count else None
+            ivf = None if exact else self._load_ivf()
+        if count == 0:
+            return [[] for _ in queries]
+
+        if ivf is None:
+            found, found_scores = top_k(matrix, queries, k)
+            results = list(zip(found.tolist(), found_scores.tolist()))
+        else:
+            results = []
+            for query in queries:
+                candidates = self._ivf_candidates(ivf, query, count, nprobe or self.nprobe)
+                found, found_scores = top_k(matrix[candidates], query[None], k)
+                results.append((candidates[found[0]].tolist(), found_scores[0].tolist()))
+
+        # One metadata query for all the neighbours of all the queries
+        metadata = self._metadata({row for rows, _ in results for row in rows})
+        return [
+            [dict(metadata[row], score=round(score, 4)) for row, score in zip(rows, scores) if row in metadata]
+            for rows, scores in results
+        ]
+
+    @staticmethod
+    def _ivf_candidates(ivf, query, count, nprobe):
+        centroids, order, offsets, trained = ivf["centroids"], ivf["order"], ivf["offsets"], int(ivf["rows"])
+        nprobe = min(nprobe, len(centroids))
+        probe = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        lists = [order[offsets[c]:offsets[c + 1]] for c in probe]
+        # Rows added after training are not in any list: always scanned
+        lists.append(np.arange(trained, count))
+        # Sorted, so the memmap is read front to back
+        return np.sort(np.concatenate(lists))
+
+    def train_ivf(self, lists=256, iterations=10, sample=65536, seed=0):
+        """Agrupa las filas actuales en `lists` clusters (k-means esférico sobre una muestra) y guarda las listas invertidas."""
+        with self._lock:
+            count = self._count(self._connect())
+            matrix = self._map(count)[:count]
+        if count < lists:
+            raise ValueError(f"Need at least {lists} embeddings to train {lists} lists, the index has {count}")
+        rng = np.random.default_rng(seed)
+        data = np.asarray(matrix[np.sort(rng.choice(count, min(sample, count), replace=False))], dtype=np.float32)
+        centroids = data[rng.choice(len(data), lists, replace=False)]
+        for _ in range(iterations):
+            assignment = _assign(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, data)
+            # Empty clusters keep their previous centroid
+            filled = np.bincount(assignment, minlength=lists) > 0
+            centroids[filled] = normalize(sums[filled], self.dim)
+
+        assignment = _assign(matrix, centroids)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+        tmp_path = f"{self._ivf_path}.tmp.npz"
+        np.savez(tmp_path, centroids=centroids, order=order, offsets=offsets, rows=np.int64(count))
+        os.replace(tmp_path, self._ivf_path)
+        return {"lists": lists, "rows": count, "largest_list": int(np.diff(offsets).max())}
+
+    def snapshot(self):
+        with self._lock:
+            count = self._count(self._connect())
+            ivf = self._load_ivf()
+        return {
+            "directory": self.directory,
+            "embeddings": count,
+            "mb": round(count * self.dim * 2 / 2**20, 2),
+            "ivf_lists": len(ivf["centroids"]) if ivf is not None else None,
+            "ivf_untrained_rows": count - int(ivf["rows"]) if ivf is not None else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect an embedding index or train its IVF lists")
+    parser.add_argument("directory")
+    parser.add_argument("--train-ivf", type=int, metavar="LISTS", help="cluster the stored embeddings into LISTS lists")
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    index = EmbeddingIndex(args.directory)
+    if args.train_ivf:
+        start = time.perf_counter()
+        trained = index.train_ivf(args.train_ivf, args.iterations)
+        trained["train_s"] = round(time.perf_counter() - start, 2)
+        print(json.dumps(trained, indent=2))
+    print(json.dumps(index.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#The modules import each other from src/ (the Docker image copies src/ to /app),
+#so the tests put it on the path the same way. Run from python/malaria_clasification:
+#   python -m pytest -q
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+#inference/config.py reads the environment once, on import: the API under test
+#runs without UI, warm-up or result cache, on random weights, writing only here
+_TMP = tempfile.mkdtemp(prefix="malaria-tests-")
+atexit.register(shutil.rmtree, _TMP, ignore_errors=True)
+os.environ.update({
+    "MALARIA_MODEL_PATH": os.path.join(_TMP, "random.pth"),
+    "MALARIA_UI": "0",
+    "MALARIA_WARMUP": "0",
+    "MALARIA_CACHE": "0",
+    "MALARIA_REPORT_DIR": os.path.join(_TMP, "reports"),
+    "MALARIA_EMBEDDING_DIR": os.path.join(_TMP, "embeddings"),
+})
+
+TEST_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, "test_images")
+
+
+@pytest.fixture(scope="session")
+def weights():
+    """Pesos de un create_model() aleatorio: las predicciones no significan nada, las formas sí."""
+    import torch
+    from architecture.model_architecture import create_model
+
+    path = os.environ["MALARIA_MODEL_PATH"]
+    if not os.path.exists(path):
+        torch.manual_seed(0)
+        torch.save(create_model().state_dict(), path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def api(weights):
+    """inference.main importado con el entorno de arriba (la versión del modelo necesita los pesos ya escritos)."""
+    import inference.main as main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(api):
+    """TestClient del API; el lifespan carga el modelo en segundo plano como en el servidor."""
+    from fastapi.testclient import TestClient
+
+    with TestClient(api.app) as client:
+        yield client
+
+
+@pytest.fixture
+def image_bytes():
+    with open(os.path.join(TEST_IMAGES, "parasitized.png"), "rb") as f:
+        return f.read()
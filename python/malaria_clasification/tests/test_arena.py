@@ -0,0 +1,45 @@
+#TensorArena (inference/arena.py).
+
+from inference.arena import TensorArena
+
+
+def _arena(**kwargs):
+    return TensorArena(buckets=(1, 4, 8), item_shape=(3, 4, 4), **kwargs)
+
+
+def test_buffers_are_rounded_up_to_a_bucket_and_reused():
+    arena = _arena()
+    buffer = arena.acquire(3)
+    assert tuple(buffer.shape) == (4, 3, 4, 4)
+
+    arena.release(buffer)
+    assert arena.acquire(2) is buffer
+    assert (arena.hits, arena.misses) == (1, 1)
+
+
+def test_oversize_batches_are_not_pooled():
+    arena = _arena()
+    buffer = arena.acquire(9)
+    assert buffer.shape[0] == 9
+    arena.release(buffer)
+    assert arena.oversize == 1
+    assert arena.snapshot()["pooled_buffers"] == {}
+
+
+def test_pool_is_bounded_and_without_duplicates():
+    arena = _arena(per_bucket=2)
+    buffers = [arena.acquire(8) for _ in range(3)]
+    arena.release(buffers[0])
+    arena.release(buffers[0])
+    for buffer in buffers[1:]:
+        arena.release(buffer)
+    assert arena.snapshot()["pooled_buffers"] == {8: 2}
+
+
+def test_borrow_gives_a_view_and_returns_the_buffer():
+    arena = _arena()
+    with arena.borrow(3) as out:
+        assert tuple(out.shape) == (3, 3, 4, 4)
+        out.fill_(1.0)
+    assert arena.snapshot()["pooled_buffers"] == {4: 1}
+    assert float(arena.acquire(4)[:3].mean()) == 1.0
@@ -0,0 +1,52 @@
+#Overload answers 429 (user-004): CPU worker pool, forward pool and micro-batch queues.
+
+import pytest
+
+from inference.workers import PoolFullError
+
+
+def _predict(client, image_bytes, **params):
+    return client.post("/predict", params=params, files={"file": ("cell.png", image_bytes, "image/png")})
+
+
+@pytest.fixture
+def fill(monkeypatch):
+    """Deja un InferencePool sin sitio (como si capacity trabajos estuvieran en curso)."""
+    def fill(pool):
+        monkeypatch.setattr(pool, "_in_flight", pool.capacity)
+    return fill
+
+
+def test_full_worker_pool(api, client, image_bytes, fill):
+    fill(api.get_pool())
+    response = _predict(client, image_bytes, detail="label")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+    # Streaming endpoints refuse before they start
+    batch = client.post("/predict/batch", files=[("files", ("cell.png", image_bytes, "image/png"))])
+    assert batch.status_code == 429
+
+
+def test_full_forward_pool(api, client, image_bytes, fill):
+    fill(api.get_forward_pool())
+    # TTA runs in the forward pool; a plain label request does not need it
+    assert _predict(client, image_bytes, detail="label", tta="on").status_code == 429
+    assert _predict(client, image_bytes, detail="label").status_code == 200
+    assert client.post("/embed", files={"file": ("cell.png", image_bytes, "image/png")}).status_code == 429
+
+
+@pytest.mark.parametrize("detail, batcher", [("label", "get_label_batcher"), ("cam", "get_batcher")])
+def test_full_batch_queue(api, client, image_bytes, monkeypatch, detail, batcher):
+    async def full(tensor):
+        raise PoolFullError("Batch queue is full")
+
+    monkeypatch.setattr(getattr(api, batcher)(), "submit", full)
+    assert _predict(client, image_bytes, detail=detail).status_code == 429
+
+
+def test_pools_recover(api, client, image_bytes):
+    # Nothing leaks from the rejected requests above
+    assert api.get_pool().snapshot()["in_flight"] == 0
+    assert api.get_forward_pool().snapshot()["in_flight"] == 0
+    assert _predict(client, image_bytes, detail="cam").status_code == 200
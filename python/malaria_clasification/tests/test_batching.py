@@ -0,0 +1,70 @@
+#BatchScheduler (inference/batching.py) with a stub run_batch: no model involved.
+
+import asyncio
+
+import pytest
+import torch
+
+from inference.arena import TensorArena
+from inference.batching import BatchScheduler
+from inference.workers import PoolFullError
+
+
+def _row(value):
+    return torch.full((1, 3, 4, 4), float(value))
+
+
+def _submit_all(scheduler, values):
+    async def run():
+        return await asyncio.gather(*[scheduler.submit(_row(v)) for v in values], return_exceptions=True)
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_a_batch():
+    sizes = []
+
+    def run_batch(batch):
+        sizes.append(batch.shape[0])
+        return batch.mean(dim=(1, 2, 3))
+
+    scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=20)
+    results = _submit_all(scheduler, range(5))
+
+    # Every request gets its own row back, in its own order
+    assert [float(r) for r in results] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert sizes == [4, 1]
+    assert scheduler.stats["flush_full"] == 1
+    assert scheduler.stats["flush_timeout"] == 1
+    assert scheduler.stats["batch_size_counts"] == {4: 1, 1: 1}
+
+
+def test_full_queue_is_rejected():
+    scheduler = BatchScheduler(lambda batch: list(range(batch.shape[0])), max_batch_size=8, max_wait_ms=1, max_queue=2)
+    results = _submit_all(scheduler, range(3))
+
+    assert results[:2] == [0, 1]
+    assert isinstance(results[2], PoolFullError)
+    assert scheduler.snapshot()["rejected"] == 1
+
+
+def test_errors_reach_every_request_of_the_batch():
+    def run_batch(batch):
+        raise ValueError("boom")
+
+    scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=1)
+    results = _submit_all(scheduler, range(3))
+
+    assert all(isinstance(r, ValueError) for r in results)
+    assert scheduler.stats["errors"] == 1
+
+
+def test_batches_are_stacked_in_the_arena():
+    arena = TensorArena(buckets=(2, 4), item_shape=(3, 4, 4))
+    scheduler = BatchScheduler(lambda batch: batch.sum(dim=(1, 2, 3)).tolist(), max_batch_size=4, max_wait_ms=1,
+                               arena=arena)
+
+    for _ in range(2):
+        assert _submit_all(scheduler, (1, 2, 3)) == pytest.approx([48.0, 96.0, 144.0])
+    # The second batch reuses the buffer the first one gave back
+    assert arena.snapshot()["misses"] == 1
+    assert arena.snapshot()["hits"] == 1
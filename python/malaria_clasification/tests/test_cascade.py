@@ -0,0 +1,59 @@
+#Confidence-gated cascade (inference/cascade.py) with stub screen / full models.
+
+import torch
+
+from inference.cascade import Cascade
+
+
+def _batch(values, size=224):
+    return torch.stack([torch.full((3, size, size), float(v)) for v in values])
+
+
+def _screen(batch):
+    # Confident on even images, unsure on odd ones
+    value = batch[:, 0, 0, 0]
+    confident = (value % 2 == 0).float()
+    return torch.stack([10 * confident + 0.1, torch.zeros_like(value)], dim=1)
+
+
+class _Full:
+
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, batch):
+        self.seen.append(batch[:, 0, 0, 0].tolist())
+        return torch.tensor([[0.0, 5.0]]).repeat(batch.shape[0], 1)
+
+
+def test_only_unsure_images_are_escalated():
+    screen_inputs = []
+
+    def screen(batch):
+        screen_inputs.append(tuple(batch.shape))
+        return _screen(batch)
+
+    full = _Full()
+    cascade = Cascade(screen, full, screen_size=112, threshold=0.9)
+    logits, escalated = cascade(_batch([0, 1, 2, 3]))
+
+    assert screen_inputs == [(4, 3, 112, 112)]
+    assert escalated.tolist() == [False, True, False, True]
+    assert full.seen == [[1.0, 3.0]]
+    assert logits.argmax(dim=1).tolist() == [0, 1, 0, 1]
+    assert cascade.snapshot()["escalation_rate"] == 0.5
+
+
+def test_full_model_is_skipped_when_the_screen_is_sure():
+    full = _Full()
+    cascade = Cascade(_screen, full)
+    _, escalated = cascade(_batch([0, 2]))
+
+    assert not escalated.any()
+    assert full.seen == []
+
+
+def test_downsample_to_a_non_divisor_size():
+    cascade = Cascade(_screen, _Full(), screen_size=96)
+    assert tuple(cascade.downsample(_batch([1], size=224)).shape) == (1, 3, 96, 96)
+    assert tuple(cascade.downsample(_batch([1], size=96)).shape) == (1, 3, 96, 96)
@@ -0,0 +1,68 @@
+#/predict response tiers (user-022): each tier returns, and computes, only what it needs.
+
+import time
+
+import pytest
+
+TIER_KEYS = {
+    "label": {"prediction", "confidence", "class_id"},
+    "probs": {"probabilities"},
+    "cam": {"cam"},
+    "images": {"original_image", "heatmap", "overlay", "explanation"},
+    "pdf": {"report_id", "report_url"},
+}
+TIERS = list(TIER_KEYS)
+
+
+def _predict(client, image_bytes, **params):
+    response = client.post("/predict", params=params, files={"file": ("cell.png", image_bytes, "image/png")})
+    assert response.status_code == 200, response.text
+    return response.json()["result"]
+
+
+@pytest.mark.parametrize("detail", TIERS)
+def test_each_tier_adds_its_own_fields(client, image_bytes, detail):
+    result = _predict(client, image_bytes, detail=detail)
+
+    level = TIERS.index(detail)
+    for tier, keys in TIER_KEYS.items():
+        present = keys & result.keys()
+        assert present == (keys if TIERS.index(tier) <= level else set()), tier
+    assert result["detail"] == detail
+
+
+def test_label_tiers_skip_grad_cam(api, client, image_bytes):
+    gradcam_items = api.get_batcher().stats["items"]
+    label_items = api.get_label_batcher().stats["items"]
+
+    _predict(client, image_bytes, detail="probs")
+
+    assert api.get_batcher().stats["items"] == gradcam_items
+    assert api.get_label_batcher().stats["items"] == label_items + 1
+
+
+def test_cam_shape_and_inline_images(client, image_bytes):
+    result = _predict(client, image_bytes, detail="images")
+    assert len(result["cam"]) == 7 and all(len(row) == 7 for row in result["cam"])
+    assert result["overlay"].startswith("data:image/png;base64,")
+
+    assert not {"overlay", "heatmap"} & _predict(client, image_bytes, detail="images", images="none").keys()
+    assert "report_id" not in _predict(client, image_bytes, detail="pdf", report="false")
+
+
+def test_pdf_tier_report_can_be_downloaded(client, image_bytes):
+    report_id = _predict(client, image_bytes, detail="pdf")["report_id"]
+
+    deadline = time.monotonic() + 60
+    while client.get(f"/reports/{report_id}").json()["status"] in ("pending", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+    response = client.get(f"/reports/{report_id}/download")
+    assert response.status_code == 200
+    assert response.content.startswith(b"%PDF")
+
+
+def test_unknown_tier(client, image_bytes):
+    response = client.post("/predict", params={"detail": "everything"}, files={"file": ("cell.png", image_bytes, "image/png")})
+    assert response.status_code == 400
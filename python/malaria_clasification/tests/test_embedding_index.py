@@ -0,0 +1,73 @@
+#EmbeddingIndex (similarity/embedding_index.py): blockwise top-k, exact search and IVF.
+
+import numpy as np
+import pytest
+
+from similarity import embedding_index
+from similarity.embedding_index import EmbeddingIndex, normalize, top_k
+
+DIM = 16
+
+
+def _vectors(count, seed=0):
+    return normalize(np.random.default_rng(seed).standard_normal((count, DIM)), DIM)
+
+
+@pytest.mark.parametrize("dtype", [np.float16, np.float32])
+def test_top_k_matches_brute_force(monkeypatch, dtype):
+    # Small blocks so the running top-k is merged across many of them
+    monkeypatch.setattr(embedding_index, "_BLOCK", 64)
+    matrix = _vectors(1000).astype(dtype)
+    queries = _vectors(3, seed=1)
+
+    rows, scores = top_k(matrix, queries, 10)
+
+    expected = queries @ matrix.astype(np.float32).T
+    assert np.array_equal(rows, np.argsort(-expected, axis=1)[:, :10])
+    assert np.allclose(scores, np.take_along_axis(expected, rows, axis=1))
+
+
+def test_top_k_with_fewer_rows_than_k():
+    rows, scores = top_k(_vectors(3), _vectors(1, seed=1), 10)
+    assert rows.shape == scores.shape == (1, 3)
+    assert list(scores[0]) == sorted(scores[0], reverse=True)
+
+
+def test_add_get_and_exact_search(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), dim=DIM)
+    vectors = _vectors(200)
+    ids = index.add(vectors, filenames=[f"cell{i}.png" for i in range(200)], predictions=["Infectado"] * 200)
+
+    assert ids == list(range(200)) and len(index) == 200
+    assert index.get(5)["filename"] == "cell5.png"
+    assert index.get(500) is None
+    assert np.allclose(index.vector(5), vectors[5], atol=1e-3)
+
+    found = index.search(vectors[[5, 7]], k=3)
+    assert [hits[0]["id"] for hits in found] == [5, 7]
+    assert found[0][0]["score"] == pytest.approx(1.0, abs=1e-3)
+    assert len(found[0]) == 3
+
+
+def test_ivf_search(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), dim=DIM, nprobe=2)
+    # 8 well separated clusters
+    centers = _vectors(8, seed=2)
+    noise = np.random.default_rng(3).standard_normal((400, DIM)) * 0.05
+    vectors = normalize(np.repeat(centers, 50, axis=0) + noise, DIM)
+    index.add(vectors)
+
+    with pytest.raises(ValueError):
+        index.train_ivf(lists=1000)
+    assert index.train_ivf(lists=8)["rows"] == 400
+
+    queries = vectors[::50]
+    exact = index.search(queries, k=5, exact=True)
+    # Scanning every list gives the exact answer; 2 of 8 lists still find the nearest neighbour
+    assert index.search(queries, k=5, nprobe=8) == exact
+    assert [hits[0]["id"] for hits in index.search(queries, k=5)] == [hits[0]["id"] for hits in exact]
+
+    # Rows added after training are always scanned
+    new = index.add(_vectors(1, seed=4))[0]
+    assert index.search(_vectors(1, seed=4), k=1)[0][0]["id"] == new
+    assert index.snapshot()["ivf_untrained_rows"] == 1
@@ -0,0 +1,79 @@
+#Batched Grad-CAM (gradcam/gradcam_utils.py) against the per-image baseline it replaced.
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from architecture.model_architecture import create_model
+from gradcam.gradcam_utils import predict_with_gradcam, predict_with_gradcam_batch
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return create_model().eval()
+
+
+def _baseline(model, image, target_class=None):
+    # The original generate_gradcam: one forward + backward per image, hooks on layer4
+    saved = {}
+    layer = model.layer4[-1]
+
+    def forward_hook(module, input, output):
+        saved["activations"] = output
+        output.register_hook(lambda grad: saved.update(gradients=grad))
+
+    handle = layer.register_forward_hook(forward_hook)
+    try:
+        model.zero_grad()
+        output = model(image)
+        if target_class is None:
+            target_class = output.argmax(dim=1).item()
+        output[0, target_class].backward()
+    finally:
+        handle.remove()
+
+    weights = saved["gradients"].mean(dim=(2, 3))[0]
+    cam = F.relu((weights[:, None, None] * saved["activations"][0]).sum(dim=0)).detach()
+    cam = cam - cam.min()
+    if cam.max() > 0:
+        cam = cam / cam.max()
+    return output.detach(), cam.numpy()
+
+
+def test_batch_matches_one_image_at_a_time(model):
+    torch.manual_seed(1)
+    batch = torch.randn(4, 3, 112, 112)
+
+    outputs, cams = predict_with_gradcam_batch(model, batch)
+
+    assert cams.shape == (4, 4, 4)
+    for i in range(4):
+        output, cam = _baseline(model, batch[i:i + 1])
+        assert torch.allclose(outputs[i], output[0], atol=1e-4)
+        np.testing.assert_allclose(cams[i], cam, atol=1e-4)
+
+
+def test_target_classes(model):
+    torch.manual_seed(2)
+    batch = torch.randn(2, 3, 112, 112)
+
+    _, cams = predict_with_gradcam_batch(model, batch, target_classes=[1, 0])
+
+    np.testing.assert_allclose(cams[0], _baseline(model, batch[:1], 1)[1], atol=1e-4)
+    np.testing.assert_allclose(cams[1], _baseline(model, batch[1:], 0)[1], atol=1e-4)
+
+
+def test_single_image_wrapper(model):
+    torch.manual_seed(3)
+    image = torch.randn(1, 3, 112, 112)
+
+    model.zero_grad(set_to_none=True)
+    output, cam = predict_with_gradcam(model, image)
+    # The backward stops at the activations: no gradients for the weights
+    assert all(p.grad is None for p in model.parameters())
+
+    baseline_output, baseline_cam = _baseline(model, image)
+    assert torch.allclose(output, baseline_output, atol=1e-4)
+    np.testing.assert_allclose(cam, baseline_cam, atol=1e-4)
@@ -0,0 +1,61 @@
+#processing/preprocess.py against the training transformation (torchvision Compose).
+
+import glob
+import os
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image, ImageFilter
+from torchvision import transforms
+
+from processing.preprocess import MEAN, STD, decode_image, preprocess_batch, preprocess_image
+
+TEST_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, "test_images")
+
+compose = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(MEAN, STD),
+])
+
+# One uint8 gray level, after the normalization
+LEVEL = 1 / (255 * min(STD))
+
+
+def _smooth(shape, seed=0):
+    noise = (np.random.default_rng(seed).random(shape) * 255).astype(np.uint8)
+    return np.asarray(Image.fromarray(noise).filter(ImageFilter.GaussianBlur(3)))
+
+
+def test_same_size_is_exact():
+    array = _smooth((224, 224, 3))
+    assert torch.allclose(preprocess_image(array)[0], compose(Image.fromarray(array)), atol=1e-5)
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(TEST_IMAGES, "*.png"))))
+def test_cells_match_compose(path):
+    # The cells are smaller than 224: OpenCV and PIL bilinear upscaling differ by rounding only
+    with open(path, "rb") as f:
+        array = decode_image(f.read())
+    diff = (preprocess_image(array)[0] - compose(Image.fromarray(array))).abs()
+    assert diff.max() <= LEVEL * 1.01
+    assert diff.mean() < 0.01
+
+
+def test_downscale_matches_compose():
+    array = _smooth((600, 500, 3))
+    diff = (preprocess_image(array)[0] - compose(Image.fromarray(array))).abs()
+    assert diff.max() <= 2 * LEVEL * 1.01
+    assert diff.mean() < 0.01
+
+
+def test_batch_into_a_preallocated_buffer():
+    images = [_smooth((120, 150, 3), seed=1), Image.fromarray(_smooth((224, 224, 3), seed=2))]
+    out = torch.empty(4, 3, 224, 224)
+
+    batch = preprocess_batch(images, out=out)
+
+    assert batch.data_ptr() == out.data_ptr() and batch.shape[0] == 2
+    for row, image in zip(batch, images):
+        assert torch.equal(row, preprocess_image(image)[0])
@@ -0,0 +1,62 @@
+#Lookup-table colormaps (processing/render.py) against the matplotlib code they replaced.
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from processing.image import heatmap_to_image, overlay_heatmap
+from processing.render import COLORMAPS, colormap_lut, overlay, overlay_batch
+
+matplotlib = pytest.importorskip("matplotlib")
+
+
+def _mpl(name, values):
+    return (matplotlib.colormaps[name](values)[..., :3] * 255).astype(np.uint8)
+
+
+def _cam(seed=0):
+    return np.random.default_rng(seed).random((7, 7)).astype(np.float32)
+
+
+def _image(width=140, height=150, seed=0):
+    return (np.random.default_rng(seed).random((height, width, 3)) * 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("name", COLORMAPS)
+def test_tables_are_matplotlib_colors(name):
+    assert np.array_equal(colormap_lut(name)[:, 0], _mpl(name, np.arange(256) / 255.0))
+
+
+def test_overlay_matches_the_matplotlib_overlay():
+    image, cam = Image.fromarray(_image()), _cam()
+    # Old overlay_heatmap: float resize, cm.jet, addWeighted
+    colored = _mpl("jet", cv2.resize(cam, image.size))
+    expected = cv2.addWeighted(np.array(image), 0.6, colored, 0.4, 0)
+
+    # The CAM is quantized before the resize here: a couple of levels of rounding at most
+    diff = np.abs(np.asarray(overlay_heatmap(image, cam)).astype(int) - expected)
+    assert diff.max() <= 2
+    assert diff.mean() < 0.5
+
+
+def test_heatmap_image_matches_the_matplotlib_one():
+    cam = _cam(1)
+    # Old heatmap_to_image: truncate to uint8, PIL nearest resize, cm.hot
+    values = np.array(Image.fromarray((cam * 255).astype(np.uint8)).resize((224, 224), Image.NEAREST))
+    expected = _mpl("hot", values / 255.0)
+
+    # Rounding instead of truncation moves a value by at most one table entry
+    diff = np.abs(np.asarray(heatmap_to_image(cam)).astype(int) - expected)
+    assert diff.max() <= 6
+    assert diff.mean() < 1
+
+
+def test_batch_overlay_is_the_single_overlay():
+    originals = np.stack([_image(seed=i) for i in range(3)])
+    cams = np.stack([_cam(i) for i in range(3)])
+
+    batch = overlay_batch(originals.copy(), cams)
+
+    for original, cam, row in zip(originals, cams, batch):
+        assert np.array_equal(row, overlay(original, cam))
@@ -0,0 +1,125 @@
+#Background PDF reports (user-012): ReportJobQueue status, its bound, and the job rows the server workers share.
+
+import threading
+import time
+
+import pytest
+
+from pdf.report_jobs import DONE, ERROR, PENDING, RUNNING, ReportJobQueue, ReportQueueFullError
+from pdf.report_store import ReportStore
+
+
+class _Gate:
+    """render() que espera a release(); devuelve la ruta, None o lanza según el argumento."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self, result, report_id=None):
+        self.started.set()
+        self._release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def release(self):
+        self._release.set()
+
+
+def _wait(queue, report_id, status):
+    deadline = time.monotonic() + 5
+    while queue.get(report_id)["status"] != status:
+        assert time.monotonic() < deadline, queue.get(report_id)
+        time.sleep(0.01)
+
+
+def test_status_transitions(tmp_path):
+    store = ReportStore(str(tmp_path))
+    queue = ReportJobQueue(workers=1, store=store)
+    gate = _Gate()
+
+    first = queue.submit(gate, "/tmp/first.pdf")
+    gate.started.wait(5)
+    failed = queue.submit(gate, None)
+    assert queue.get(first)["status"] == RUNNING
+    assert queue.get(failed)["status"] == PENDING
+    # The rows another server worker would read
+    other = ReportStore(str(tmp_path))
+    assert other.job(first)["status"] == RUNNING
+    assert other.job(failed)["status"] == PENDING
+
+    gate.release()
+    _wait(queue, first, DONE)
+    _wait(queue, failed, ERROR)
+    assert queue.get(first)["path"] == "/tmp/first.pdf"
+    assert queue.get(failed)["error"] == "The PDF could not be generated"
+    assert (other.job(failed)["status"], other.job(failed)["error"]) == (ERROR, "The PDF could not be generated")
+    assert queue.snapshot()["jobs"] == {PENDING: 0, RUNNING: 0, DONE: 1, ERROR: 1}
+
+
+def test_pending_reports_are_bounded():
+    queue = ReportJobQueue(workers=1, max_pending=2)
+    gate = _Gate()
+    queue.submit(gate, "a.pdf")
+    queue.submit(gate, "b.pdf")
+
+    with pytest.raises(ReportQueueFullError):
+        queue.submit(gate, "c.pdf")
+    with pytest.raises(ReportQueueFullError):
+        queue.check()
+    assert queue.snapshot()["rejected"] == 2
+    assert len(queue._jobs) == 2
+
+    gate.release()
+    deadline = time.monotonic() + 5
+    while queue._pending:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    queue.check()
+
+
+def test_finished_jobs_are_forgotten_first():
+    queue = ReportJobQueue(workers=1, max_jobs=2)
+    gate = _Gate()
+    gate.release()
+    ids = [queue.submit(gate, f"{i}.pdf") for i in range(2)]
+    for report_id in ids:
+        _wait(queue, report_id, DONE)
+
+    newest = queue.submit(gate, "2.pdf")
+    assert ids[0] not in queue
+    assert ids[1] in queue and newest in queue
+
+
+def _predict(client, image_bytes, **params):
+    return client.post("/predict", params=params, files={"file": ("cell.png", image_bytes, "image/png")})
+
+
+def test_full_report_queue_answers_429(api, client, image_bytes, monkeypatch):
+    monkeypatch.setattr(api.report_jobs, "_pending", api.report_jobs.max_pending)
+    response = _predict(client, image_bytes, detail="pdf")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+    # Without the PDF nothing is queued
+    assert _predict(client, image_bytes, detail="images").status_code == 200
+
+
+@pytest.mark.parametrize("status, error, code", [(PENDING, None, 202), (RUNNING, None, 202), (ERROR, "boom", 500)])
+def test_jobs_of_other_workers(api, client, status, error, code):
+    # A job row written by another server worker: this one has no local job for it
+    report_id = api.report_store.new_id()
+    api.report_store.mark(report_id, status, error)
+    assert report_id not in api.report_jobs
+
+    assert client.get(f"/reports/{report_id}").json()["status"] == status
+    response = client.get(f"/reports/{report_id}/download")
+    assert response.status_code == code
+    if error:
+        assert "boom" in response.json()["detail"]
+
+
+def test_unknown_report(client):
+    assert client.get("/reports/" + "0" * 32).status_code == 404
+    assert client.get("/reports/" + "0" * 32 + "/download").status_code == 404
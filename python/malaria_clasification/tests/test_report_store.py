@@ -0,0 +1,70 @@
+#ReportStore (pdf/report_store.py): lookups, size / age eviction and the shared job rows.
+
+import os
+
+import pytest
+
+from pdf.report_store import ReportStore
+
+PDF = b"%PDF-1.4 " + b"x" * 1015# 1 KB
+
+
+def test_save_and_get(tmp_path):
+    store = ReportStore(str(tmp_path))
+    report_id, path = store.save(PDF, kind="reporte", filename="cell.png", prediction="Infectado", confidence=97.5)
+
+    report = store.get(report_id)
+    assert report["path"] == path and os.path.exists(path)
+    assert (report["filename"], report["prediction"], report["size"]) == ("cell.png", "Infectado", len(PDF))
+    assert report_id in store
+    assert store.get("../../etc/passwd") is None
+    with pytest.raises(ValueError):
+        store.path("not-an-id")
+
+
+def test_oldest_reports_are_evicted_by_size(tmp_path):
+    store = ReportStore(str(tmp_path), max_mb=2.5 / 1024)
+    saved = [store.save(PDF) for _ in range(4)]
+
+    kept = [report_id for report_id, _ in saved if report_id in store]
+    assert kept == [report_id for report_id, _ in saved[2:]]
+    assert not any(os.path.exists(path) for _, path in saved[:2])
+    assert store.snapshot()["reports"] == 2
+    assert store.evicted == 2
+
+
+def test_old_reports_are_evicted_on_save(tmp_path):
+    store = ReportStore(str(tmp_path), max_age_seconds=3600)
+    old_id, old_path = store.save(PDF)
+    store._connect().execute("UPDATE reports SET created = created - 7200 WHERE id = ?", (old_id,))
+
+    new_id, _ = store.save(PDF)
+    assert old_id not in store and not os.path.exists(old_path)
+    assert new_id in store
+
+
+def test_query_filters(tmp_path):
+    store = ReportStore(str(tmp_path))
+    infected, _ = store.save(PDF, prediction="Infectado")
+    store.save(PDF, prediction="No infectado")
+    batch, _ = store.save(PDF, kind="lote")
+
+    assert [r["id"] for r in store.query(prediction="Infectado")] == [infected]
+    assert [r["id"] for r in store.query(kind="lote")] == [batch]
+    assert len(store.query(limit=2)) == 2
+
+
+def test_job_rows_are_shared_until_the_report_is_saved(tmp_path):
+    store = ReportStore(str(tmp_path))
+    report_id = store.new_id()
+    store.mark(report_id, "pending")
+
+    # Another server worker opens its own connection to the same index
+    other = ReportStore(str(tmp_path))
+    assert other.job(report_id)["status"] == "pending"
+    store.mark(report_id, "error", "boom")
+    assert other.job(report_id)["error"] == "boom"
+
+    store.save(PDF, report_id=report_id)
+    assert other.job(report_id) is None
+    assert report_id in other
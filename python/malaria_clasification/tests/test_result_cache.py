@@ -0,0 +1,78 @@
+#ResultCache (cache/result_cache.py): memory LRU, TTL and the disk tier.
+
+import os
+import time
+
+from cache.result_cache import ResultCache, file_version
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", {"prediction": "a"})
+    cache.put("b", {"prediction": "b"})
+    cache.get("a")
+    cache.put("c", {"prediction": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"prediction": "a"}
+    assert cache.get("c") == {"prediction": "c"}
+    assert cache.evictions == 1
+
+
+def test_size_limit():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("big", {"overlay": "x" * 2000})
+    assert cache.get("big") is None
+
+    cache.put("a", {"overlay": "x" * 600})
+    cache.put("b", {"overlay": "x" * 600})
+    assert cache.get("a") is None
+    assert cache.snapshot()["bytes"] <= 1000
+
+
+def test_entries_expire():
+    cache = ResultCache(ttl_seconds=0.05)
+    cache.put("a", {"prediction": "a"})
+    assert cache.get("a") is not None
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_get_returns_a_copy():
+    cache = ResultCache()
+    cache.put("a", {"prediction": "a"})
+    cache.get("a")["cached"] = True
+    assert cache.get("a") == {"prediction": "a"}
+
+
+def test_key_depends_on_the_model_version():
+    assert ResultCache(model_version="v1").key(b"image", "inline") != ResultCache(model_version="v2").key(b"image", "inline")
+    assert ResultCache().key(b"image", "inline") != ResultCache().key(b"image", "url")
+
+
+def test_disk_tier_is_shared_and_expires(tmp_path):
+    first = ResultCache(disk_dir=str(tmp_path))
+    first.put("ab12", {"prediction": "a"})
+
+    # Another worker (or a restart) with an empty memory tier
+    second = ResultCache(disk_dir=str(tmp_path))
+    assert second.get("ab12") == {"prediction": "a"}
+    assert second.disk_hits == 1
+
+    path = first._disk_path("ab12")
+    old = time.time() - 2 * first.ttl_seconds
+    os.utime(path, (old, old))
+    assert ResultCache(disk_dir=str(tmp_path)).get("ab12") is None
+    assert not os.path.exists(path)
+
+
+def test_file_version(tmp_path):
+    weights = tmp_path / "model.pth"
+    assert file_version(str(weights)) is None
+
+    weights.write_bytes(b"weights")
+    version = file_version(str(weights))
+    assert version == file_version(str(weights))
+
+    os.utime(weights, ns=(0, 10**9))
+    assert file_version(str(weights)) != version
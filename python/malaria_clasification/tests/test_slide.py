@@ -0,0 +1,94 @@
+#Whole-slide mode (user-018): cell detection, tiling, the stitched canvas and /predict/slide.
+
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from processing.slide import HeatmapCanvas, detect_cells, foreground_mask, tile_boxes
+
+CENTERS = [(80, 80), (220, 90), (360, 70), (90, 300), (230, 310), (370, 290)]
+
+
+def _smear():
+    # Pale background, 6 stained cells and one clump far over the default max_area
+    image = np.full((400, 600, 3), (235, 225, 230), np.uint8)
+    for center in CENTERS:
+        cv2.circle(image, center, 40, (200, 120, 150), -1)
+    cv2.circle(image, (510, 200), 85, (200, 120, 150), -1)
+    return image
+
+
+def _png(array):
+    return cv2.imencode(".png", array[:, :, ::-1])[1].tobytes()
+
+
+def test_detect_cells():
+    boxes, oversized = detect_cells(foreground_mask(_smear()), max_area=10000)
+
+    assert len(boxes) == len(CENTERS) and oversized == 1
+    for (x, y, w, h), (cx, cy) in zip(boxes, sorted(CENTERS, key=lambda c: (c[1] - 40, c[0]))):
+        assert w == h and w > 80
+        assert x < cx < x + w and y < cy < y + h
+        assert x >= 0 and y >= 0 and x + w <= 600 and y + h <= 400
+
+
+def test_tile_grid_reaches_the_borders():
+    boxes = list(tile_boxes(500, 300, tile=224))
+
+    assert [(x, y) for x, y, _, _ in boxes] == [(0, 0), (224, 0), (276, 0), (0, 76), (224, 76), (276, 76)]
+    assert all(w == h == 224 for _, _, w, h in boxes)
+    # Overlap adds windows; an empty mask skips them all
+    assert len(list(tile_boxes(500, 300, tile=224, stride=112))) > len(boxes)
+    assert set(tile_boxes(500, 300, tile=224, mask=np.zeros((300, 500), np.uint8))) == {None}
+
+
+def test_canvas_averages_overlaps_and_clamps_the_border():
+    canvas = HeatmapCanvas(2000, 1000, max_side=500)
+    assert canvas.size == (500, 250)
+
+    canvas.add((0, 0, 400, 400), 1.0)
+    canvas.add((200, 0, 400, 400), 0.0)
+    canvas.add((1998, 998, 2, 2), 0.5)
+    heatmap = canvas.heatmap()
+
+    assert heatmap.shape == (250, 500)
+    assert heatmap[10, 10] == 1.0 and heatmap[10, 75] == 0.5 and heatmap[10, 120] == 0.0
+    assert heatmap[249, 499] == 0.5
+    assert heatmap[200, 300] == 0.0
+
+
+def _slide(client, **params):
+    response = client.post("/predict/slide", params=params, files={"file": ("smear.png", _png(_smear()), "image/png")})
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return lines[:-1], lines[-1]["summary"]
+
+
+def test_cells_mode(api, client, monkeypatch):
+    monkeypatch.setattr(api.config, "SLIDE_MAX_CELL_AREA", 10000)
+    cells, summary = _slide(client, mode="cells", gradcam="false", images="none", batch_size=4)
+
+    assert len(cells) == summary["cells"] == len(CENTERS)
+    assert summary["skipped"] == 1 and summary["batches"] == 2
+    assert summary["parasitemia_percent"] == round(summary["infected"] / len(CENTERS) * 100, 2)
+    assert [line["index"] for line in cells] == list(range(len(CENTERS)))
+    assert all(len(line["box"]) == 4 for line in cells)
+
+
+@pytest.mark.parametrize("images", ["inline", "url"])
+def test_tiles_mode(client, images):
+    tiles, summary = _slide(client, mode="tiles", tile_size=128, images=images)
+
+    assert len(tiles) == summary["tiles"] > 0
+    assert summary["tiles"] + summary["skipped"] == len(list(tile_boxes(600, 400, tile=128)))
+    assert summary["parasitemia_percent"] is None and summary["positive_tiles_percent"] is not None
+    assert set(summary["heatmap"]) >= {"overlay"}
+    if images == "url":
+        assert client.get(summary["heatmap"]["overlay"]).status_code == 200
+
+
+def test_bad_mode(client):
+    response = client.post("/predict/slide", params={"mode": "pixels"}, files={"file": ("smear.png", _png(_smear()), "image/png")})
+    assert response.status_code == 400
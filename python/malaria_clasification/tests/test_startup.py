@@ -0,0 +1,19 @@
+#Startup and /ready (inference/main.py) with MALARIA_WARMUP=0, as set in conftest.py.
+
+import time
+
+from fastapi.testclient import TestClient
+
+
+def test_ready_without_warm_up(api):
+    # The lifespan still loads the model in the background, with no request needed
+    with TestClient(api.app) as client:
+        deadline = time.monotonic() + 60
+        response = client.get("/ready")
+        while response.status_code == 503 and response.json()["status"] == "loading" and time.monotonic() < deadline:
+            time.sleep(0.1)
+            response = client.get("/ready")
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["model_load_s"] is not None
+    assert response.json()["warmup_s"] is None
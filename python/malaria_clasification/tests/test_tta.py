@@ -0,0 +1,65 @@
+#Test-time augmentation (inference/tta.py): views, aggregation and the reuse of the original logits.
+
+import pytest
+import torch
+
+from inference.tta import VIEWS, aggregate, augment, needs_tta, run_tta
+
+
+def _forward(batch):
+    # Depends on the orientation: the first row and the first column of channel 0
+    return torch.stack([batch[:, 0, 0, :].sum(dim=1), batch[:, 0, :, 0].sum(dim=1)], dim=1)
+
+
+def test_augment_views():
+    batch = torch.arange(2 * 3 * 4 * 4, dtype=torch.float32).reshape(2, 3, 4, 4)
+    views = augment(batch)
+
+    assert tuple(views.shape) == (VIEWS * 2, 3, 4, 4)
+    assert torch.equal(views[:2], batch)
+    assert torch.equal(augment(batch, include_identity=False), views[2:])
+    # 8 different orientations of the same pixels
+    assert len({tuple(view.flatten().tolist()) for view in views[::2]}) == VIEWS
+
+
+def test_aggregate_of_identical_views():
+    logits = torch.tensor([[2.0, -1.0], [-3.0, 0.5]]).repeat(VIEWS, 1)
+    mean, stats = aggregate(logits)
+
+    assert torch.allclose(mean, torch.log_softmax(logits[:2], dim=1), atol=1e-6)
+    assert stats == [{"views": VIEWS, "agreement": 1.0, "uncertainty": 0.0}] * 2
+
+
+def test_aggregate_of_split_views():
+    # Half the views say class 0 with certainty, the other half class 1
+    logits = torch.tensor([[50.0, -50.0]] * 4 + [[-50.0, 50.0]] * 4)
+    mean, stats = aggregate(logits)
+
+    assert torch.allclose(mean.exp(), torch.tensor([[0.5, 0.5]]))
+    assert stats[0]["agreement"] == 0.5
+    assert stats[0]["uncertainty"] == pytest.approx(1.0)
+
+
+def test_run_tta_reuses_the_original_logits():
+    batch = torch.randn(3, 3, 8, 8)
+    calls = []
+
+    def forward(views):
+        calls.append(views.shape[0])
+        return _forward(views)
+
+    full, full_stats = run_tta(forward, batch)
+    reused, reused_stats = run_tta(forward, batch, _forward(batch))
+
+    assert calls == [VIEWS * 3, (VIEWS - 1) * 3]
+    assert torch.allclose(full, reused, atol=1e-5)
+    assert full_stats == reused_stats
+
+
+def test_needs_tta():
+    confident = torch.tensor([[5.0, -5.0]])
+    unsure = torch.tensor([[0.1, 0.0]])
+
+    assert not needs_tta(confident, 0.9)
+    assert needs_tta(unsure[0], 0.9)
+    assert needs_tta(torch.cat([confident, unsure]), 0.9)
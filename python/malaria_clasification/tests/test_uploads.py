@@ -0,0 +1,61 @@
+#Upload limits (user-020): every path answers 413 for a file or an image over the limits.
+
+import io
+import json
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from inference import config
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _predict(client, data, **params):
+    return client.post("/predict", params=params, files={"file": ("cell.png", data, "image/png")})
+
+
+def test_file_over_the_upload_limit(client, monkeypatch, image_bytes):
+    monkeypatch.setattr(config, "MAX_UPLOAD_MB", len(image_bytes) / 2 / 2**20)
+    assert _predict(client, image_bytes, detail="label").status_code == 413
+
+
+@pytest.mark.parametrize("detail", ["label", "cam"])
+def test_image_over_the_pixel_limit(client, monkeypatch, detail):
+    # A few KB of PNG, 9 MP once decoded: refused from the header
+    monkeypatch.setattr(config, "MAX_IMAGE_PIXELS", 1_000_000)
+    response = _predict(client, _png(3000, 3000), detail=detail)
+    assert response.status_code == 413
+    assert "limit" in response.json()["detail"]
+
+
+def test_in_process_path_answers_413(api, monkeypatch):
+    monkeypatch.setattr(config, "MAX_IMAGE_PIXELS", 1_000_000)
+    with pytest.raises(HTTPException) as error:
+        api.process_prediction_internal(_png(3000, 3000))
+    assert error.value.status_code == 413
+
+
+def test_batch_lines_carry_the_status(client, monkeypatch, image_bytes):
+    monkeypatch.setattr(config, "MAX_IMAGE_PIXELS", 1_000_000)
+    response = client.post("/predict/batch", files=[
+        ("files", ("big.png", _png(3000, 3000), "image/png")),
+        ("files", ("bad.png", b"not an image", "image/png")),
+        ("files", ("cell.png", image_bytes, "image/png")),
+    ])
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    errors = {line["filename"]: line["status"] for line in lines if "error" in line}
+
+    assert errors == {"big.png": 413, "bad.png": 400}
+    assert lines[-1]["summary"]["errors"] == 2
+
+
+def test_undecodable_image_message(client):
+    response = _predict(client, b"not an image", detail="label")
+    assert response.status_code == 400
+    assert response.json()["detail"].count("cannot identify image file") == 1